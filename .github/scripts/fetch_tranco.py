@@ -1,19 +1,32 @@
-import requests
-import re
+import os
+import sys
+import tempfile
 
-def fetch_latest_tranco():
-    page = requests.get("https://tranco-list.eu/recent").text
-    match = re.search(r'/list/([A-Z0-9]{5})', page)
-    if not match:
-        raise Exception("Could not extract list ID")
-    list_id = match.group(1)
-    url = f"https://tranco-list.eu/download/{list_id}/1000000"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from tranco_delta import TrancoDeltaStore, read_ranked_domains, TRANCO_DELTA_DIR
+from tranco_download import download_tranco_list, latest_list_id, tranco_download_url
+
+
+def fetch_latest_tranco(directory=TRANCO_DELTA_DIR):
+    # Stores the newest list as a delta against the last one (or as a new
+    # base), so the commit is a small binary file instead of a full CSV
+    list_id = latest_list_id("https://tranco-list.eu/recent")
+    store = TrancoDeltaStore(directory)
+    latest = store.latest()
+    if latest and latest["list_id"] == list_id:
+        print(f"✅ List {list_id} is already stored")
+        return
+
+    url = tranco_download_url(list_id, 1000000)
     print(f"Downloading: {url}")
-    r = requests.get(url)
-    r.raise_for_status()
-    with open("top-1m.csv", "wb") as f:
-        f.write(r.content)
-    print(f"✅ Saved top-1m.csv (List ID: {list_id})")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "top-1m.csv")
+        rows = download_tranco_list(url, csv_path, expected_rows=1000000)
+        domains = read_ranked_domains(csv_path)
+    kind = store.add(list_id, domains)
+    entry = store.latest()
+    print(f"✅ Saved {entry['file']} ({kind}, List ID: {list_id}, {rows:,} rows, {entry['bytes'] / 1e6:.1f} MB)")
 
 if __name__ == "__main__":
     fetch_latest_tranco()
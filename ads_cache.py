@@ -0,0 +1,128 @@
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+# --- CONFIGURATION ---
+ADS_CACHE_FILE = "/tmp/ads_txt_cache.sqlite"
+ADS_CACHE_TTL = 6 * 60 * 60  # seconds before a cached file must be revalidated
+ERROR_CACHE_TTL = 10 * 60  # other statuses (5xx, 429, 403...) may be gone on the next try
+STABLE_STATUSES = {200, 404, 410}  # answers kept for the full TTL
+ADS_CACHE_MAX_BYTES = 256 * 1024 * 1024  # compressed bodies, least recently used evicted first
+EVICT_EVERY_PUTS = 64
+
+CachedAdsTxt = namedtuple("CachedAdsTxt", "domain status body etag last_modified fetched_at")
+
+
+class AdsTxtCache:
+    # One SQLite file shared by every scan (and every Streamlit process).
+    # Bodies are zlib-compressed; `last_access` drives LRU eviction.
+    def __init__(self, path=ADS_CACHE_FILE, ttl=ADS_CACHE_TTL, max_bytes=ADS_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ads_txt (
+                domain TEXT PRIMARY KEY,
+                status INTEGER,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL,
+                last_access REAL,
+                size INTEGER
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ads_txt_last_access ON ads_txt (last_access)")
+
+    def get(self, domain):
+        domain = domain.lower()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, body, etag, last_modified, fetched_at FROM ads_txt WHERE domain = ?",
+                (domain,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE ads_txt SET last_access = ? WHERE domain = ?", (time.time(), domain))
+        status, body, etag, last_modified, fetched_at = row
+        return CachedAdsTxt(domain, status, zlib.decompress(body).decode("utf-8"), etag, last_modified, fetched_at)
+
+    def is_fresh(self, entry):
+        # A file or a definite "no ads.txt" lasts the full TTL; an error response only briefly
+        if entry is None:
+            return False
+        ttl = self.ttl if entry.status in STABLE_STATUSES else min(self.ttl, ERROR_CACHE_TTL)
+        return (time.time() - entry.fetched_at) < ttl
+
+    def put(self, domain, status, body, etag=None, last_modified=None):
+        domain = domain.lower()
+        blob = zlib.compress(body.encode("utf-8"), 6)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ads_txt VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (domain, status, blob, etag, last_modified, now, now, len(blob))
+            )
+            self._puts_since_evict += 1
+            due = self._puts_since_evict >= EVICT_EVERY_PUTS
+        if due:
+            self.evict()
+
+    def mark_revalidated(self, domain):
+        # A 304 only refreshes the timestamps; the stored body is still valid
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ads_txt SET fetched_at = ?, last_access = ? WHERE domain = ?",
+                (now, now, domain.lower())
+            )
+
+    def evict(self):
+        with self._lock:
+            self._puts_since_evict = 0
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ads_txt").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            # Walk from least recently used until enough bytes are freed
+            excess = total - self.max_bytes
+            freed = 0
+            victims = []
+            for domain, size in self._conn.execute("SELECT domain, size FROM ads_txt ORDER BY last_access"):
+                victims.append((domain,))
+                freed += size
+                if freed >= excess:
+                    break
+            self._conn.executemany("DELETE FROM ads_txt WHERE domain = ?", victims)
+            return len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM ads_txt")
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ads_txt").fetchone()
+        return {"entries": count, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def conditional_headers(entry):
+    # Only a stored file is revalidated; a 304 must never extend an error response
+    headers = {}
+    if entry is None or entry.status != 200:
+        return headers
+    if entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
@@ -0,0 +1,97 @@
+import hashlib
+from collections import namedtuple
+
+# --- IAB ads.txt MODEL ---
+# Each data record is "<ad system domain>, <account id>, <DIRECT|RESELLER>[, <cert authority id>][;<extension>]".
+# Lines of the form "<variable>=<value>" (subdomain=, contact=, ownerdomain=, ...)
+# are kept separately. Everything after "#" is a comment.
+AdsTxtRecord = namedtuple("AdsTxtRecord", "ad_system account_id relationship cert_authority")
+
+DIRECT = "DIRECT"
+RESELLER = "RESELLER"
+KNOWN_VARIABLES = {"contact", "subdomain", "inventorypartnerdomain", "ownerdomain", "managerdomain"}
+
+
+class AdsTxt:
+    # Parsed once per file. `records` maps ad system domain -> list of records,
+    # and `_direct` keeps the DIRECT account IDs per ad system so every rule is
+    # a dict/set lookup rather than another pass over the lines. `digest` is
+    # the content hash of the text it was parsed from.
+    __slots__ = ("records", "variables", "digest", "_direct")
+
+    def __init__(self):
+        self.records = {}
+        self.variables = {}
+        self.digest = None
+        self._direct = {}
+
+    def add(self, record):
+        self.records.setdefault(record.ad_system, []).append(record)
+        if record.relationship == DIRECT:
+            self._direct.setdefault(record.ad_system, set()).add(record.account_id)
+
+    def direct_accounts(self, ad_system):
+        return self._direct.get(ad_system.lower(), frozenset())
+
+    def has_direct(self, ad_system, account_id=None):
+        accounts = self.direct_accounts(ad_system)
+        if account_id is None:
+            return bool(accounts)
+        return account_id in accounts
+
+    def has_other_direct(self, ad_system, account_id):
+        # DIRECT line for the ad system under any account other than `account_id`
+        accounts = self.direct_accounts(ad_system)
+        return len(accounts) > (1 if account_id in accounts else 0)
+
+    @property
+    def subdomains(self):
+        return self.variables.get("subdomain", [])
+
+    def __len__(self):
+        return sum(len(records) for records in self.records.values())
+
+
+def content_hash(text):
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+def parse_ads_txt(text):
+    parsed = AdsTxt()
+    parsed.digest = content_hash(text)
+    if not text:
+        return parsed
+    if text.startswith("\ufeff"):
+        text = text[1:]
+
+    for raw_line in text.splitlines():
+        line = raw_line.split("#", 1)[0].strip()
+        if not line:
+            continue
+
+        data = line.split(";", 1)[0]
+        name, sep, value = data.partition("=")
+        if sep and "," not in name:
+            name = name.strip().lower()
+            if name in KNOWN_VARIABLES:
+                parsed.variables.setdefault(name, []).append(value.strip().lower() if name == "subdomain" else value.strip())
+            continue
+
+        fields = [field.strip() for field in data.split(",")]
+        if len(fields) < 3 or not fields[0] or not fields[1]:
+            continue
+        relationship = fields[2].upper()
+        if relationship not in (DIRECT, RESELLER):
+            continue
+        parsed.add(AdsTxtRecord(
+            fields[0].lower(),
+            fields[1],
+            relationship,
+            fields[3] if len(fields) > 3 and fields[3] else None
+        ))
+    return parsed
+
+
+def direct_line_ad_system(sample_direct_line):
+    # "connatix.com, 12345, DIRECT" -> "connatix.com"
+    return sample_direct_line.split(",")[0].strip().lower()
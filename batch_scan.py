@@ -0,0 +1,308 @@
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+import pandas as pd
+
+from ads_cache import AdsTxtCache, ADS_CACHE_FILE
+from dns_resolver import shared_resolver
+from domain_health import DomainHealth, DOMAIN_HEALTH_FILE
+from email_outbox import Outbox, deliver, report_message, smtp_settings, OUTBOX_FILE
+from domain_sources import read_publishers, publisher_domains
+from multi_scan import scan_publishers
+from pipeline import build_pipeline
+from run_history import RunHistory, RunRecorder, RUN_HISTORY_FILE
+from ads_txt import direct_line_ad_system
+from scanner import scan_domains, results_frame, skipped_frame, MAX_CONCURRENT_FETCHES, MAX_FETCHES_PER_HOST
+from telemetry import ScanTelemetry
+from tranco_history import TrancoHistory, with_rank_trends, TRANCO_HISTORY_DIR
+from tranco_index import TrancoIndex, ensure_tranco_index
+
+# --- CONFIGURATION ---
+TRANCO_TOP_DOMAINS_FILE = "/tmp/top-1m.csv"
+TRANCO_THRESHOLD = 210000
+DEFAULT_PROCESSES = max(1, min(4, os.cpu_count() or 1))
+
+
+# --- PUBLISHERS ---
+def publisher_slug(publisher):
+    label = publisher["name"] or publisher["domain"] or "manual"
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", f"{label}_{publisher['pub_id']}").strip("_")
+
+
+# --- WORKER PROCESS ---
+_worker = {}
+
+
+def _init_worker(tranco_index_path, threshold, use_cache, scan_options, record_telemetry=False, use_health=True,
+                 reprobe=False, use_history=True, refresh=False, use_trends=True, use_dns=True, dns_server=None):
+    _worker["tranco"] = TrancoIndex(tranco_index_path).view(threshold) if tranco_index_path else {}
+    _worker["dns"] = shared_resolver(dns_server) if use_dns else None
+    _worker["trends"] = TrancoHistory(TRANCO_HISTORY_DIR) if use_trends else None
+    _worker["cache"] = AdsTxtCache(ADS_CACHE_FILE) if use_cache else None
+    _worker["health"] = DomainHealth(DOMAIN_HEALTH_FILE) if use_health else None
+    _worker["reprobe"] = reprobe
+    _worker["history"] = RunHistory(RUN_HISTORY_FILE) if use_history else None
+    _worker["refresh"] = refresh
+    _worker["scan_options"] = scan_options
+    _worker["record_telemetry"] = record_telemetry
+
+
+def scan_publisher(publisher, out_dir, fmt):
+    started = time.time()
+    slug = publisher_slug(publisher)
+    summary = {"publisher": slug, "pub_id": publisher["pub_id"], "domains": 0,
+               "opportunities": 0, "skipped": 0, "new": "", "lost": "", "reused": 0, "changed": 0,
+               "error": ""}
+    telemetry = ScanTelemetry() if _worker["record_telemetry"] else None
+    pipeline = new_pipeline()
+    try:
+        domains = publisher_domains(publisher, telemetry)
+        run = None
+        if _worker["history"] is not None:
+            run = RunRecorder(
+                _worker["history"], publisher["name"] or publisher["domain"], publisher["pub_id"],
+                direct_line_ad_system(publisher["sample_direct_line"]), refresh=_worker["refresh"]
+            )
+        results, skipped_log = scan_domains(
+            domains, publisher["pub_id"], publisher["sample_direct_line"], _worker["tranco"], pipeline=pipeline,
+            run=run, cache=_worker["cache"], health=_worker["health"], telemetry=telemetry, **_worker["scan_options"]
+        )
+        write_publisher_tables(slug, results, skipped_log, out_dir, fmt)
+        if run is not None:
+            diff = run.finish(results, len(domains))
+            summary.update(reused=run.reused, changed=run.changed)
+            if diff is not None:
+                write_changes(slug, diff, out_dir, fmt)
+                summary.update(new=len(diff.new), lost=len(diff.lost))
+        if telemetry is not None:
+            write_telemetry(telemetry, os.path.join(out_dir, f"{slug}_telemetry"))
+        summary.update(domains=len(domains), opportunities=len(results), skipped=len(skipped_log))
+        summary.update(stage_counts(pipeline))
+    except Exception as e:
+        summary["error"] = str(e)
+    summary["seconds"] = round(time.time() - started, 1)
+    return summary
+
+
+def new_pipeline():
+    return build_pipeline(_worker["tranco"], health=_worker["health"], reprobe_unreachable=_worker["reprobe"],
+                          dns_resolver=_worker["dns"])
+
+
+def stage_counts(pipeline):
+    # Summary columns: how many domains each pipeline stage removed
+    return {f"removed_{name}": pipeline.removed[name] for name in pipeline.stage_names}
+
+
+def scan_publishers_deduplicated(publishers, out_dir, fmt, tranco_index_path, threshold, use_cache, scan_options,
+                                 record_telemetry=False, use_health=True, reprobe=False, use_history=True,
+                                 use_trends=True, use_dns=True, dns_server=None):
+    # One in-process scan over the union of all seller domains: each ads.txt is
+    # fetched once no matter how many publishers list the site. Runs are saved
+    # to the history, but per-domain outcomes (and so --refresh) aren't.
+    _init_worker(tranco_index_path, threshold, use_cache, scan_options, record_telemetry, use_health, reprobe,
+                 use_history, use_trends=use_trends, use_dns=use_dns, dns_server=dns_server)
+    telemetry = ScanTelemetry() if record_telemetry else None
+    started = time.time()
+    summaries = []
+    scannable = []
+    for publisher in publishers:
+        summary = {"publisher": publisher_slug(publisher), "pub_id": publisher["pub_id"], "domains": 0,
+                   "opportunities": 0, "skipped": 0, "error": ""}
+        summaries.append(summary)
+        try:
+            scannable.append((publisher, summary, publisher_domains(publisher, telemetry)))
+        except Exception as e:
+            summary["error"] = str(e)
+
+    pipeline = new_pipeline()
+    outcomes = scan_publishers(
+        [{"domains": domains, "pub_id": p["pub_id"], "sample_direct_line": p["sample_direct_line"]}
+         for p, _, domains in scannable],
+        _worker["tranco"], pipeline=pipeline, cache=_worker["cache"], health=_worker["health"], telemetry=telemetry,
+        **scan_options
+    )
+    for (publisher, summary, domains), (results, skipped_log) in zip(scannable, outcomes):
+        write_publisher_tables(summary["publisher"], results, skipped_log, out_dir, fmt)
+        if _worker["history"] is not None:
+            _worker["history"].save_run(publisher["name"] or publisher["domain"], publisher["pub_id"], results,
+                                        len(domains))
+        summary.update(domains=len(domains), opportunities=len(results), skipped=len(skipped_log))
+    for summary in summaries:
+        summary["seconds"] = round(time.time() - started, 1)
+    if telemetry is not None:
+        write_telemetry(telemetry, os.path.join(out_dir, "telemetry"))
+    pd.DataFrame(pipeline.report()).to_csv(os.path.join(out_dir, "pipeline.csv"), index=False)
+    return summaries
+
+
+def write_publisher_tables(slug, results, skipped_log, out_dir, fmt):
+    opportunities = with_rank_trends(results_frame(results), _worker.get("trends"))
+    write_table(opportunities, os.path.join(out_dir, f"{slug}_opportunities"), fmt)
+    write_table(skipped_frame(skipped_log), os.path.join(out_dir, f"{slug}_skipped"), fmt)
+
+
+def write_changes(slug, diff, out_dir, fmt):
+    # Opportunities gained and lost since the publisher's previous run
+    changes = pd.concat([
+        results_frame(diff.new).assign(Change="new"),
+        results_frame(diff.lost).assign(Change="lost"),
+    ], ignore_index=True)
+    write_table(changes, os.path.join(out_dir, f"{slug}_changes"), fmt)
+
+
+def write_telemetry(telemetry, base_path):
+    with open(f"{base_path}.json", "w", encoding="utf-8") as f:
+        f.write(telemetry.to_json())
+    with open(f"{base_path}.prom", "w", encoding="utf-8") as f:
+        f.write(telemetry.to_prometheus())
+
+
+def write_table(df, base_path, fmt):
+    if fmt == "parquet":
+        df.to_parquet(f"{base_path}.parquet", index=False)
+    else:
+        df.to_csv(f"{base_path}.csv", index=False)
+
+
+def read_table(base_path, fmt):
+    if fmt == "parquet":
+        return pd.read_parquet(f"{base_path}.parquet")
+    return pd.read_csv(f"{base_path}.csv", dtype=str, keep_default_na=False)
+
+
+# --- EMAIL ---
+def email_reports(publishers, summaries, out_dir, fmt, settings, default_recipient=""):
+    # Queues a report for every publisher with opportunities and a recipient
+    # (its `email` column, else default_recipient), then sends just those
+    # over one SMTP connection per batch, waiting out retries
+    outbox = Outbox(OUTBOX_FILE)
+    by_slug = {summary["publisher"]: summary for summary in summaries}
+    queued = []
+    for publisher in publishers:
+        summary = by_slug.get(publisher_slug(publisher))
+        recipient = publisher["email"] or default_recipient
+        if not recipient or summary is None or summary["error"] or not summary["opportunities"]:
+            continue
+        opportunities = read_table(os.path.join(out_dir, f"{summary['publisher']}_opportunities"), fmt)
+        queued.append(outbox.enqueue(report_message(settings.sender, recipient, opportunities,
+                                                    publisher["name"] or publisher["domain"], publisher["pub_id"])))
+    totals = deliver(outbox, settings, wait=True, message_ids=queued)
+    outbox.close()
+    return len(queued), totals
+
+
+# --- CLI ---
+def print_summary(summary, prefix=""):
+    status = f"❌ {summary['error']}" if summary["error"] else \
+        f"✅ {summary['opportunities']} opportunities, {summary['skipped']} skipped"
+    print(f"{prefix}{summary['publisher']}: {status} ({summary['seconds']}s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan many publishers for monetization opportunities.")
+    parser.add_argument("publishers", help="CSV of publishers (domain, name, pub_id, sample_direct_line[, domains, sellers_json])")
+    parser.add_argument("-o", "--out-dir", default=f"scan_{datetime.now().strftime('%Y%m%d_%H%M')}")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES)
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT_FETCHES,
+                        help="ads.txt fetches in flight per process")
+    parser.add_argument("--per-host", type=int, default=MAX_FETCHES_PER_HOST)
+    parser.add_argument("--tranco-csv", default=TRANCO_TOP_DOMAINS_FILE)
+    parser.add_argument("--tranco-id", default=None, help="Tranco list ID (names the rank index file)")
+    parser.add_argument("--threshold", type=int, default=TRANCO_THRESHOLD)
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the ads.txt cache")
+    parser.add_argument("--no-health", action="store_true",
+                        help="fetch every domain, even ones that recently timed out or failed DNS/TLS")
+    parser.add_argument("--reprobe", action="store_true",
+                        help="re-probe recently unreachable domains after everything else instead of skipping them")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="fetch each ads.txt once across all publishers (single process)")
+    parser.add_argument("--no-history", action="store_true", help="don't record this sweep in the run history")
+    parser.add_argument("--refresh", action="store_true",
+                        help="keep the last run's outcome for domains whose ads.txt is unchanged and still ranked")
+    parser.add_argument("--no-trends", action="store_true",
+                        help="leave the Tranco rank trend columns out of the opportunity tables")
+    parser.add_argument("--no-dns", action="store_true",
+                        help="don't resolve domains up front; each fetch looks its host up itself")
+    parser.add_argument("--dns-server", default=None, metavar="HOST[:PORT]",
+                        help="name server for the DNS stage (default: the first in /etc/resolv.conf)")
+    parser.add_argument("--telemetry", action="store_true",
+                        help="write per-request network timings as JSON and Prometheus metrics")
+    parser.add_argument("--email", action="store_true",
+                        help="email each publisher's opportunities to its `email` column; SMTP settings come from "
+                             "EMAIL_ADDRESS / EMAIL_PASSWORD (and optionally SMTP_HOST / SMTP_PORT / SMTP_SSL)")
+    parser.add_argument("--email-to", default="", metavar="ADDRESS",
+                        help="email reports for publishers without an `email` column here (implies --email)")
+    args = parser.parse_args(argv)
+    if args.refresh and (args.dedupe or args.no_history):
+        parser.error("--refresh needs the run history and can't be combined with --dedupe")
+    email_settings = None
+    if args.email or args.email_to:
+        if "EMAIL_ADDRESS" not in os.environ:
+            parser.error("--email needs EMAIL_ADDRESS (and usually EMAIL_PASSWORD) in the environment")
+        email_settings = smtp_settings(os.environ)
+
+    publishers = read_publishers(args.publishers)
+    if not publishers:
+        print("No publishers to scan.", file=sys.stderr)
+        return 1
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    # Build the rank index once up front; every worker then memory-maps the same file
+    index_path = None
+    if os.path.exists(args.tranco_csv):
+        index_path = ensure_tranco_index(args.tranco_csv, args.tranco_id)
+        if args.tranco_id and not args.no_trends:
+            # A named list also goes into the snapshot store the trend columns read
+            try:
+                TrancoHistory(TRANCO_HISTORY_DIR).add_index(
+                    args.tranco_id, TrancoIndex(index_path), date.fromtimestamp(os.path.getmtime(args.tranco_csv))
+                )
+            except ValueError as e:
+                print(f"⚠️ Rank history not updated: {e}", file=sys.stderr)
+    else:
+        print(f"⚠️ {args.tranco_csv} not found: every domain will be skipped as unranked.", file=sys.stderr)
+
+    scan_options = {"max_workers": args.max_concurrent, "per_host": args.per_host}
+    if args.dedupe:
+        summaries = scan_publishers_deduplicated(
+            publishers, args.out_dir, args.format, index_path, args.threshold, not args.no_cache, scan_options,
+            args.telemetry, not args.no_health, args.reprobe, not args.no_history, not args.no_trends,
+            not args.no_dns, args.dns_server
+        )
+        for summary in summaries:
+            print_summary(summary)
+    else:
+        summaries = []
+        with ProcessPoolExecutor(
+            max_workers=max(1, min(args.processes, len(publishers))),
+            initializer=_init_worker,
+            initargs=(index_path, args.threshold, not args.no_cache, scan_options, args.telemetry, not args.no_health,
+                      args.reprobe, not args.no_history, args.refresh, not args.no_trends, not args.no_dns,
+                      args.dns_server)
+        ) as pool:
+            futures = [pool.submit(scan_publisher, publisher, args.out_dir, args.format) for publisher in publishers]
+            for done, future in enumerate(as_completed(futures), start=1):
+                summary = future.result()
+                summaries.append(summary)
+                print_summary(summary, f"[{done}/{len(publishers)}] ")
+
+    pd.DataFrame(summaries).to_csv(os.path.join(args.out_dir, "summary.csv"), index=False)
+    failed = any(s["error"] for s in summaries)
+    if email_settings is not None:
+        queued, totals = email_reports(publishers, summaries, args.out_dir, args.format, email_settings,
+                                       args.email_to)
+        print(f"📧 {queued} reports queued; {totals['sent']} emails sent over {totals['connections']} "
+              f"connection(s), {totals['failed']} failed")
+        failed = failed or totals["failed"] > 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
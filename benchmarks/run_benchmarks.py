@@ -0,0 +1,261 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import net_hooks
+from ads_cache import AdsTxtCache
+from domain_sources import iter_domain_batches, MODE_LIVE, MODE_MANUAL, MODE_PASTE
+from scanner import iter_scan_batches, REASON_NO_DIRECT, REASON_NOT_RANKED, REASON_OMS_BUYING, REASON_SSL_ERROR
+from telemetry import ScanTelemetry
+from tranco_index import TrancoIndex, build_tranco_index
+from synthetic_server import SyntheticServer, SyntheticWorld, PUBLISHER_DOMAIN, DIRECT_AD_SYSTEM, PUB_ID
+
+# --- CONFIGURATION ---
+MODES = ["live", "manual", "paste"]
+SCAN_TIMEOUT = 3
+TRANCO_ROWS = 1000000
+TRANCO_THRESHOLD = 210000
+LOOKUPS = 100000
+
+
+# --- MEASUREMENT ---
+class Measure:
+    # Wall time, Python heap peak (tracemalloc) and process max RSS growth
+    def __enter__(self):
+        gc.collect()
+        tracemalloc.start()
+        self.rss_before = peak_rss_mb()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.heap_peak_mb = peak / 1e6
+        self.rss_growth_mb = max(0.0, peak_rss_mb() - self.rss_before)
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if platform.system() == "Darwin" else rss / 1e3
+
+
+def outcome_class(result, reason):
+    if result is not None:
+        return "opportunity"
+    return {
+        REASON_NO_DIRECT: "no_direct",
+        REASON_OMS_BUYING: "oms_buying",
+        REASON_NOT_RANKED: "not_ranked",
+        REASON_SSL_ERROR: "ssl_error",
+    }.get(reason, "ssl_error" if "SSL" in reason else "connection_error")
+
+
+# --- SCAN BENCHMARKS ---
+def bench_scan_mode(mode, world, scan_options, cache=None):
+    telemetry = ScanTelemetry()
+    sample_direct_line = f"{DIRECT_AD_SYSTEM}, 12345, DIRECT"
+    outcomes = Counter()
+    mismatches = []
+    first_result_at = None
+
+    domains = set()
+
+    def counted(batches):
+        for batch in batches:
+            domains.update(batch)
+            yield batch
+
+    with Measure() as measure:
+        # Domains are scanned as the sellers.json is read, the way the app does it
+        if mode == "live":
+            batches = iter_domain_batches(MODE_LIVE, pub_domain=PUBLISHER_DOMAIN, telemetry=telemetry)
+        elif mode == "manual":
+            batches = iter_domain_batches(MODE_MANUAL, manual_domains_input="\n".join(world.domains))
+        else:
+            batches = iter_domain_batches(MODE_PASTE, sellersjson_input=world.sellers_json())
+
+        for domain, result, reason in iter_scan_batches(
+            counted(batches), PUB_ID, sample_direct_line, world.tranco_rankings,
+            cache=cache, telemetry=telemetry, **scan_options
+        ):
+            if first_result_at is None:
+                first_result_at = time.perf_counter() - measure.started
+            got = outcome_class(result, reason)
+            outcomes[got] += 1
+            expected = world.expected_outcome(domain)
+            if got != expected:
+                mismatches.append({"domain": domain, "expected": expected, "got": got, "reason": reason})
+
+    perf = telemetry.summary()
+    return {
+        "mode": mode,
+        "domains": len(domains),
+        "seconds": measure.seconds,
+        "domains_per_second": len(domains) / measure.seconds if measure.seconds else 0.0,
+        "first_result_seconds": first_result_at,
+        "heap_peak_mb": measure.heap_peak_mb,
+        "rss_growth_mb": measure.rss_growth_mb,
+        "outcomes": dict(outcomes),
+        "mismatches": len(mismatches),
+        "mismatch_examples": mismatches[:10],
+        "requests": perf["requests"],
+        "connections_opened": perf["connections_opened"],
+        "cache_hits": perf["cache_hits"],
+        "latency_total_p50": perf["latency_seconds"]["total"]["p50"],
+        "latency_total_p90": perf["latency_seconds"]["total"]["p90"],
+        "errors": perf["errors"],
+    }
+
+
+# --- TRANCO BENCHMARK ---
+def bench_tranco(directory, rows=TRANCO_ROWS, seed=7):
+    csv_path = os.path.join(directory, "top-1m.csv")
+    index_path = os.path.join(directory, "tranco_index_bench.bin")
+    with open(csv_path, "w") as f:
+        for rank in range(1, rows + 1):
+            f.write(f"{rank},domain{rank}.example\n")
+
+    with Measure() as build:
+        build_tranco_index(csv_path, index_path)
+    with Measure() as load:
+        rankings = TrancoIndex(index_path).view(TRANCO_THRESHOLD)
+        listed = len(rankings)
+
+    rng = random.Random(seed)
+    # Half the probes are subdomains, ranked through their registrable domain
+    probes = [f"{rng.choice(['', 'www.'])}domain{rng.randint(1, rows * 2)}.example" for _ in range(LOOKUPS)]
+    with Measure() as lookup:
+        hits = sum(1 for domain in probes if domain in rankings)
+    with Measure() as batch_lookup:
+        batch_hits = sum(1 for rank in rankings.get_many(probes) if rank is not None)
+    assert batch_hits == hits
+
+    return {
+        "rows": rows,
+        "csv_mb": os.path.getsize(csv_path) / 1e6,
+        "index_mb": os.path.getsize(index_path) / 1e6,
+        "build_seconds": build.seconds,
+        "build_rows_per_second": rows / build.seconds,
+        "build_heap_peak_mb": build.heap_peak_mb,
+        "load_seconds": load.seconds,
+        "load_heap_peak_mb": load.heap_peak_mb,
+        "under_threshold": listed,
+        "lookups_per_second": LOOKUPS / lookup.seconds,
+        "batch_lookups_per_second": LOOKUPS / batch_lookup.seconds,
+        "lookup_hit_rate": hits / LOOKUPS,
+    }
+
+
+# --- REPORT ---
+def print_report(report, baseline=None):
+    def delta(section, key, value):
+        if not baseline:
+            return ""
+        old = baseline
+        for part in section:
+            old = old.get(part, {}) if isinstance(old, dict) else {}
+        old = old.get(key) if isinstance(old, dict) else None
+        if not isinstance(old, (int, float)) or not old:
+            return ""
+        return f" ({(value - old) / old * 100:+.1f}%)"
+
+    for scan in report["scans"]:
+        print(f"\n== {scan['mode']} ({scan['domains']:,} domains) ==")
+        for key in ["seconds", "domains_per_second", "first_result_seconds", "heap_peak_mb", "rss_growth_mb",
+                    "requests", "connections_opened", "latency_total_p50", "latency_total_p90"]:
+            value = scan[key]
+            if value is None:
+                continue
+            print(f"  {key:<22} {value:>12.3f}{delta(['scans_by_mode', scan['mode']], key, value)}")
+        print(f"  outcomes               {scan['outcomes']}")
+        print(f"  rule mismatches        {scan['mismatches']}")
+        if scan["errors"]:
+            print(f"  request errors         {scan['errors']}")
+
+    if report.get("tranco"):
+        print(f"\n== tranco ({report['tranco']['rows']:,} rows) ==")
+        for key, value in report["tranco"].items():
+            if isinstance(value, float):
+                print(f"  {key:<22} {value:>12.3f}{delta(['tranco'], key, value)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline scan benchmark against a synthetic ads.txt/sellers.json server.")
+    parser.add_argument("--domains", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated: live, manual, paste")
+    parser.add_argument("--max-concurrent", type=int, default=32)
+    parser.add_argument("--per-host", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=SCAN_TIMEOUT)
+    parser.add_argument("--warm-cache", action="store_true", help="repeat each scan against a warm ads.txt cache")
+    parser.add_argument("--tranco-rows", type=int, default=TRANCO_ROWS, help="0 skips the Tranco benchmark")
+    parser.add_argument("--output", default=f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    parser.add_argument("--compare", help="previous report JSON to show deltas against")
+    args = parser.parse_args(argv)
+
+    world = SyntheticWorld(args.domains, seed=args.seed)
+    scan_options = {"max_workers": args.max_concurrent, "per_host": args.per_host, "timeout": args.timeout}
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "python": platform.python_version(),
+        "scans": [],
+    }
+
+    with tempfile.TemporaryDirectory(prefix="oms_bench_run_") as directory:
+        with SyntheticServer(world, hang_seconds=args.timeout * 3) as server:
+            net_hooks.install_network_hooks()
+            net_hooks.set_resolver(server.resolver(net_hooks.system_resolve))
+            previous_bundle = os.environ.get("REQUESTS_CA_BUNDLE")
+            os.environ["REQUESTS_CA_BUNDLE"] = server.ca_bundle
+            try:
+                for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+                    print(f"Running {mode} scan...", file=sys.stderr)
+                    report["scans"].append(bench_scan_mode(mode, world, scan_options))
+                    if args.warm_cache:
+                        cache = AdsTxtCache(os.path.join(directory, f"cache_{mode}.sqlite"))
+                        bench_scan_mode(mode, world, scan_options, cache)
+                        warm = bench_scan_mode(mode, world, scan_options, cache)
+                        warm["mode"] = f"{mode}+warm_cache"
+                        report["scans"].append(warm)
+                        cache.close()
+            finally:
+                net_hooks.set_resolver(None)
+                if previous_bundle is None:
+                    os.environ.pop("REQUESTS_CA_BUNDLE", None)
+                else:
+                    os.environ["REQUESTS_CA_BUNDLE"] = previous_bundle
+
+        if args.tranco_rows:
+            print("Running Tranco benchmark...", file=sys.stderr)
+            report["tranco"] = bench_tranco(directory, args.tranco_rows, args.seed)
+
+    report["scans_by_mode"] = {scan["mode"]: scan for scan in report["scans"]}
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}", file=sys.stderr)
+    return 1 if any(scan["mismatches"] for scan in report["scans"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import json
+import os
+import random
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- CONFIGURATION ---
+BENCH_SUFFIX = "bench.test"
+PUBLISHER_DOMAIN = f"publisher.{BENCH_SUFFIX}"
+CDN_HOST = f"cdn.{BENCH_SUFFIX}"
+DIRECT_AD_SYSTEM = "connatix.com"
+OMS_AD_SYSTEM = "onlinemediasolutions.com"
+PUB_ID = "1536788745730056"
+
+# Share of domains per injected fault; the rest are served normally
+DEFAULT_FAULTS = {
+    "latency": 0.10,
+    "timeout": 0.02,
+    "tls_error": 0.02,
+    "redirect": 0.10,
+    "oversized": 0.02,
+    "not_found": 0.05,
+}
+LATENCY_RANGE = (0.05, 0.5)
+OVERSIZED_BYTES = 5 * 1024 * 1024
+
+
+# --- SYNTHETIC WORLD ---
+class SyntheticDomain:
+    __slots__ = ("name", "fault", "has_direct", "oms", "rank", "latency")
+
+    def __init__(self, name, fault, has_direct, oms, rank, latency):
+        self.name = name
+        self.fault = fault
+        self.has_direct = has_direct
+        self.oms = oms  # None, "pub" (OMS buys with PUB_ID) or "other"
+        self.rank = rank
+        self.latency = latency
+
+
+class SyntheticWorld:
+    # Deterministic for a given seed, so runs are comparable
+    def __init__(self, domain_count=2000, seed=7, faults=None, ranked_share=0.4):
+        rng = random.Random(seed)
+        faults = DEFAULT_FAULTS if faults is None else faults
+        self.domains = {}
+        for i in range(domain_count):
+            name = f"site{i:05d}.{BENCH_SUFFIX}"
+            roll = rng.random()
+            fault = None
+            for fault_name, share in faults.items():
+                if roll < share:
+                    fault = fault_name
+                    break
+                roll -= share
+            self.domains[name] = SyntheticDomain(
+                name,
+                fault,
+                has_direct=rng.random() < 0.7,
+                oms=rng.choice([None, None, "pub", "other"]),
+                rank=rng.randint(1, 1000000) if rng.random() < ranked_share else None,
+                latency=rng.uniform(*LATENCY_RANGE) if fault == "latency" else 0.0,
+            )
+
+    @property
+    def tranco_rankings(self):
+        return {d.name: d.rank for d in self.domains.values() if d.rank is not None}
+
+    def sellers_json(self):
+        return json.dumps({
+            "version": "1.0",
+            "sellers": [
+                {"seller_id": str(i), "seller_type": "PUBLISHER", "domain": name}
+                for i, name in enumerate(self.domains)
+            ] + [{"seller_id": "self", "seller_type": "INTERMEDIARY", "domain": PUBLISHER_DOMAIN}],
+        })
+
+    def ads_txt(self, domain):
+        lines = ["# synthetic ads.txt", "contact=ads@example.com", "google.com, pub-0000000000000000, DIRECT, f08c47fec0942fa0"]
+        if domain.has_direct:
+            lines.append(f"{DIRECT_AD_SYSTEM}, 12345, DIRECT")
+        else:
+            lines.append(f"{DIRECT_AD_SYSTEM}, 12345, RESELLER")
+        if domain.oms == "pub":
+            lines.append(f"{OMS_AD_SYSTEM}, {PUB_ID}, DIRECT")
+        elif domain.oms == "other":
+            lines.append(f"{OMS_AD_SYSTEM}, 99{PUB_ID}, DIRECT")
+        body = "\n".join(lines) + "\n"
+        if domain.fault == "oversized":
+            filler = "# padding " + "x" * 80 + "\n"
+            body += filler * (OVERSIZED_BYTES // len(filler))
+        return body
+
+    def expected_outcome(self, name):
+        # Outcome class the scanner should report: "opportunity", a rule reason
+        # key, or a transport failure class. Unranked domains are settled by the
+        # rank stage before any fetch, so they never see their fault.
+        domain = self.domains.get(name)
+        if domain is None or domain.rank is None:
+            return "not_ranked"  # includes the publisher itself in pasted sellers.json
+        if domain.fault == "timeout":
+            return "connection_error"
+        if domain.fault == "tls_error":
+            return "ssl_error"
+        if domain.fault == "not_found" or not domain.has_direct:
+            return "no_direct"
+        if domain.oms == "pub":
+            return "oms_buying"
+        return "opportunity"
+
+
+# --- CERTIFICATES ---
+def make_certificates(directory):
+    # A private CA plus a *.bench.test leaf signed by it (trusted by the client
+    # through the CA bundle), and an unrelated self-signed cert used to inject
+    # TLS errors.
+    def run(*args):
+        subprocess.run(["openssl", *args], check=True, capture_output=True)
+
+    ca_key = os.path.join(directory, "ca.key")
+    ca_crt = os.path.join(directory, "ca.crt")
+    leaf_key = os.path.join(directory, "leaf.key")
+    leaf_csr = os.path.join(directory, "leaf.csr")
+    leaf_crt = os.path.join(directory, "leaf.crt")
+    ext = os.path.join(directory, "leaf.ext")
+    bad_key = os.path.join(directory, "bad.key")
+    bad_crt = os.path.join(directory, "bad.crt")
+
+    run("req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2", "-subj", "/CN=bench-ca",
+        "-addext", "basicConstraints=critical,CA:TRUE", "-addext", "keyUsage=critical,keyCertSign,cRLSign",
+        "-keyout", ca_key, "-out", ca_crt)
+    run("req", "-newkey", "rsa:2048", "-nodes", "-subj", f"/CN=*.{BENCH_SUFFIX}", "-keyout", leaf_key, "-out", leaf_csr)
+    with open(ext, "w") as f:
+        f.write(f"subjectAltName=DNS:*.{BENCH_SUFFIX},DNS:{BENCH_SUFFIX}\nextendedKeyUsage=serverAuth\n")
+    run("x509", "-req", "-in", leaf_csr, "-CA", ca_crt, "-CAkey", ca_key, "-CAcreateserial", "-days", "2",
+        "-extfile", ext, "-out", leaf_crt)
+    run("req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2", "-subj", "/CN=untrusted",
+        "-keyout", bad_key, "-out", bad_crt)
+    return {"ca": ca_crt, "leaf": (leaf_crt, leaf_key), "bad": (bad_crt, bad_key)}
+
+
+# --- SERVER ---
+class SyntheticHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "SyntheticAds/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        world = self.server.world
+        host = (self.headers.get("Host") or "").split(":")[0].lower()
+        path = self.path.split("?")[0]
+
+        if host == PUBLISHER_DOMAIN and path == "/sellers.json":
+            return self._send(200, world.sellers_json_body, "application/json")
+
+        if host == CDN_HOST:
+            # Redirect target: /<domain>/ads.txt
+            domain = world.domains.get(path.strip("/").split("/")[0])
+            if domain is None:
+                return self._send(404, b"not found")
+            return self._send(200, world.ads_txt(domain).encode(), "text/plain")
+
+        domain = world.domains.get(host)
+        if domain is None or path != "/ads.txt":
+            return self._send(404, b"not found")
+        if domain.fault == "timeout":
+            time.sleep(self.server.hang_seconds)
+            return self._send(504, b"gateway timeout")
+        if domain.fault == "latency":
+            time.sleep(domain.latency)
+        if domain.fault == "not_found":
+            return self._send(404, b"<html>not found</html>", "text/html")
+        if domain.fault == "redirect":
+            self.send_response(301)
+            self.send_header("Location", f"https://{CDN_HOST}/{domain.name}/ads.txt")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        return self._send(200, world.ads_txt(domain).encode(), "text/plain")
+
+    def _send(self, status, body, content_type="text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TLSThreadingHTTPServer(ThreadingHTTPServer):
+    # TLS handshakes happen on the per-connection thread, not the accept loop,
+    # so slow or failing handshakes don't serialize the whole server
+    daemon_threads = True
+    request_queue_size = 1024
+    ssl_context = None
+
+    def finish_request(self, request, client_address):
+        try:
+            request = self.ssl_context.wrap_socket(request, server_side=True)
+        except (ssl.SSLError, OSError):
+            request.close()
+            return
+        super().finish_request(request, client_address)
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up on timeouts and TLS failures are expected here
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+
+class SyntheticServer:
+    # HTTPS stand-in for every *.bench.test host on one local port. Hostnames
+    # are routed to it through net_hooks.set_resolver; SNI picks the untrusted
+    # certificate for domains with an injected TLS error.
+    def __init__(self, world, hang_seconds=15.0):
+        self.world = world
+        self.world.sellers_json_body = world.sellers_json().encode()
+        self._tmp = tempfile.TemporaryDirectory(prefix="oms_bench_")
+        self.certs = make_certificates(self._tmp.name)
+
+        self.good_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.good_context.load_cert_chain(*self.certs["leaf"])
+        bad_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        bad_context.load_cert_chain(*self.certs["bad"])
+        tls_error_hosts = {d.name for d in world.domains.values() if d.fault == "tls_error"}
+
+        def pick_certificate(sock, server_name, context):
+            if server_name and server_name.lower() in tls_error_hosts:
+                sock.context = bad_context
+
+        self.good_context.sni_callback = pick_certificate
+
+        self.httpd = TLSThreadingHTTPServer(("127.0.0.1", 0), SyntheticHandler)
+        self.httpd.ssl_context = self.good_context
+        self.httpd.world = world
+        self.httpd.hang_seconds = hang_seconds
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="synthetic-server", daemon=True)
+
+    @property
+    def ca_bundle(self):
+        return self.certs["ca"]
+
+    def resolver(self, fallback):
+        def resolve(host, port, family):
+            if host.lower().endswith(f".{BENCH_SUFFIX}"):
+                return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("127.0.0.1", self.port))]
+            return fallback(host, port, family)
+        return resolve
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._tmp.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,398 @@
+import asyncio
+import random
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import net_hooks
+
+# --- CONFIGURATION ---
+RESOLV_CONF = "/etc/resolv.conf"
+DNS_TIMEOUT = 2.0  # seconds per query attempt
+DNS_ATTEMPTS = 2
+DNS_CONCURRENCY = 200  # hosts being looked up at once
+MAX_TTL = 3600  # seconds; answers are cached for their TTL, at most this
+MAX_NEGATIVE_TTL = 600  # "no such domain" is cached for the zone's SOA minimum, at most this
+DEFAULT_TTL = 30  # for answers that carry no TTL: a negative one without an SOA, or the system resolver's
+MAX_CACHE_ENTRIES = 200000
+EDNS_PAYLOAD = 4096
+
+DNS_OK = "ok"
+DNS_NXDOMAIN = "nxdomain"
+DNS_NO_ADDRESS = "no_address"
+DNS_ERROR = "error"  # timeout, SERVFAIL, refused...: nothing learned, left to the fetch
+
+TYPE_A = 1
+TYPE_CNAME = 5
+TYPE_SOA = 6
+TYPE_AAAA = 28
+TYPE_OPT = 41
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+# getaddrinfo errors that mean the name really has no address (not "try again")
+GAI_NOT_FOUND = {getattr(socket, name) for name in ("EAI_NONAME", "EAI_NODATA", "EAI_ADDRFAMILY")
+                 if hasattr(socket, name)}
+
+DnsAnswer = namedtuple("DnsAnswer", "status addresses expires")  # addresses: ((family, ip), ...)
+DnsResponse = namedtuple("DnsResponse", "rcode truncated records negative_ttl")  # records: [(name, type, ttl, value)]
+
+_HEADER = struct.Struct("!HHHHHH")
+_RR = struct.Struct("!HHIH")
+
+
+class DnsFormatError(Exception):
+    pass
+
+
+# --- WIRE FORMAT ---
+def build_query(query_id, name, qtype):
+    question = b"".join(bytes([len(label)]) + label.encode("ascii") for label in name.rstrip(".").split(".")) + b"\0"
+    opt = b"\0" + struct.pack("!HHIH", TYPE_OPT, EDNS_PAYLOAD, 0, 0)
+    return _HEADER.pack(query_id, 0x0100, 1, 0, 0, 1) + question + struct.pack("!HH", qtype, 1) + opt
+
+
+def _read_name(data, offset):
+    # (name, offset after it), following compression pointers
+    labels = []
+    end = None
+    for _ in range(128):
+        if offset >= len(data):
+            raise DnsFormatError("Name runs past the message")
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+        elif length:
+            labels.append(data[offset + 1:offset + 1 + length].decode("ascii", "replace").lower())
+            offset += 1 + length
+        else:
+            return ".".join(labels), end if end is not None else offset + 1
+    raise DnsFormatError("Compression loop")
+
+
+def parse_response(data):
+    # (query ID, question name, DnsResponse); raises DnsFormatError
+    if len(data) < _HEADER.size:
+        raise DnsFormatError("Short message")
+    query_id, flags, qdcount, ancount, nscount, arcount = _HEADER.unpack_from(data)
+    offset = _HEADER.size
+    question = None
+    for _ in range(qdcount):
+        question, offset = _read_name(data, offset)
+        offset += 4
+    records = []
+    negative_ttl = None
+    for section in range(ancount + nscount):
+        name, offset = _read_name(data, offset)
+        if offset + _RR.size > len(data):
+            raise DnsFormatError("Record runs past the message")
+        rtype, _, ttl, length = _RR.unpack_from(data, offset)
+        offset += _RR.size
+        rdata = data[offset:offset + length]
+        if rtype == TYPE_A and length == 4:
+            records.append((name, rtype, ttl, socket.inet_ntop(socket.AF_INET, rdata)))
+        elif rtype == TYPE_AAAA and length == 16:
+            records.append((name, rtype, ttl, socket.inet_ntop(socket.AF_INET6, rdata)))
+        elif rtype == TYPE_CNAME:
+            records.append((name, rtype, ttl, _read_name(data, offset)[0]))
+        elif rtype == TYPE_SOA and section >= ancount and length >= 20:
+            negative_ttl = min(ttl, struct.unpack_from("!I", rdata, length - 4)[0])
+        offset += length
+    return query_id, question, DnsResponse(flags & 0xF, bool(flags & 0x200), records, negative_ttl)
+
+
+def parse_address(address, default_port=53):
+    # "10.0.0.2", "127.0.0.1:5353", "::1" or "[::1]:5353" -> (host, port)
+    address = address.strip()
+    if address.startswith("["):
+        host, _, port = address[1:].partition("]")
+        return host, int(port.lstrip(":") or default_port)
+    if address.count(":") == 1:
+        host, port = address.split(":")
+        return host, int(port)
+    return address, default_port
+
+
+def system_nameserver(path=RESOLV_CONF):
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    return fields[1]
+    except OSError:
+        pass
+    return "127.0.0.1"
+
+
+# --- CACHE ---
+class DnsCache:
+    # Answers by host name until their TTL runs out. The fetcher's
+    # connections read it through net_hooks, so a host the DNS stage already
+    # resolved (or a CDN name another host pointed at) isn't looked up again.
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, host, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            answer = self._entries.get(host.lower().rstrip("."))
+        return answer if answer is not None and answer.expires > now else None
+
+    def put(self, host, answer):
+        with self._lock:
+            self._entries[host.lower().rstrip(".")] = answer
+            if len(self._entries) > self.max_entries:
+                now = time.time()
+                self._entries = {h: a for h, a in self._entries.items() if a.expires > now}
+                while len(self._entries) > self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+
+    def addrinfo(self, host, port, family):
+        # getaddrinfo-style list for a fresh positive answer, else None
+        answer = self.get(host)
+        if answer is None or not answer.addresses:
+            return None
+        found = []
+        for address_family, ip in answer.addresses:
+            if family in (socket.AF_UNSPEC, address_family):
+                sockaddr = (ip, port) if address_family == socket.AF_INET else (ip, port, 0, 0)
+                found.append((address_family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", sockaddr))
+        return found or None
+
+
+_shared_cache = DnsCache()
+
+
+def shared_dns_cache():
+    # One cache per process, for every scan it runs
+    return _shared_cache
+
+
+# --- RESOLVER ---
+class _DnsProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.pending = {}  # (query ID, name) -> future
+
+    def datagram_received(self, data, addr):
+        try:
+            query_id, question, response = parse_response(data)
+        except (DnsFormatError, IndexError, struct.error, ValueError):
+            return
+        future = self.pending.get((query_id, question))
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def error_received(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+
+def _answer(host, responses, now):
+    # Folds the A and AAAA responses for `host` into one DnsAnswer, plus the
+    # answers they carry for the CNAME targets along the way
+    records = [r for response in responses if response is not None for r in response.records]
+    cnames = {name: value for name, rtype, _, value in records if rtype == TYPE_CNAME}
+    chain = [host]
+    while chain[-1] in cnames and len(chain) < 16:
+        chain.append(cnames[chain[-1]])
+    by_name = {}
+    for name, rtype, ttl, value in records:
+        if rtype in (TYPE_A, TYPE_AAAA):
+            family = socket.AF_INET if rtype == TYPE_A else socket.AF_INET6
+            by_name.setdefault(name, []).append((family, ttl, value))
+
+    extra = {}
+    for name, entries in by_name.items():
+        # IPv4 first: plenty of hosts publish AAAA records they can't be reached on
+        entries.sort(key=lambda entry: entry[0] != socket.AF_INET)
+        ttl = min(MAX_TTL, min(entry[1] for entry in entries))
+        extra[name] = DnsAnswer(DNS_OK, tuple((family, ip) for family, _, ip in entries), now + ttl)
+
+    if chain[-1] in extra:
+        chain_ttl = min([ttl for name, rtype, ttl, _ in records if rtype == TYPE_CNAME and name in chain] or
+                        [MAX_TTL])
+        answer = extra[chain[-1]]
+        answer = answer._replace(expires=min(answer.expires, now + chain_ttl))
+    elif any(r is not None and r.rcode == RCODE_NXDOMAIN for r in responses):
+        answer = DnsAnswer(DNS_NXDOMAIN, (), now + _negative_ttl(responses))
+    elif all(r is not None and r.rcode == RCODE_NOERROR for r in responses):
+        answer = DnsAnswer(DNS_NO_ADDRESS, (), now + _negative_ttl(responses))
+    else:
+        answer = DnsAnswer(DNS_ERROR, (), now)
+    return answer, extra
+
+
+def _negative_ttl(responses):
+    ttls = [r.negative_ttl for r in responses if r is not None and r.negative_ttl is not None]
+    return min(MAX_NEGATIVE_TTL, min(ttls)) if ttls else DEFAULT_TTL
+
+
+def _system_answer(addresses, now):
+    # DnsAnswer from a getaddrinfo-style list, IPv4 first
+    found = dict.fromkeys((family, sockaddr[0]) for family, _, _, _, sockaddr in addresses
+                          if family in (socket.AF_INET, socket.AF_INET6))
+    ordered = sorted(found, key=lambda address: address[0] != socket.AF_INET)
+    return DnsAnswer(DNS_OK, tuple(ordered), now + DEFAULT_TTL)
+
+
+class DnsResolver:
+    # Bulk A/AAAA lookups sent straight to one name server (the system's
+    # first, or any "host[:port]", e.g. a local stub in tests), all in flight
+    # at once on an asyncio loop. The loop runs on its own thread and keeps
+    # one UDP socket for the resolver's lifetime, so a scan that resolves its
+    # domains batch by batch doesn't start a loop or open a socket per batch.
+    # Answers go into the shared cache, which this also hands to net_hooks
+    # for the fetcher's connections. A name the server says doesn't exist or
+    # has no address is looked up once more through the system resolver
+    # (/etc/hosts, nsswitch, search domains) before it counts as missing.
+    def __init__(self, nameserver=None, timeout=DNS_TIMEOUT, attempts=DNS_ATTEMPTS, concurrency=DNS_CONCURRENCY,
+                 cache=None):
+        self.nameserver = parse_address(nameserver or system_nameserver())
+        self.timeout = timeout
+        self.attempts = attempts
+        self.concurrency = concurrency
+        self.cache = cache if cache is not None else shared_dns_cache()
+        self._loop = None
+        self._endpoint = None  # (transport, protocol) once opened
+        self._lock = threading.Lock()
+        net_hooks.install_network_hooks()
+        net_hooks.set_dns_cache(self.cache)
+
+    def resolve_many(self, hosts):
+        # {host: DnsAnswer}, from the cache where it is still fresh
+        now = time.time()
+        answers = {}
+        missing = []
+        for host in dict.fromkeys(h.lower().rstrip(".") for h in hosts):
+            cached = self.cache.get(host, now)
+            if cached is not None:
+                answers[host] = cached
+            else:
+                missing.append(host)
+        if missing:
+            answers.update(asyncio.run_coroutine_threadsafe(self._resolve_all(missing), self._start()).result())
+        return answers
+
+    def resolve(self, host):
+        return self.resolve_many([host])[host.lower().rstrip(".")]
+
+    def close(self):
+        # Closes the socket and stops the loop; a later lookup starts afresh
+        with self._lock:
+            loop, self._loop = self._loop, None
+            endpoint, self._endpoint = self._endpoint, None
+        if loop is not None:
+            if endpoint is not None:
+                loop.call_soon_threadsafe(endpoint[0].close)
+            loop.call_soon_threadsafe(loop.stop)
+
+    def _start(self):
+        # The resolver's event loop, started on first use
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="dns-resolver", daemon=True).start()
+            return self._loop
+
+    async def _open_endpoint(self):
+        # The UDP socket to the name server, opened once and reused; None if
+        # it can't be opened (tried again on the next batch)
+        if self._endpoint is None:
+            try:
+                self._endpoint = await asyncio.get_running_loop().create_datagram_endpoint(
+                    _DnsProtocol, remote_addr=self.nameserver)
+            except OSError:
+                return None
+        return self._endpoint
+
+    async def _resolve_all(self, hosts):
+        endpoint = await self._open_endpoint()
+        if endpoint is None:
+            now = time.time()
+            return {host: DnsAnswer(DNS_ERROR, (), now) for host in hosts}
+        transport, protocol = endpoint
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def lookup(host):
+            async with semaphore:
+                responses = await asyncio.gather(self._query(transport, protocol, host, TYPE_A),
+                                                 self._query(transport, protocol, host, TYPE_AAAA))
+            answer, extra = _answer(host, responses, time.time())
+            if answer.status in (DNS_NXDOMAIN, DNS_NO_ADDRESS):
+                answer = await self._system_lookup(host, answer)
+            for name, extra_answer in extra.items():
+                if name != host:
+                    self.cache.put(name, extra_answer)
+            if answer.status != DNS_ERROR:
+                self.cache.put(host, answer)
+            return host, answer
+
+        return dict(await asyncio.gather(*(lookup(host) for host in hosts)))
+
+    async def _system_lookup(self, host, answer):
+        # The name server's negative `answer`, unless the system resolver
+        # finds the host after all; a lookup that hangs or fails for another
+        # reason leaves the host to the fetch
+        loop = asyncio.get_running_loop()
+        try:
+            addresses = await asyncio.wait_for(
+                loop.run_in_executor(None, net_hooks.resolve, host, 443, socket.AF_UNSPEC),
+                self.timeout * self.attempts
+            )
+        except socket.gaierror as e:
+            return answer if e.errno in GAI_NOT_FOUND else DnsAnswer(DNS_ERROR, (), time.time())
+        except (asyncio.TimeoutError, OSError, UnicodeError):
+            return DnsAnswer(DNS_ERROR, (), time.time())
+        found = _system_answer(addresses, time.time())
+        return found if found.addresses else answer
+
+    async def _query(self, transport, protocol, host, qtype):
+        # DnsResponse, or None once every attempt timed out or failed
+        try:
+            host.encode("ascii")
+        except UnicodeError:
+            return None
+        loop = asyncio.get_running_loop()
+        for _ in range(self.attempts):
+            key = (random.getrandbits(16), host)
+            while key in protocol.pending:
+                key = (random.getrandbits(16), host)
+            future = protocol.pending[key] = loop.create_future()
+            try:
+                transport.sendto(build_query(key[0], host, qtype))
+                response = await asyncio.wait_for(future, self.timeout)
+                if response.truncated:
+                    return None  # partial answer: the fetch's own lookup (over TCP if need be) decides
+                if response.rcode in (RCODE_NOERROR, RCODE_NXDOMAIN):
+                    return response
+            except (asyncio.TimeoutError, OSError):
+                pass
+            finally:
+                protocol.pending.pop(key, None)
+        return None
+
+
+
+_shared_resolvers = {}
+_shared_resolvers_lock = threading.Lock()
+
+
+def shared_resolver(nameserver=None):
+    # One resolver (loop, thread and socket) per name server per process,
+    # for every scan it runs
+    nameserver = nameserver or None
+    with _shared_resolvers_lock:
+        resolver = _shared_resolvers.get(nameserver)
+        if resolver is None:
+            resolver = _shared_resolvers[nameserver] = DnsResolver(nameserver)
+        return resolver
@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import requests
+
+from http_client import is_name_resolution_error
+
+# --- CONFIGURATION ---
+DOMAIN_HEALTH_FILE = "/tmp/domain_health.sqlite"
+BACKOFF_BASE = 60 * 60  # first failure: skip the domain for an hour
+BACKOFF_MAX = 7 * 24 * 60 * 60  # doubling per consecutive failure, capped at a week
+LOOKUP_CHUNK = 500  # stays under SQLite's bound-parameter limit
+
+REASON_RECENTLY_UNREACHABLE = "⏭️ Recently unreachable"
+
+FAILURE_DNS = "dns"
+FAILURE_TIMEOUT = "timeout"
+FAILURE_SSL = "ssl"
+FAILURE_CONNECTION = "connection"
+
+DomainFailure = namedtuple("DomainFailure", "domain failure failures first_failed last_failed retry_after")
+
+
+def failure_kind(exc):
+    # Which transport failures mark a domain as unhealthy. HTTP errors and
+    # redirect-policy violations are answers from a live site, so they don't.
+    if isinstance(exc, requests.exceptions.SSLError):
+        return FAILURE_SSL
+    if isinstance(exc, requests.exceptions.Timeout):
+        return FAILURE_TIMEOUT
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        return FAILURE_DNS if is_name_resolution_error(exc) else FAILURE_CONNECTION
+    return None
+
+
+def backoff_seconds(failures):
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (max(1, failures) - 1)))
+
+
+class DomainHealth:
+    # Negative cache of domains whose ads.txt fetch failed at the transport
+    # level. Consecutive failures push `retry_after` out exponentially; any
+    # successful fetch forgets the domain. Shared across scans and processes
+    # through one SQLite file, like the ads.txt cache.
+    def __init__(self, path=DOMAIN_HEALTH_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS domain_health (
+                domain TEXT PRIMARY KEY,
+                failure TEXT,
+                failures INTEGER,
+                first_failed REAL,
+                last_failed REAL,
+                retry_after REAL
+            )
+        """)
+
+    def record_failure(self, domain, failure):
+        domain = domain.lower()
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT failures, first_failed FROM domain_health WHERE domain = ?", (domain,)
+            ).fetchone()
+            failures, first_failed = (row[0] + 1, row[1]) if row else (1, now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO domain_health VALUES (?, ?, ?, ?, ?, ?)",
+                (domain, failure, failures, first_failed, now, now + backoff_seconds(failures))
+            )
+        return failures
+
+    def record_success(self, domain):
+        with self._lock:
+            self._conn.execute("DELETE FROM domain_health WHERE domain = ?", (domain.lower(),))
+
+    def unreachable(self, domains, now=None):
+        # {domain: DomainFailure} for the given domains still inside their backoff window
+        now = time.time() if now is None else now
+        domains = [d.lower() for d in domains]
+        found = {}
+        with self._lock:
+            for start in range(0, len(domains), LOOKUP_CHUNK):
+                chunk = domains[start:start + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                for row in self._conn.execute(
+                    f"SELECT * FROM domain_health WHERE retry_after > ? AND domain IN ({placeholders})",
+                    [now, *chunk]
+                ):
+                    found[row[0]] = DomainFailure(*row)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM domain_health")
+
+    def stats(self):
+        with self._lock:
+            total, backing_off = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(retry_after > ?), 0) FROM domain_health", (time.time(),)
+            ).fetchone()
+        return {"domains": total, "backing_off": backing_off}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def describe_failure(entry):
+    retry_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.retry_after))
+    times = "once" if entry.failures == 1 else f"{entry.failures} times in a row"
+    return f"{entry.failure} failure {times}, next try after {retry_at}"
+
+
+def unreachable_reason(entry):
+    return f"{REASON_RECENTLY_UNREACHABLE} ({describe_failure(entry)})"
@@ -0,0 +1,106 @@
+import os
+import re
+from functools import lru_cache
+
+# --- CONFIGURATION ---
+PUBLIC_SUFFIX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "public_suffix_list.dat")
+MAX_LABELS = 10  # suffixes longer than this are never public suffixes
+
+_DOMAIN_RE = re.compile(r"^(?=.{1,253}$)([a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9])?\.)+[a-z0-9-]{2,63}$")
+
+
+# --- NORMALIZATION ---
+def to_ascii(domain):
+    # IDN labels to their punycode form ("bücher.de" -> "xn--bcher-kva.de"); None if not encodable
+    try:
+        return domain.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+
+
+def normalize_domain(value):
+    # "HTTPS://Example.com:443/ads.txt" -> "example.com"; None if it isn't a host name
+    domain = (value or "").strip().lower()
+    if "://" in domain:
+        domain = domain.split("://", 1)[1]
+    domain = domain.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0]
+    domain = domain.rsplit("@", 1)[-1].split(":", 1)[0].rstrip(".")
+    if domain and not domain.isascii():
+        domain = to_ascii(domain) or ""
+    return domain if _DOMAIN_RE.match(domain) else None
+
+
+def normalize_domains(values):
+    # normalize_domain over a whole list, worked out once per distinct value;
+    # None where the value isn't a host name
+    known = {}
+    return [known[v] if v in known else known.setdefault(v, normalize_domain(v)) for v in values]
+
+
+# --- PUBLIC SUFFIX LIST ---
+class PublicSuffixList:
+    # The publicsuffix.org rules (ICANN and private sections): exact rules,
+    # wildcards ("*.ck" -> parent "ck") and exceptions ("!www.ck"). The
+    # implicit "*" rule makes every TLD a public suffix.
+    def __init__(self, rules):
+        self.exact = set()
+        self.wildcard_parents = set()
+        self.exceptions = set()
+        for rule in rules:
+            if rule.startswith("!"):
+                self.exceptions.add(rule[1:])
+            elif rule.startswith("*."):
+                self.wildcard_parents.add(rule[2:])
+            else:
+                self.exact.add(rule)
+
+    @classmethod
+    def load(cls, path=PUBLIC_SUFFIX_FILE):
+        rules = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                rule = line.split("//", 1)[0].strip().lower()
+                if rule and not rule.isascii():
+                    # IDN rules are matched in their punycode form, like the hosts
+                    body = rule.lstrip("!*.")
+                    rule = rule[:len(rule) - len(body)] + (to_ascii(body) or "")
+                if rule:
+                    rules.append(rule)
+        return cls(rules)
+
+    def suffix_labels(self, labels):
+        # Number of trailing labels that form the public suffix. An exception
+        # rule always prevails, whatever longer rules would also match.
+        size = 1
+        for k in range(1, min(len(labels), MAX_LABELS) + 1):
+            suffix = ".".join(labels[-k:])
+            if suffix in self.exceptions:
+                return k - 1
+            if suffix in self.exact or (k > 1 and ".".join(labels[-k + 1:]) in self.wildcard_parents):
+                size = k
+        return size
+
+    def registrable_domain(self, domain):
+        # eTLD+1: "www.example.co.uk" -> "example.co.uk"; None for a bare public suffix
+        labels = domain.split(".")
+        size = self.suffix_labels(labels)
+        return ".".join(labels[-(size + 1):]) if len(labels) > size else None
+
+    def registrable_domains(self, domains):
+        # registrable_domain over a list, worked out once per distinct host
+        # (a sellers.json lists the same sites many times)
+        known = {}
+        return [known[d] if d in known else known.setdefault(d, self.registrable_domain(d)) for d in domains]
+
+
+@lru_cache(maxsize=1)
+def public_suffixes():
+    return PublicSuffixList.load()
+
+
+def registrable_domain(domain):
+    return public_suffixes().registrable_domain(domain)
+
+
+def registrable_domains(domains):
+    return public_suffixes().registrable_domains(domains)
@@ -0,0 +1,141 @@
+import io
+import re
+
+import pandas as pd
+import requests
+
+from http_client import get_default_client
+from sellers_stream import (
+    SellersJsonError, SellersJsonParser, iter_file_chunks, iter_seller_domain_batches, iter_text_slices
+)
+
+# --- INPUT MODES ---
+MODE_LIVE = "Live (from domain)"
+MODE_MANUAL = "Manual Domains"
+MODE_PASTE = "Paste sellers.json"
+MODE_MULTI = "Multiple Publishers"
+INPUT_MODES = [MODE_LIVE, MODE_MANUAL, MODE_PASTE, MODE_MULTI]
+
+# Publisher lists (batch CLI and multi-publisher mode): CSV with a header row.
+# Required columns are pub_id and sample_direct_line (quote it, it contains
+# commas). Each row also needs one domain source: `domain` (live
+# sellers.json), `domains` (manual list) or `sellers_json` (path to a file).
+PUBLISHER_COLUMNS = ["domain", "name", "pub_id", "sample_direct_line", "domains", "sellers_json", "email"]
+
+SELLERS_TIMEOUT = 10
+SELLERS_MAX_BYTES = 256 * 1024 * 1024  # the largest exchanges publish 100MB+ files
+
+
+class DomainSourceError(Exception):
+    pass
+
+
+class NoSellersFieldError(DomainSourceError):
+    pass
+
+
+# --- EXTRACTION ---
+def domains_from_manual(text):
+    manual_lines = re.split(r'[\n,]+', (text or "").strip())
+    return {d.strip().lower() for d in manual_lines if d.strip()}
+
+
+def domains_from_sellers_json(text):
+    return collect_domains(iter_sellers_json_batches(iter_text_slices(text or "")))
+
+
+def domains_from_live(pub_domain, timeout=SELLERS_TIMEOUT, telemetry=None):
+    return collect_domains(iter_live_batches(pub_domain, timeout, telemetry))
+
+
+def extract_domains(mode, pub_domain="", manual_domains_input="", sellersjson_input="", telemetry=None):
+    return collect_domains(iter_domain_batches(mode, pub_domain, manual_domains_input, sellersjson_input, telemetry))
+
+
+# --- STREAMING EXTRACTION ---
+# sellers.json sources are read incrementally: each batch holds the new
+# domains from the latest chunk, so scans can start before the download or
+# file read finishes and memory doesn't grow with the file size.
+def iter_sellers_json_batches(chunks, exclude_domain="", require_sellers=False):
+    parser = SellersJsonParser()
+    try:
+        yield from iter_seller_domain_batches(chunks, exclude_domain, parser=parser)
+    except SellersJsonError as e:
+        raise DomainSourceError(f"Failed to parse sellers.json: {e}")
+    if require_sellers and not parser.found_sellers:
+        raise NoSellersFieldError("No sellers field in sellers.json. Provide manual domains if needed.")
+
+
+def iter_live_batches(pub_domain, timeout=SELLERS_TIMEOUT, telemetry=None):
+    sellers_url = f"https://{pub_domain}/sellers.json"
+    chunks = get_default_client().iter_content(
+        sellers_url, timeout, telemetry=telemetry, kind="sellers_json", max_bytes=SELLERS_MAX_BYTES
+    )
+    try:
+        yield from iter_sellers_json_batches(chunks, exclude_domain=pub_domain, require_sellers=True)
+    except NoSellersFieldError:
+        raise
+    except (DomainSourceError, requests.exceptions.RequestException):
+        raise DomainSourceError(f"Invalid sellers.json at {sellers_url}")
+
+
+def iter_domain_batches(mode, pub_domain="", manual_domains_input="", sellersjson_input="", telemetry=None,
+                        sellers_file=None):
+    # `sellers_file` (a binary file object, e.g. an upload) takes precedence
+    # over pasted text in Paste mode
+    if mode == MODE_MANUAL:
+        domains = domains_from_manual(manual_domains_input)
+        return iter([sorted(domains)] if domains else [])
+    if mode == MODE_PASTE:
+        if sellers_file is not None:
+            return iter_sellers_json_batches(iter_file_chunks(sellers_file))
+        return iter_sellers_json_batches(iter_text_slices(sellersjson_input or ""))
+    return iter_live_batches(pub_domain, telemetry=telemetry)
+
+
+def collect_domains(batches):
+    domains = set()
+    for batch in batches:
+        domains.update(batch)
+    return domains
+
+
+# --- PUBLISHER LISTS ---
+def read_publishers(path_or_text):
+    source = path_or_text
+    if isinstance(path_or_text, str) and "\n" in path_or_text:
+        source = io.StringIO(path_or_text)
+    df = pd.read_csv(source, dtype=str, keep_default_na=False, skipinitialspace=True)
+    df.columns = [c.strip().lower() for c in df.columns]
+    missing = {"pub_id", "sample_direct_line"} - set(df.columns)
+    if missing:
+        raise DomainSourceError(f"Publisher list is missing columns: {', '.join(sorted(missing))}")
+    for column in PUBLISHER_COLUMNS:
+        if column not in df.columns:
+            df[column] = ""
+    return [
+        {column: row[column].strip() for column in PUBLISHER_COLUMNS}
+        for _, row in df.iterrows()
+    ]
+
+
+def publisher_mode(publisher):
+    if publisher["sellers_json"]:
+        return MODE_PASTE
+    if publisher["domains"]:
+        return MODE_MANUAL
+    return MODE_LIVE
+
+
+def publisher_domains(publisher, telemetry=None):
+    mode = publisher_mode(publisher)
+    if mode == MODE_LIVE and not publisher["domain"]:
+        raise DomainSourceError("Publisher row has no domain, domains or sellers_json value.")
+    if mode == MODE_PASTE:
+        with open(publisher["sellers_json"], "rb") as f:
+            domains = collect_domains(iter_domain_batches(mode, sellers_file=f))
+    else:
+        domains = extract_domains(mode, publisher["domain"], publisher["domains"], telemetry=telemetry)
+    if not domains:
+        raise DomainSourceError("No valid domains found to check.")
+    return domains
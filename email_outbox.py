@@ -0,0 +1,365 @@
+import gzip
+import re
+import smtplib
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from html import escape
+
+import pandas as pd
+
+from results_view import export_bytes
+
+# --- CONFIGURATION ---
+OUTBOX_FILE = "/tmp/oms_email_outbox.sqlite"
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 465
+SMTP_TIMEOUT = 30  # seconds
+INLINE_ROWS = 50  # longer tables go out as a gzipped CSV attachment, with the best-ranked rows inline
+BATCH_SIZE = 50  # messages sent over one connection before it is reopened
+MAX_ATTEMPTS = 4
+RETRY_DELAY = 30  # seconds before the first retry, doubling per attempt
+STALE_CLAIM = 600  # seconds: a message claimed by a sender that died is queued again after this
+
+STATUS_QUEUED = "queued"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+FINAL_STATUSES = (STATUS_SENT, STATUS_FAILED)
+
+SmtpSettings = namedtuple("SmtpSettings", "sender password host port use_ssl",
+                          defaults=(SMTP_HOST, SMTP_PORT, True))
+Message = namedtuple("Message", "message_id recipient subject status created attempts next_attempt sent error")
+
+_MESSAGE_COLUMNS = ", ".join(Message._fields)
+
+REPORT_STYLE = """
+      * { font-family: Arial, sans-serif; font-size: 14px; color: #333; }
+      .styled-table {
+        border-collapse: collapse;
+        margin: 10px 0;
+        font-size: 14px;
+        min-width: 400px;
+        border: 1px solid #ddd;
+      }
+      .styled-table th, .styled-table td {
+        border: 1px solid #ddd;
+        padding: 8px;
+        text-align: left;
+      }
+      .styled-table th {
+        background-color: #f2f2f2;
+        font-weight: bold;
+      }"""
+
+
+def smtp_settings(source):
+    # From st.secrets or os.environ: EMAIL_ADDRESS and EMAIL_PASSWORD, plus
+    # optional SMTP_HOST / SMTP_PORT / SMTP_SSL (e.g. a local test server)
+    port = int(source.get("SMTP_PORT", SMTP_PORT))
+    use_ssl = str(source.get("SMTP_SSL", port == 465)).lower() in ("1", "true", "yes")
+    return SmtpSettings(source["EMAIL_ADDRESS"].strip(), source.get("EMAIL_PASSWORD", ""),
+                        source.get("SMTP_HOST", SMTP_HOST), port, use_ssl)
+
+
+# --- MESSAGES ---
+def sanitize_header(text):
+    text = unicodedata.normalize("NFKD", text)
+    text = re.sub(r'[^ -~]', '', text)
+    return text.strip().replace("\r", "").replace("\n", "")
+
+
+def report_message(sender, recipient, df, publisher_name="", pub_id="", comment=""):
+    # The opportunities email. Short tables are inlined whole; a longer one
+    # is attached as a gzipped CSV and only its best-ranked rows are inlined,
+    # so the message stays small enough for any mail client.
+    subject_name = sanitize_header(publisher_name or "Manual Domains")
+    subject_id = sanitize_header(pub_id or "NoID")
+    msg = EmailMessage()
+    msg["Subject"] = f"{subject_name} ({subject_id}) opportunities"
+    msg["From"] = sender.strip()
+    msg["To"] = recipient.strip()
+
+    inline = df
+    attachment_name = None
+    summary = ""
+    if len(df) > INLINE_ROWS:
+        attachment_name = f"opportunities_{re.sub(r'[^A-Za-z0-9_-]+', '_', subject_id)}_" \
+                          f"{datetime.now().strftime('%Y%m%d')}.csv.gz"
+        if "Tranco Rank" in df.columns:
+            # Numerically, also when the table was read back from CSV as text
+            inline = df.sort_values("Tranco Rank", kind="stable", na_position="last",
+                                    key=lambda ranks: pd.to_numeric(ranks, errors="coerce"))
+        inline = inline.head(INLINE_ROWS)
+        summary = f"<p>{len(df):,} opportunities. The {INLINE_ROWS} best-ranked are below; the full list is in " \
+                  f"the attached <strong>{attachment_name}</strong>.</p>"
+    html_table = export_bytes(inline, "html").decode("utf-8")
+    comment_html = escape(comment.strip()).replace("\n", "<br>")
+
+    body = f"""
+<html>
+  <head>
+    <style>{REPORT_STYLE}
+    </style>
+  </head>
+  <body>
+    <p>Hi there!</p>
+    <p>Here is the list of opportunities for <strong>{escape(subject_name)}</strong> ({escape(subject_id)}):</p>
+    {summary}
+    {html_table}
+    {f"<p><strong>Adding here your manual comments:</strong><br>{comment_html}</p>" if comment_html else ""}
+    <p>Warm regards,<br/>Automation bot</p>
+  </body>
+</html>
+"""
+    msg.set_content("This email requires an HTML-capable email client.")
+    msg.add_alternative(body, subtype="html")
+    if attachment_name:
+        msg.add_attachment(gzip.compress(export_bytes(df, "csv")), maintype="application", subtype="gzip",
+                           filename=attachment_name)
+    return msg
+
+
+# --- QUEUE ---
+class Outbox:
+    # Emails waiting to go out, shared by every session and batch scan on
+    # this deployment. Queuing is instant; deliver() sends what is due.
+    def __init__(self, path=OUTBOX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                message_id TEXT PRIMARY KEY,
+                recipient TEXT,
+                subject TEXT,
+                status TEXT,
+                created REAL,
+                attempts INTEGER DEFAULT 0,
+                next_attempt REAL,
+                claimed REAL,
+                sent REAL,
+                error TEXT,
+                body BLOB
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS messages_due ON messages (status, next_attempt)")
+
+    def enqueue(self, msg):
+        message_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO messages (message_id, recipient, subject, status, created, next_attempt, body) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (message_id, msg["To"], msg["Subject"], STATUS_QUEUED, now, now, msg.as_bytes(policy=policy.SMTP))
+            )
+        return message_id
+
+    def get(self, message_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE message_id = ?",
+                                     (message_id,)).fetchone()
+        return Message(*row) if row else None
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall()
+        return dict(rows)
+
+    @staticmethod
+    def _only(message_ids):
+        # SQL condition (and its parameters) limiting a query to message_ids, if given
+        if message_ids is None:
+            return "", []
+        message_ids = list(message_ids)
+        return f" AND message_id IN ({','.join('?' * len(message_ids))})", message_ids
+
+    def next_due(self, message_ids=None):
+        # When the next queued message may be sent, or None if nothing is queued
+        only, params = self._only(message_ids)
+        with self._lock:
+            row = self._conn.execute(f"SELECT MIN(next_attempt) FROM messages WHERE status = ?{only}",
+                                     [STATUS_QUEUED, *params]).fetchone()
+        return row[0]
+
+    def claim(self, limit, message_ids=None):
+        # Up to `limit` due messages (of message_ids, if given), marked as
+        # sending so no other sender picks them up: [(message_id, EmailMessage)]
+        only, params = self._only(message_ids)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("UPDATE messages SET status = ? WHERE status = ? AND claimed < ?",
+                                   (STATUS_QUEUED, STATUS_SENDING, now - STALE_CLAIM))
+                rows = self._conn.execute(
+                    f"SELECT message_id, body FROM messages WHERE status = ? AND next_attempt <= ?{only} "
+                    "ORDER BY next_attempt LIMIT ?", [STATUS_QUEUED, now, *params, limit]
+                ).fetchall()
+                self._conn.executemany("UPDATE messages SET status = ?, claimed = ? WHERE message_id = ?",
+                                       [(STATUS_SENDING, now, row[0]) for row in rows])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(message_id, message_from_bytes(body, policy=policy.default)) for message_id, body in rows]
+
+    def mark_sent(self, message_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE messages SET status = ?, sent = ?, attempts = attempts + 1, error = NULL, body = NULL "
+                "WHERE message_id = ?", (STATUS_SENT, time.time(), message_id)
+            )
+
+    def mark_failed(self, message_id, error, permanent=False):
+        # A failed attempt: queued again with a growing delay, or given up on
+        # after MAX_ATTEMPTS (or straight away when the server refused it for good)
+        with self._lock:
+            attempts = self._conn.execute("SELECT attempts FROM messages WHERE message_id = ?",
+                                          (message_id,)).fetchone()[0] + 1
+            final = permanent or attempts >= MAX_ATTEMPTS
+            self._conn.execute(
+                "UPDATE messages SET status = ?, attempts = ?, next_attempt = ?, error = ? WHERE message_id = ?",
+                (STATUS_FAILED if final else STATUS_QUEUED, attempts,
+                 time.time() + RETRY_DELAY * 2 ** (attempts - 1), str(error), message_id)
+            )
+        return not final
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- SENDING ---
+class SmtpConnection:
+    # One SMTP session, opened and logged into on first use and reused for
+    # every message after that
+    def __init__(self, settings):
+        self.settings = settings
+        self.opened = 0
+        self._smtp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        if self._smtp is not None:
+            return
+        s = self.settings
+        smtp = smtplib.SMTP_SSL(s.host, s.port, timeout=SMTP_TIMEOUT) if s.use_ssl else \
+            smtplib.SMTP(s.host, s.port, timeout=SMTP_TIMEOUT)
+        try:
+            if not s.use_ssl:
+                smtp.ehlo()
+                if smtp.has_extn("starttls"):
+                    smtp.starttls()
+                    smtp.ehlo()
+            if s.password:
+                smtp.login(s.sender, s.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.opened += 1
+
+    def send(self, msg):
+        self.open()
+        self._smtp.send_message(msg)
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+
+def _permanent(error):
+    # 5xx replies mean the server won't take this message however often it is retried
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def deliver(outbox, settings, batch_size=BATCH_SIZE, wait=False, message_ids=None):
+    # Sends every due message (or only message_ids), batch_size at a time
+    # over one connection. A message that fails is retried later; if the
+    # connection can't be opened (or login fails) the whole batch counts one
+    # attempt and, without wait, the run stops there.
+    # With wait, keeps going until nothing is left queued, sleeping out retry
+    # delays. Returns counts of what happened.
+    totals = {"sent": 0, "retrying": 0, "failed": 0, "connections": 0}
+    with SmtpConnection(settings) as connection:
+        while True:
+            batch = outbox.claim(batch_size, message_ids)
+            if not batch:
+                due = outbox.next_due(message_ids) if wait else None
+                if due is None:
+                    break
+                time.sleep(max(0.0, due - time.time()))
+                continue
+            try:
+                connection.open()
+            except Exception as e:
+                # Never permanent: a refused login is a settings problem, not the message's
+                for message_id, _ in batch:
+                    totals["retrying" if outbox.mark_failed(message_id, e) else "failed"] += 1
+                if not wait:
+                    break
+                continue
+            for message_id, msg in batch:
+                try:
+                    connection.send(msg)
+                except (smtplib.SMTPException, OSError) as e:
+                    totals["retrying" if outbox.mark_failed(message_id, e, _permanent(e)) else "failed"] += 1
+                    if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                        connection.close()  # dropped or broken: reopened for the next message
+                except Exception as e:
+                    # The message itself can't be sent (an address that won't encode, say):
+                    # retrying won't help, and it must not stay claimed
+                    outbox.mark_failed(message_id, e, permanent=True)
+                    totals["failed"] += 1
+                    connection.close()
+                else:
+                    outbox.mark_sent(message_id)
+                    totals["sent"] += 1
+            connection.close()
+        totals["connections"] = connection.opened
+    return totals
+
+
+class OutboxSender:
+    # A background thread that delivers whenever something is queued and
+    # comes back for retries when they are due, so sending never blocks a page
+    def __init__(self, outbox, settings):
+        self.outbox = outbox
+        self.settings = settings
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name="email-outbox", daemon=True).start()
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                deliver(self.outbox, self.settings)
+            except Exception:
+                pass  # each message records its own error; a broken outbox is retried on the next wake
+            due = self.outbox.next_due()
+            self._wake.wait(None if due is None else max(1.0, due - time.time()))
@@ -0,0 +1,286 @@
+import random
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NameResolutionError
+
+# --- CONFIGURATION ---
+USER_AGENT = "Mozilla/5.0 (compatible; OMS-Publisher-Opportunity-Tool/1.0)"
+POOL_HOSTS = 512  # host pools kept alive between requests
+POOL_PER_HOST = 4  # keep-alive connections per host
+MAX_REDIRECTS = 5
+MAX_RESPONSE_BYTES = 1024 * 1024  # ads.txt bodies are cut (at a line break) past this
+MAX_ATTEMPTS = 3  # per fetch, first try included
+RETRY_BUDGET_RATIO = 0.1  # retries per scan, as a share of the domains scanned
+MIN_RETRY_BUDGET = 10
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 4.0
+RETRY_STATUSES = {429, 502, 503, 504}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+READ_CHUNK = 64 * 1024
+
+FetchResult = namedtuple("FetchResult", "url status_code text headers redirects truncated")
+
+
+class RedirectPolicyError(requests.exceptions.TooManyRedirects):
+    pass
+
+
+# --- RETRY BUDGET ---
+class RetryBudget:
+    # Shared by every fetch in one scan so a flaky network can't multiply the
+    # scan's run time: once the budget is spent, failures are final.
+    def __init__(self, total):
+        self.total = max(0, int(total))
+        self.remaining = self.total
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_scan(cls, domain_count):
+        return cls(max(MIN_RETRY_BUDGET, int(domain_count * RETRY_BUDGET_RATIO)))
+
+    def resize(self, total):
+        # Grows (or shrinks) the budget while a scan runs; retries already
+        # spent stay spent
+        with self._lock:
+            total = max(0, int(total))
+            self.remaining = max(0, self.remaining + total - self.total)
+            self.total = total
+
+    def take(self):
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    @property
+    def used(self):
+        return self.total - self.remaining
+
+
+def backoff_delay(attempt):
+    # Full jitter: uniform between 0 and the capped exponential step
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1))))
+
+
+def is_name_resolution_error(exc):
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, NameResolutionError)
+
+
+def is_transient(exc):
+    if isinstance(exc, requests.exceptions.SSLError):
+        return False
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        # DNS failures won't fix themselves within a scan
+        return not is_name_resolution_error(exc)
+    return False
+
+
+class RetryableStatus(requests.exceptions.RequestException):
+    pass
+
+
+# --- REDIRECT POLICY ---
+def root_domain_of(host):
+    host = (host or "").lower().rstrip(".")
+    return host[4:] if host.startswith("www.") else host
+
+
+def in_scope(host, root):
+    host = (host or "").lower().rstrip(".")
+    return host == root or host.endswith("." + root)
+
+
+# --- CLIENT ---
+class HttpClient:
+    # One pooled requests.Session shared by every scan thread: keep-alive
+    # connections (and their TLS sessions) are reused across redirects, www./CDN
+    # hops, retries and repeated scans of the same hosts.
+    def __init__(self, pool_hosts=POOL_HOSTS, per_host=POOL_PER_HOST, max_redirects=MAX_REDIRECTS,
+                 max_bytes=MAX_RESPONSE_BYTES, user_agent=USER_AGENT):
+        self.max_redirects = max_redirects
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=per_host, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def fetch(self, url, timeout, headers=None, telemetry=None, kind="ads_txt", retry_budget=None,
+              max_bytes=None, http_fallback=False):
+        # GET with the redirect policy, retries within the budget, a byte cap and,
+        # if HTTPS fails outright, one plain-HTTP attempt. Raises the HTTPS
+        # error when the fallback fails too.
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if telemetry is None:
+            return self._fetch_with_fallback(url, timeout, headers, retry_budget, max_bytes, http_fallback, None)
+        with telemetry.probe(kind, url) as probe:
+            result = self._fetch_with_fallback(url, timeout, headers, retry_budget, max_bytes, http_fallback, probe)
+            probe.status = result.status_code
+            probe.redirects = result.redirects
+            return result
+
+    def _fetch_with_fallback(self, url, timeout, headers, retry_budget, max_bytes, http_fallback, probe):
+        try:
+            return self._fetch_with_retries(url, timeout, headers, retry_budget, max_bytes, probe)
+        except (requests.exceptions.SSLError, requests.exceptions.ConnectionError) as https_error:
+            if not http_fallback or not url.startswith("https://") or not is_fallback_worthy(https_error):
+                raise
+            try:
+                return self._fetch_with_retries("http://" + url[len("https://"):], timeout, headers,
+                                                None, max_bytes, probe)
+            except requests.exceptions.RequestException:
+                raise https_error
+
+    def _fetch_with_retries(self, url, timeout, headers, retry_budget, max_bytes, probe):
+        attempt = 1
+        while True:
+            try:
+                result = self._fetch_following_redirects(url, timeout, headers, max_bytes, probe)
+                if result.status_code not in RETRY_STATUSES:
+                    return result
+                error = RetryableStatus(f"HTTP {result.status_code}")
+            except requests.exceptions.RequestException as e:
+                if not is_transient(e):
+                    raise
+                error = e
+                result = None
+            if attempt >= MAX_ATTEMPTS or retry_budget is None or not retry_budget.take():
+                if result is not None:
+                    return result
+                raise error
+            if probe is not None:
+                probe.retries += 1
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+    def iter_content(self, url, timeout, telemetry=None, kind="sellers_json", max_bytes=None):
+        # Body chunks as they arrive, under the same redirect policy as fetch(),
+        # for bodies too large to hold whole. No retries or HTTP fallback: a
+        # stream can't be replayed once chunks have been handed out. Past
+        # max_bytes the stream just ends.
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if telemetry is None:
+            yield from self._iter_capped(url, timeout, max_bytes, None)
+            return
+        with telemetry.probe(kind, url) as probe:
+            yield from self._iter_capped(url, timeout, max_bytes, probe)
+
+    def _iter_capped(self, url, timeout, max_bytes, probe):
+        response, redirects, headers_at = self._open_following_redirects(url, timeout, None, probe)
+        if probe is not None:
+            probe.status = response.status_code
+            probe.redirects = redirects
+        size = 0
+        try:
+            for chunk in response.iter_content(READ_CHUNK):
+                if max_bytes and size + len(chunk) > max_bytes:
+                    chunk = chunk[:max_bytes - size]
+                size += len(chunk)
+                if probe is not None:
+                    probe.bytes = size
+                yield chunk
+                if max_bytes and size >= max_bytes:
+                    break
+        finally:
+            response.close()
+            if probe is not None:
+                probe.transfer += time.perf_counter() - headers_at
+
+    def _fetch_following_redirects(self, url, timeout, headers, max_bytes, probe):
+        response, redirects, headers_at = self._open_following_redirects(url, timeout, headers, probe)
+        body, truncated = read_capped(response, max_bytes)
+        if probe is not None:
+            probe.transfer += time.perf_counter() - headers_at
+            probe.bytes = len(body)  # bytes read, not characters decoded
+        encoding = response.encoding or "utf-8"
+        text = body.decode(encoding, errors="replace")
+        if truncated:
+            text = text.rsplit("\n", 1)[0]  # drop the cut-off last line
+        return FetchResult(response.url, response.status_code, text, response.headers, redirects, truncated)
+
+    def _open_following_redirects(self, url, timeout, headers, probe):
+        # (streaming response, redirect count, time the final headers arrived)
+        root = root_domain_of(urlsplit(url).hostname)
+        redirects = 0
+        while True:
+            hop_started = time.perf_counter()
+            setup_before = probe_setup_time(probe)
+            response = self.session.get(url, timeout=timeout, headers=headers, allow_redirects=False, stream=True)
+            headers_at = time.perf_counter()
+            if probe is not None:
+                probe.ttfb += max(0.0, headers_at - hop_started - (probe_setup_time(probe) - setup_before))
+
+            if response.status_code in REDIRECT_STATUSES and response.headers.get("Location"):
+                response.close()
+                target = urljoin(url, response.headers["Location"])
+                redirects += 1
+                if redirects > self.max_redirects:
+                    raise RedirectPolicyError(f"Exceeded {self.max_redirects} redirects")
+                if urlsplit(target).scheme not in ("http", "https"):
+                    raise RedirectPolicyError(f"Redirect to unsupported URL {target}")
+                # ads.txt spec: hops may stay within the original root domain;
+                # only a single hop may leave it, and a host outside it that
+                # redirects again (even back) makes the response an error
+                if not in_scope(urlsplit(url).hostname, root):
+                    raise RedirectPolicyError(f"More than one redirect outside {root}")
+                url = target
+                continue
+
+            return response, redirects, headers_at
+
+
+def probe_setup_time(probe):
+    return (probe.dns + probe.connect + probe.tls) if probe is not None else 0.0
+
+
+def is_fallback_worthy(exc):
+    # Plain HTTP only helps when the HTTPS side is broken, not when the name
+    # doesn't resolve at all
+    if isinstance(exc, requests.exceptions.SSLError):
+        return True
+    return not is_name_resolution_error(exc)
+
+
+def read_capped(response, max_bytes):
+    if not max_bytes:
+        return response.content, False
+    chunks = []
+    size = 0
+    truncated = False
+    try:
+        for chunk in response.iter_content(READ_CHUNK):
+            if size + len(chunk) > max_bytes:
+                chunks.append(chunk[:max_bytes - size])
+                truncated = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+    finally:
+        if truncated:
+            response.close()  # don't drain the rest; the connection is dropped
+    return b"".join(chunks), truncated
+
+
+# --- SHARED CLIENT ---
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_default_client():
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
@@ -0,0 +1,132 @@
+from ads_txt import DIRECT, direct_line_ad_system
+from domain_names import normalize_domain
+from pipeline import build_pipeline, STAGE_RULES
+from scanner import (
+    count_fetch_outcome, evaluate_rules, iter_fetch, OMS_AD_SYSTEM, REASON_NO_DIRECT, REASON_OMS_BUYING,
+    REASON_NOT_RANKED
+)
+
+
+# --- INVERTED ads.txt INDEX ---
+class AdsTxtIndex:
+    # ad system domain -> account ID -> domains whose ads.txt has that DIRECT
+    # line, built from every fetched file so each publisher's rules become set
+    # operations. Only ad systems some publisher asks about (plus OMS) are
+    # indexed; other lines are never looked up and would only cost memory.
+    def __init__(self, ad_systems=None):
+        self.ad_systems = {a.lower() for a in ad_systems} if ad_systems is not None else None
+        self.direct = {}
+        self.direct_by_system = {}
+        self.errors = {}
+        self.fetched = set()
+
+    def add(self, domain, parsed):
+        self.fetched.add(domain)
+        for ad_system, records in parsed.records.items():
+            if self.ad_systems is not None and ad_system not in self.ad_systems:
+                continue
+            for record in records:
+                if record.relationship != DIRECT:
+                    continue
+                self.direct.setdefault(ad_system, {}).setdefault(record.account_id, set()).add(domain)
+                self.direct_by_system.setdefault(ad_system, set()).add(domain)
+
+    def add_error(self, domain, reason):
+        self.errors[domain] = reason
+
+    def domains_with_direct(self, ad_system):
+        return self.direct_by_system.get(ad_system.lower(), set())
+
+    def domains_with_account(self, ad_system, account_id):
+        return self.direct.get(ad_system.lower(), {}).get(account_id, set())
+
+    def domains_with_other_account(self, ad_system, account_id):
+        accounts = self.direct.get(ad_system.lower(), {})
+        return set().union(*(domains for account, domains in accounts.items() if account != account_id))
+
+
+# --- PER-PUBLISHER EVALUATION ---
+def evaluate_publisher(index, domains, pub_id, sample_direct_line, tranco_rankings):
+    # Same rule order and skip reasons as scanner.evaluate_rules, answered from the index
+    pub_id = pub_id.strip()
+    has_direct = index.domains_with_direct(direct_line_ad_system(sample_direct_line))
+    oms_buying = index.domains_with_account(OMS_AD_SYSTEM, pub_id)
+    oms_elsewhere = index.domains_with_other_account(OMS_AD_SYSTEM, pub_id)
+
+    results = []
+    skipped_log = []
+    # Keys in the index are normalized names, except domains normalization rejected
+    for domain in dict.fromkeys(normalize_domain(d) or d for d in domains):
+        if domain in index.errors:
+            skipped_log.append((domain, index.errors[domain]))
+        elif domain not in has_direct:
+            skipped_log.append((domain, REASON_NO_DIRECT))
+        elif domain in oms_buying:
+            skipped_log.append((domain, REASON_OMS_BUYING))
+        else:
+            rank = tranco_rankings.get(domain.lower())
+            if rank is None:
+                skipped_log.append((domain, REASON_NOT_RANKED))
+            else:
+                results.append({
+                    "Domain": domain,
+                    "Tranco Rank": rank,
+                    "OMS Buying": "Yes" if domain in oms_elsewhere else "No"
+                })
+    return results, skipped_log
+
+
+# --- MULTI-PUBLISHER SCAN ---
+def scan_publishers(publishers, tranco_rankings, on_progress=None, pipeline=None, **fetch_options):
+    # publishers: list of dicts with "domains", "pub_id" and "sample_direct_line".
+    # The union of their domains goes through the cheap pipeline stages once,
+    # then every remaining ads.txt is fetched exactly once.
+    # on_progress(done, total, domain, opportunities) gets the opportunities
+    # found so far across all publishers.
+    # Returns one (results, skipped_log) pair per publisher, in input order.
+    if pipeline is None:
+        pipeline = build_pipeline(tranco_rankings, health=fetch_options.get("health"))
+    union = set()
+    ad_systems = {OMS_AD_SYSTEM}
+    listed_by = {}  # normalized domain -> (pub_id, direct ad system) of each publisher listing it
+    for publisher in publishers:
+        union |= set(publisher["domains"])
+        ad_system = direct_line_ad_system(publisher["sample_direct_line"])
+        ad_systems.add(ad_system)
+        for domain in {normalize_domain(d) or d for d in publisher["domains"]}:
+            listed_by.setdefault(domain, []).append((publisher["pub_id"].strip(), ad_system))
+
+    index = AdsTxtIndex(ad_systems)
+    queue, skipped = pipeline.filter(union)
+    total = len(queue) + len(skipped)
+    for done, (domain, reason) in enumerate(skipped, start=1):
+        index.add_error(domain, reason)
+        if on_progress is not None:
+            on_progress(done, total, domain, 0)
+
+    opportunities = 0
+    for done, (domain, parsed, reason) in enumerate(iter_fetch(queue, **fetch_options), start=len(skipped) + 1):
+        count_fetch_outcome(pipeline, parsed, reason)
+        if parsed is None:
+            index.add_error(domain, reason)
+        else:
+            index.add(domain, parsed)
+            if on_progress is not None:
+                opportunities += sum(evaluate_rules(domain, parsed, pub_id, ad_system, tranco_rankings)[0] is not None
+                                     for pub_id, ad_system in listed_by.get(domain, ()))
+        if on_progress is not None:
+            on_progress(done, total, domain, opportunities)
+
+    outcomes = [
+        evaluate_publisher(index, publisher["domains"], publisher["pub_id"],
+                           publisher["sample_direct_line"], tranco_rankings)
+        for publisher in publishers
+    ]
+    # Rules run per publisher: a fetched domain is counted once per publisher listing it
+    for results, skipped_log in outcomes:
+        for _ in results:
+            pipeline.count(STAGE_RULES, False)
+        for domain, _ in skipped_log:
+            if domain in index.fetched:
+                pipeline.count(STAGE_RULES, True)
+    return outcomes
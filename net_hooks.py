@@ -0,0 +1,130 @@
+import socket
+import threading
+import time
+
+import urllib3.connection
+from urllib3.exceptions import LocationParseError
+from urllib3.util import connection as urllib3_connection
+
+# --- CONNECTION-LEVEL HOOKS ---
+# requests/urllib3 only report total elapsed time. To split a fetch into DNS,
+# TCP connect and TLS handshake, urllib3's create_connection and
+# ssl_wrap_socket are swapped for timed versions. They only record anything
+# while a probe is active on the current thread; otherwise they behave
+# exactly like the originals.
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+_original_ssl_wrap_socket = urllib3.connection.ssl_wrap_socket
+_DEFAULT_TIMEOUT = getattr(urllib3_connection, "_DEFAULT_TIMEOUT", socket._GLOBAL_DEFAULT_TIMEOUT)
+
+
+def current_probe():
+    return getattr(_local, "probe", None)
+
+
+def set_probe(probe):
+    _local.probe = probe
+
+
+def system_resolve(host, port, family):
+    return socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+
+
+_resolver = system_resolve
+_dns_cache = None
+
+
+def set_resolver(resolver):
+    # resolver(host, port, family) -> getaddrinfo-style list. Lets tests and
+    # benchmarks point hostnames at local servers; None restores the system one.
+    global _resolver
+    _resolver = resolver or system_resolve
+
+
+def set_dns_cache(cache):
+    # cache.addrinfo(host, port, family) -> getaddrinfo-style list or None.
+    # Hosts it has fresh addresses for (the DNS pipeline stage fills it) skip
+    # the system lookup; None turns it off.
+    global _dns_cache
+    _dns_cache = cache
+
+
+def resolve(host, port, family):
+    # A resolver set with set_resolver wins over the cache, so tests and
+    # benchmarks keep routing hosts to their local servers
+    if _dns_cache is not None and _resolver is system_resolve:
+        addresses = _dns_cache.addrinfo(host, port, family)
+        if addresses:
+            return addresses
+    return _resolver(host, port, family)
+
+
+def timed_create_connection(address, timeout=_DEFAULT_TIMEOUT, source_address=None, socket_options=None):
+    # Same behaviour as urllib3.util.connection.create_connection, with the
+    # name resolution and the connect loop timed separately.
+    probe = current_probe()
+    host, port = address
+    if host.startswith("["):
+        host = host.strip("[]")
+    try:
+        host.encode("idna")
+    except UnicodeError:
+        raise LocationParseError(f"'{host}', label empty or too long") from None
+
+    started = time.perf_counter()
+    try:
+        addresses = resolve(host, port, urllib3_connection.allowed_gai_family())
+    finally:
+        resolved = time.perf_counter()
+        if probe is not None:
+            probe.dns += resolved - started
+
+    err = None
+    try:
+        for af, socktype, proto, _, sa in addresses:
+            sock = None
+            try:
+                sock = socket.socket(af, socktype, proto)
+                urllib3_connection._set_socket_options(sock, socket_options)
+                if timeout is not _DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sa)
+                err = None
+                if probe is not None:
+                    probe.connections += 1
+                return sock
+            except OSError as e:
+                err = e
+                if sock is not None:
+                    sock.close()
+        if err is not None:
+            raise err
+        raise OSError("getaddrinfo returns an empty list")
+    finally:
+        if probe is not None:
+            probe.connect += time.perf_counter() - resolved
+        err = None
+
+
+def timed_ssl_wrap_socket(*args, **kwargs):
+    probe = current_probe()
+    started = time.perf_counter()
+    try:
+        return _original_ssl_wrap_socket(*args, **kwargs)
+    finally:
+        if probe is not None:
+            probe.tls += time.perf_counter() - started
+
+
+def install_network_hooks():
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        urllib3_connection.create_connection = timed_create_connection
+        urllib3.connection.ssl_wrap_socket = timed_ssl_wrap_socket
+        _installed = True
@@ -0,0 +1,213 @@
+from collections import Counter
+
+from dns_resolver import DNS_NXDOMAIN, DNS_NO_ADDRESS
+from domain_health import unreachable_reason
+from domain_names import normalize_domain, normalize_domains
+
+# --- CONFIGURATION ---
+STAGE_NORMALIZE = "normalize"
+STAGE_DEDUP = "dedup"
+STAGE_DOMAIN_LIST = "domain_list"
+STAGE_RANK = "rank"
+STAGE_HEALTH = "negative_cache"
+STAGE_DNS = "dns"
+STAGE_FETCH = "fetch"
+STAGE_PARSE = "parse"
+STAGE_RULES = "rules"
+
+STAGE_LABELS = {
+    STAGE_NORMALIZE: "Normalization",
+    STAGE_DEDUP: "Deduplication",
+    STAGE_DOMAIN_LIST: "Allow/deny list",
+    STAGE_RANK: "Tranco rank",
+    STAGE_HEALTH: "Recently unreachable",
+    STAGE_DNS: "DNS resolution",
+    STAGE_FETCH: "ads.txt fetch",
+    STAGE_PARSE: "ads.txt parse",
+    STAGE_RULES: "Opportunity rules",
+}
+
+REASON_INVALID_DOMAIN = "Invalid domain name"
+REASON_DENY_LIST = "On the deny list"
+REASON_NOT_ALLOWED = "Not on the allow list"
+REASON_NOT_RANKED = "Not in Tranco top list"
+REASON_NXDOMAIN = "DNS: no such domain"
+REASON_NO_ADDRESS = "DNS: no address records"
+
+DNS_REASONS = {DNS_NXDOMAIN: REASON_NXDOMAIN, DNS_NO_ADDRESS: REASON_NO_ADDRESS}
+
+
+# --- STAGES ---
+# Each stage takes the domains still in play and returns (kept, dropped), where
+# dropped is a list of (domain, skip reason). A None reason removes the domain
+# without a skip-report entry (a duplicate is not a separate domain).
+class NormalizeStage:
+    name = STAGE_NORMALIZE
+
+    def apply(self, domains):
+        kept, dropped = [], []
+        for domain, normalized in zip(domains, normalize_domains(domains)):
+            if normalized is None:
+                dropped.append((domain, REASON_INVALID_DOMAIN))
+            else:
+                kept.append(normalized)
+        return kept, dropped
+
+
+class DedupStage:
+    name = STAGE_DEDUP
+
+    def apply(self, domains):
+        kept = list(dict.fromkeys(domains))
+        return kept, [(None, None)] * (len(domains) - len(kept))
+
+
+class DomainListStage:
+    # Deny always wins; an allow list, when given, is exhaustive. Entries match
+    # the domain itself and any of its subdomains.
+    name = STAGE_DOMAIN_LIST
+
+    def __init__(self, allow=None, deny=None):
+        self.allow = {d for d in map(normalize_domain, allow or []) if d} or None
+        self.deny = {d for d in map(normalize_domain, deny or []) if d}
+
+    @staticmethod
+    def _listed(domain, entries):
+        labels = domain.split(".")
+        return any(".".join(labels[i:]) in entries for i in range(len(labels) - 1))
+
+    def apply(self, domains):
+        kept, dropped = [], []
+        for domain in domains:
+            if self.deny and self._listed(domain, self.deny):
+                dropped.append((domain, REASON_DENY_LIST))
+            elif self.allow is not None and not self._listed(domain, self.allow):
+                dropped.append((domain, REASON_NOT_ALLOWED))
+            else:
+                kept.append(domain)
+        return kept, dropped
+
+
+class RankStage:
+    # One batch lookup when the rankings support it (the Tranco index view,
+    # which also falls back to the registrable domain), otherwise a
+    # dictionary-style lookup per domain; `max_rank` narrows the list's own
+    # threshold further (e.g. only the top 50,000).
+    name = STAGE_RANK
+
+    def __init__(self, tranco_rankings, max_rank=None):
+        self.tranco_rankings = tranco_rankings
+        self.max_rank = max_rank or None
+
+    def apply(self, domains):
+        kept, dropped = [], []
+        if hasattr(self.tranco_rankings, "get_many"):
+            ranks = self.tranco_rankings.get_many(domains)
+        else:
+            ranks = [self.tranco_rankings.get(domain) for domain in domains]
+        for domain, rank in zip(domains, ranks):
+            if rank is None:
+                dropped.append((domain, REASON_NOT_RANKED))
+            elif self.max_rank is not None and rank > self.max_rank:
+                dropped.append((domain, f"Ranked below the top {self.max_rank:,}"))
+            else:
+                kept.append(domain)
+        return kept, dropped
+
+
+class HealthStage:
+    # Domains still backing off after transport failures are skipped, or with
+    # `reprobe` moved behind everything else so they are fetched last.
+    name = STAGE_HEALTH
+
+    def __init__(self, health, reprobe=False):
+        self.health = health
+        self.reprobe = reprobe
+
+    def apply(self, domains):
+        unreachable = self.health.unreachable(domains)
+        if not unreachable:
+            return domains, []
+        healthy = [d for d in domains if d not in unreachable]
+        tail = [d for d in domains if d in unreachable]
+        if self.reprobe:
+            return healthy + tail, []
+        return healthy, [(d, unreachable_reason(unreachable[d])) for d in tail]
+
+
+class DnsStage:
+    # The whole remaining list is resolved at once, with every lookup in
+    # flight together, before any HTTP work. Domains that don't exist or
+    # have no address are dropped; a lookup that times out or fails is kept
+    # and left to the fetch. Answers stay in the resolver's cache, which the
+    # fetcher's connections read.
+    name = STAGE_DNS
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+
+    def apply(self, domains):
+        answers = self.resolver.resolve_many(domains)
+        kept, dropped = [], []
+        for domain in domains:
+            answer = answers.get(domain)
+            reason = DNS_REASONS.get(answer.status) if answer is not None else None
+            if reason is None:
+                kept.append(domain)
+            else:
+                dropped.append((domain, reason))
+        return kept, dropped
+
+
+# --- PIPELINE ---
+class ScanPipeline:
+    # The cheap, network-free stages run over the whole domain list before a
+    # single request is made; fetch, parse and rules are counted as results
+    # come back from the scanner. `entered`/`removed` accumulate across calls,
+    # so a resumed or batched scan keeps one running tally.
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.entered = Counter()
+        self.removed = Counter()
+
+    def filter(self, domains):
+        kept = list(domains)
+        skipped = []
+        for stage in self.stages:
+            self.entered[stage.name] += len(kept)
+            kept, dropped = stage.apply(kept)
+            self.removed[stage.name] += len(dropped)
+            skipped.extend((domain, reason) for domain, reason in dropped if reason is not None)
+        return kept, skipped
+
+    def count(self, stage, removed):
+        self.entered[stage] += 1
+        if removed:
+            self.removed[stage] += 1
+
+    @property
+    def stage_names(self):
+        return [stage.name for stage in self.stages] + [STAGE_FETCH, STAGE_PARSE, STAGE_RULES]
+
+    def report(self):
+        return [
+            {"Stage": STAGE_LABELS.get(name, name), "In": self.entered[name], "Removed": self.removed[name],
+             "Out": self.entered[name] - self.removed[name]}
+            for name in self.stage_names
+        ]
+
+
+def build_pipeline(tranco_rankings, health=None, reprobe_unreachable=False, max_rank=None, allow=None, deny=None,
+                   dns_resolver=None):
+    # Ordered by cost: string work, then set and index lookups, then one
+    # SQLite query, then (with a resolver) one concurrent round of DNS
+    # lookups; the ads.txt fetches come after all of them.
+    stages = [NormalizeStage(), DedupStage()]
+    if allow or deny:
+        stages.append(DomainListStage(allow, deny))
+    stages.append(RankStage(tranco_rankings, max_rank))
+    if health is not None:
+        stages.append(HealthStage(health, reprobe_unreachable))
+    if dns_resolver is not None:
+        stages.append(DnsStage(dns_resolver))
+    return ScanPipeline(stages)
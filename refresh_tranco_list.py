@@ -1,29 +1,19 @@
-def download_latest_tranco_csv(output_file="/tmp/top-1m.csv"):
-    try:
-        # Fetch homepage
-        homepage = requests.get("https://tranco-list.eu/")
-        if homepage.status_code != 200:
-            st.error(f"Failed to fetch Tranco homepage: HTTP {homepage.status_code}")
-            return False
+import streamlit as st
 
-        # Extract first list ID from homepage
-        match = re.search(r'href=\"/list/([A-Z0-9]{5})\"', homepage.text)
-        if not match:
-            st.error("Could not extract latest Tranco list ID from homepage.")
-            return False
+from tranco_download import download_tranco_list, latest_list_id, tranco_download_url
+from tranco_index import index_path_for
 
-        list_id = match.group(1)
-        download_url = f"https://tranco-list.eu/download/{list_id}/1000000"
 
-        response = requests.get(download_url)
-        if response.status_code == 200:
-            with open(output_file, "wb") as f:
-                f.write(response.content)
-            st.success(f"✅ Downloaded Tranco list (ID: {list_id})")
-            return True
-        else:
-            st.error(f"Failed to download Tranco CSV: HTTP {response.status_code}")
-            return False
+def download_latest_tranco_csv(output_file="/tmp/top-1m.csv"):
+    try:
+        list_id = latest_list_id()
+        rows = download_tranco_list(
+            tranco_download_url(list_id, 1000000),
+            output_file,
+            index_path=index_path_for(list_id)
+        )
+        st.success(f"✅ Downloaded Tranco list (ID: {list_id}, {rows:,} domains)")
+        return True
 
     except Exception as e:
         st.error(f"Error downloading Tranco list: {e}")
@@ -0,0 +1,70 @@
+import io
+from importlib.util import find_spec
+
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURATION ---
+HIGHLIGHT_RANK = 50000  # rows ranked at or above this are highlighted
+HIGHLIGHT_STYLE = "background-color: #d4edda"
+PAGE_SIZE = 100
+EXCEL_ENGINES = ("xlsxwriter", "openpyxl")
+
+
+# --- TABLE VIEW ---
+class ResultsView:
+    # One results table prepared for display: the highlight flags are worked
+    # out once, and sorted orders are kept per column, so paging and
+    # re-sorting only ever slice arrays. Only the visible page is styled.
+    def __init__(self, df, highlight_rank=HIGHLIGHT_RANK):
+        self.df = df.reset_index(drop=True)
+        if "Tranco Rank" in self.df.columns:
+            self.highlight = (self.df["Tranco Rank"] <= highlight_rank).to_numpy(dtype=bool, na_value=False)
+        else:
+            self.highlight = np.zeros(len(self.df), dtype=bool)
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def pages(self, page_size=PAGE_SIZE):
+        return max(1, -(-len(self.df) // page_size))
+
+    def order(self, column=None, ascending=True):
+        if column is None or column not in self.df.columns:
+            return np.arange(len(self.df))
+        if (column, ascending) not in self._orders:
+            # Missing values (no trend data, say) always sort last
+            order = self.df[column].sort_values(ascending=ascending, kind="stable", na_position="last").index
+            self._orders[column, ascending] = order.to_numpy()
+        return self._orders[column, ascending]
+
+    def page(self, number=1, page_size=PAGE_SIZE, sort_by=None, ascending=True):
+        # (rows of page `number`, their highlight flags); pages count from 1
+        rows = self.order(sort_by, ascending)[(number - 1) * page_size:number * page_size]
+        return self.df.iloc[rows], self.highlight[rows]
+
+    def styled_page(self, number=1, page_size=PAGE_SIZE, sort_by=None, ascending=True):
+        rows, highlight = self.page(number, page_size, sort_by, ascending)
+        styles = np.where(highlight[:, None], HIGHLIGHT_STYLE, "")
+        styles = pd.DataFrame(np.broadcast_to(styles, rows.shape), index=rows.index, columns=rows.columns)
+        return rows.style.apply(lambda _: styles, axis=None)
+
+
+# --- EXPORTS ---
+def excel_engine():
+    # Excel export needs one of the optional writer packages
+    return next((engine for engine in EXCEL_ENGINES if find_spec(engine)), None)
+
+
+def export_bytes(df, kind):
+    # "csv", "xlsx" or "html" (the email table)
+    if kind == "csv":
+        return df.to_csv(index=False).encode("utf-8")
+    if kind == "xlsx":
+        buffer = io.BytesIO()
+        df.to_excel(buffer, index=False, engine=excel_engine())
+        return buffer.getvalue()
+    if kind == "html":
+        return df.to_html(index=False, border=1, justify="center", classes="styled-table", na_rep="").encode("utf-8")
+    raise ValueError(f"Unknown export format {kind!r}")
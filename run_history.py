@@ -0,0 +1,238 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from ads_txt import content_hash
+
+# --- CONFIGURATION ---
+RUN_HISTORY_FILE = "/tmp/run_history.sqlite"
+FLUSH_EVERY = 500  # outcomes buffered before they are written
+
+PriorOutcome = namedtuple("PriorOutcome", "domain content_hash rank result reason")
+RunInfo = namedtuple("RunInfo", "run_id publisher name pub_id started finished domains opportunities reused complete")
+RunDiff = namedtuple("RunDiff", "new lost previous_run")
+
+
+def publisher_key(name, pub_id):
+    # Same key the app has always used for a publisher's history entry
+    return f"{(name or 'Manual')}_{pub_id}"
+
+
+def rules_key(pub_id, direct_ad_system):
+    # A stored outcome is only valid for the rule inputs it was evaluated with
+    return f"{pub_id.strip()}|{direct_ad_system.strip().lower()}"
+
+
+class RunHistory:
+    # Durable record of every scan: one row per run, the opportunities it
+    # found, and the latest outcome per publisher and domain together with the
+    # ads.txt content hash and Tranco rank it was evaluated against. Shared
+    # through one SQLite file, like the ads.txt cache.
+    def __init__(self, path=RUN_HISTORY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                publisher TEXT,
+                name TEXT,
+                pub_id TEXT,
+                started REAL,
+                finished REAL,
+                domains INTEGER,
+                opportunities INTEGER,
+                reused INTEGER,
+                complete INTEGER
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS runs_publisher ON runs (publisher, run_id)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS run_opportunities (
+                run_id INTEGER,
+                domain TEXT,
+                rank INTEGER,
+                oms_buying TEXT,
+                PRIMARY KEY (run_id, domain)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outcomes (
+                publisher TEXT,
+                domain TEXT,
+                rules TEXT,
+                content_hash TEXT,
+                rank INTEGER,
+                result TEXT,
+                reason TEXT,
+                run_id INTEGER,
+                PRIMARY KEY (publisher, domain)
+            )
+        """)
+
+    # --- RUNS ---
+    def start_run(self, publisher, name, pub_id):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO runs (publisher, name, pub_id, started, complete) VALUES (?, ?, ?, ?, 0)",
+                (publisher, name or "", pub_id, time.time())
+            )
+            return cursor.lastrowid
+
+    def finish_run(self, run_id, results, domains, reused=0, complete=True):
+        rows = [(run_id, r["Domain"], int(r["Tranco Rank"]), r["OMS Buying"]) for r in results]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM run_opportunities WHERE run_id = ?", (run_id,))
+            self._conn.executemany("INSERT OR REPLACE INTO run_opportunities VALUES (?, ?, ?, ?)", rows)
+            self._conn.execute(
+                "UPDATE runs SET finished = ?, domains = ?, opportunities = ?, reused = ?, complete = ? "
+                "WHERE run_id = ?",
+                (time.time(), domains, len(rows), reused, int(complete), run_id)
+            )
+            self._conn.execute("COMMIT")
+
+    def save_run(self, name, pub_id, results, domains):
+        # A whole run at once, for scans that don't record per-domain outcomes
+        run_id = self.start_run(publisher_key(name, pub_id), name, pub_id)
+        self.finish_run(run_id, results, domains)
+        return run_id
+
+    def recent_runs(self, limit=10):
+        # Latest complete run per publisher, newest first
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id, publisher, name, pub_id, started, finished, domains, opportunities, reused, complete "
+                "FROM runs WHERE run_id IN (SELECT MAX(run_id) FROM runs WHERE complete = 1 GROUP BY publisher) "
+                "ORDER BY run_id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [RunInfo(*row) for row in rows]
+
+    def last_run(self, publisher, before=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id, publisher, name, pub_id, started, finished, domains, opportunities, reused, complete "
+                "FROM runs WHERE publisher = ? AND complete = 1 AND run_id < ? ORDER BY run_id DESC LIMIT 1",
+                (publisher, before if before is not None else 2 ** 62)
+            ).fetchone()
+        return RunInfo(*row) if row else None
+
+    def run_results(self, run_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT domain, rank, oms_buying FROM run_opportunities WHERE run_id = ? ORDER BY rank", (run_id,)
+            ).fetchall()
+        return [{"Domain": domain, "Tranco Rank": rank, "OMS Buying": oms_buying} for domain, rank, oms_buying in rows]
+
+    def diff(self, run_id):
+        # Opportunities this run found that the publisher's previous complete
+        # run didn't (new), and the other way round (lost)
+        with self._lock:
+            publisher = self._conn.execute("SELECT publisher FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        previous = self.last_run(publisher[0], before=run_id) if publisher else None
+        if previous is None:
+            return None
+        current = {r["Domain"]: r for r in self.run_results(run_id)}
+        before = {r["Domain"]: r for r in self.run_results(previous.run_id)}
+        return RunDiff(
+            [current[d] for d in current if d not in before],
+            [before[d] for d in before if d not in current],
+            previous
+        )
+
+    # --- PER-DOMAIN OUTCOMES ---
+    def prior_outcomes(self, publisher, rules):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT domain, content_hash, rank, result, reason FROM outcomes WHERE publisher = ? AND rules = ?",
+                (publisher, rules)
+            ).fetchall()
+        return {
+            domain: PriorOutcome(domain, content_hash, rank, json.loads(result) if result else None, reason)
+            for domain, content_hash, rank, result, reason in rows
+        }
+
+    def record_outcomes(self, publisher, rules, run_id, outcomes):
+        # outcomes: (domain, content_hash, rank, result_row, reason)
+        rows = [
+            (publisher, domain, rules, content_hash, rank, json.dumps(result) if result is not None else None,
+             reason, run_id)
+            for domain, content_hash, rank, result, reason in outcomes
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM runs")
+            self._conn.execute("DELETE FROM run_opportunities")
+            self._conn.execute("DELETE FROM outcomes")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- ONE RUN ---
+class RunRecorder:
+    # Records one scan as it runs. With `refresh`, the publisher's stored
+    # outcomes are loaded first: a domain whose ads.txt hash is unchanged keeps
+    # its stored outcome (with its current rank) instead of being evaluated
+    # again, and one whose cached ads.txt is still fresh isn't even fetched.
+    def __init__(self, history, name, pub_id, direct_ad_system, refresh=False):
+        self.history = history
+        self.publisher = publisher_key(name, pub_id)
+        self.rules = rules_key(pub_id, direct_ad_system)
+        self.previous = history.prior_outcomes(self.publisher, self.rules) if refresh else {}
+        self.run_id = history.start_run(self.publisher, name, pub_id)
+        self.reused = 0
+        self.changed = 0  # domains from the last run whose ads.txt changed since
+        self._pending = []
+
+    def reuse(self, domain, content_hash, rank):
+        # (result_row, reason) carried over from the last run, or None if the
+        # domain has to be evaluated
+        prior = self.previous.get(domain)
+        if prior is None or content_hash is None or prior.content_hash != content_hash:
+            if prior is not None:
+                self.changed += 1
+            return None
+        self.reused += 1
+        if prior.result is None:
+            return None, prior.reason
+        return dict(prior.result, **{"Tranco Rank": rank}), None
+
+    def reuse_cached(self, domain, cache, rank):
+        # (result_row, reason, content_hash) for a domain whose ads.txt is
+        # fresh in `cache` and unchanged since the last run, or None if it
+        # has to be fetched
+        prior = self.previous.get(domain)
+        if prior is None or prior.content_hash is None or cache is None:
+            return None
+        entry = cache.get(domain)
+        if not cache.is_fresh(entry) or content_hash(entry.body) != prior.content_hash:
+            return None
+        result, reason = self.reuse(domain, prior.content_hash, rank)
+        return result, reason, prior.content_hash
+
+    def record(self, domain, result, reason, content_hash=None, rank=None):
+        self._pending.append((domain, content_hash, rank, result, reason))
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.history.record_outcomes(self.publisher, self.rules, self.run_id, self._pending)
+            self._pending = []
+
+    def finish(self, results, domains, complete=True):
+        # `results` is the scan's full result list (a resumed scan included)
+        self.flush()
+        self.history.finish_run(self.run_id, results, domains, self.reused, complete)
+        return self.history.diff(self.run_id) if complete else None
@@ -0,0 +1,133 @@
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+
+# --- CONFIGURATION ---
+CHECKPOINT_DIR = "/tmp/oms_scan_checkpoints"
+CHECKPOINT_INTERVAL = 5.0  # seconds between saves while a scan is running
+
+
+# --- SCAN CHECKPOINTS ---
+class ScanCheckpoint:
+    # Everything needed to show partial results and to resume a scan later:
+    # the full domain list, what has been checked so far and its outcome.
+    def __init__(self, key, pub_name, pub_id, sample_direct_line, mode, domains,
+                 results=None, skipped_log=None, started=None, directory=CHECKPOINT_DIR):
+        self.key = key
+        self.pub_name = pub_name
+        self.pub_id = pub_id
+        self.sample_direct_line = sample_direct_line
+        self.mode = mode
+        self.domains = sorted(domains)
+        self._listed = set(self.domains)
+        self.results = list(results or [])
+        self.skipped_log = [tuple(entry) for entry in (skipped_log or [])]
+        self.started = started or datetime.now().isoformat(timespec="seconds")
+        self.directory = directory
+        self.checked = {r["Domain"] for r in self.results} | {domain for domain, _ in self.skipped_log}
+        self._last_save = 0.0
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"{checkpoint_slug(self.key)}.json")
+
+    @property
+    def done(self):
+        return len(self.checked)
+
+    @property
+    def total(self):
+        return len(self.domains)
+
+    def remaining(self):
+        return [domain for domain in self.domains if domain not in self.checked]
+
+    def add_domains(self, domains):
+        # Domains that turn up while the scan is already running (a streamed
+        # sellers.json); ones already listed are ignored
+        for domain in domains:
+            if domain not in self._listed:
+                self._listed.add(domain)
+                self.domains.append(domain)
+
+    def record(self, domain, result, reason):
+        self.checked.add(domain)
+        if result is not None:
+            self.results.append(result)
+        else:
+            self.skipped_log.append((domain, reason))
+
+    def save_if_due(self, interval=CHECKPOINT_INTERVAL):
+        if time.time() - self._last_save >= interval:
+            self.save()
+            return True
+        return False
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        payload = {
+            "key": self.key,
+            "pub_name": self.pub_name,
+            "pub_id": self.pub_id,
+            "sample_direct_line": self.sample_direct_line,
+            "mode": self.mode,
+            "domains": self.domains,
+            "results": self.results,
+            "skipped_log": self.skipped_log,
+            "started": self.started,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".checkpoint_", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+        self._last_save = time.time()
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            data["key"], data.get("pub_name", ""), data["pub_id"], data["sample_direct_line"],
+            data.get("mode", ""), data["domains"], data.get("results"), data.get("skipped_log"),
+            data.get("started"), directory=os.path.dirname(path)
+        )
+
+
+def checkpoint_slug(key):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", key).strip("_") or "scan"
+
+
+def list_checkpoints(directory=CHECKPOINT_DIR):
+    # Newest first; unreadable files are skipped rather than breaking the sidebar
+    if not os.path.isdir(directory):
+        return []
+    checkpoints = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            checkpoints.append((os.path.getmtime(path), ScanCheckpoint.load(path)))
+        except (OSError, ValueError, KeyError):
+            continue
+    return [checkpoint for _, checkpoint in sorted(checkpoints, key=lambda item: item[0], reverse=True)]
+
+
+# --- PROGRESS READOUT ---
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
@@ -0,0 +1,451 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import pandas as pd
+
+from ads_cache import AdsTxtCache, ADS_CACHE_FILE
+from ads_txt import direct_line_ad_system
+from dns_resolver import shared_resolver
+from domain_health import DomainHealth, DOMAIN_HEALTH_FILE
+from domain_names import normalize_domain
+from domain_sources import iter_domain_batches, publisher_domains, read_publishers, DomainSourceError, NoSellersFieldError
+from multi_scan import scan_publishers
+from pipeline import build_pipeline
+from run_history import RunHistory, RunRecorder, RUN_HISTORY_FILE
+from scan_checkpoint import ScanCheckpoint, CHECKPOINT_DIR
+from scanner import iter_scan, iter_scan_batches, results_frame, RESULT_COLUMNS, SKIPPED_COLUMNS
+from telemetry import ScanTelemetry
+from tranco_index import TrancoIndex
+
+# --- CONFIGURATION ---
+JOB_STORE_FILE = "/tmp/oms_scan_jobs.sqlite"
+JOB_DIR = "/tmp/oms_scan_jobs"
+MAX_JOB_WORKERS = 3  # scans running at once on this deployment; more wait in the queue
+PROGRESS_INTERVAL = 1.0  # seconds between progress writes (and cancel checks) from a running job
+
+KIND_SINGLE = "single"
+KIND_MULTI = "multi"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+STATUS_INTERRUPTED = "interrupted"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+Job = namedtuple("Job", "job_id kind label status submitted started finished done total opportunities error "
+                        "checkpoint_path result_path cancel_requested")
+
+_JOB_COLUMNS = ", ".join(Job._fields)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# --- JOB TABLE ---
+class JobStore:
+    # Every scan submitted on this deployment, whoever submitted it. The UI
+    # polls it for status and progress; workers in other processes write to it.
+    def __init__(self, path=JOB_STORE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT,
+                label TEXT,
+                status TEXT,
+                submitted REAL,
+                started REAL,
+                finished REAL,
+                done INTEGER DEFAULT 0,
+                total INTEGER DEFAULT 0,
+                opportunities INTEGER DEFAULT 0,
+                error TEXT,
+                checkpoint_path TEXT,
+                result_path TEXT,
+                cancel_requested INTEGER DEFAULT 0,
+                params TEXT,
+                server_pid INTEGER,
+                worker_pid INTEGER
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_submitted ON jobs (submitted)")
+
+    def submit(self, kind, label, params):
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, kind, label, status, submitted, params, server_pid) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, label, STATUS_QUEUED, time.time(), json.dumps(params), os.getpid())
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return Job(*row) if row else None
+
+    def params(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT params FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_jobs(self, limit=20):
+        # Active jobs first, then the most recently submitted
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs "
+                f"ORDER BY status IN ('{STATUS_QUEUED}', '{STATUS_RUNNING}') DESC, submitted DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [Job(*row) for row in rows]
+
+    def active_checkpoints(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT checkpoint_path FROM jobs WHERE status IN (?, ?) AND checkpoint_path IS NOT NULL",
+                ACTIVE_STATUSES
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_running(self, job_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started = ?, worker_pid = ? WHERE job_id = ?",
+                (STATUS_RUNNING, time.time(), os.getpid(), job_id)
+            )
+
+    def progress(self, job_id, done, total, opportunities, checkpoint_path=None):
+        # Returns whether a cancel has been requested, so workers poll both at once
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET done = ?, total = ?, opportunities = ?, "
+                "checkpoint_path = COALESCE(?, checkpoint_path) WHERE job_id = ?",
+                (done, total, opportunities, checkpoint_path, job_id)
+            )
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id, status, result_path=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, result_path = ?, error = ? WHERE job_id = ?",
+                (status, time.time(), result_path, error, job_id)
+            )
+
+    def request_cancel(self, job_id):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+
+    def mark_orphans(self):
+        # Jobs whose server or worker process is gone will never finish
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, status, server_pid, worker_pid FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES
+            ).fetchall()
+            orphans = [
+                (time.time(), job_id) for job_id, status, server_pid, worker_pid in rows
+                if not pid_alive(server_pid) or (status == STATUS_RUNNING and not pid_alive(worker_pid))
+            ]
+            self._conn.executemany(
+                f"UPDATE jobs SET status = '{STATUS_INTERRUPTED}', finished = ? WHERE job_id = ?", orphans
+            )
+        return len(orphans)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# --- RUNNER ---
+class JobRunner:
+    # A local process pool: each scan gets its own process (and its own fetch
+    # threads), so a long scan never holds a Streamlit script thread and
+    # several can run side by side. Processes are spawned, not forked, since
+    # the server process is multi-threaded.
+    def __init__(self, store, max_workers=MAX_JOB_WORKERS):
+        self.store = store
+        store.mark_orphans()
+        os.makedirs(JOB_DIR, exist_ok=True)
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn"))
+
+    def submit(self, kind, label, params):
+        job_id = self.store.submit(kind, label, params)
+        self.pool.submit(run_job, job_id, self.store.path)
+        return job_id
+
+
+def job_file(job_id, suffix):
+    return os.path.join(JOB_DIR, f"{job_id}{suffix}")
+
+
+def read_job_result(job):
+    with open(job.result_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# --- WORKER PROCESS ---
+def run_job(job_id, store_path=JOB_STORE_FILE):
+    # An uploaded sellers.json belongs to its job and goes when the job ends,
+    # however it ends (cancelled while still queued included)
+    store = JobStore(store_path)
+    upload = None
+    try:
+        job = store.get(job_id)
+        params = store.params(job_id)
+        upload = params.get("sellers_path")
+        if job.cancel_requested:
+            store.finish(job_id, STATUS_CANCELLED)
+            return
+        store.mark_running(job_id)
+        if job.kind == KIND_MULTI:
+            run_multi_job(store, job_id, params)
+        else:
+            run_single_job(store, job_id, params)
+    except Exception as e:
+        store.finish(job_id, STATUS_FAILED, error=str(e))
+    finally:
+        store.close()
+        if upload:
+            try:
+                os.remove(upload)
+            except FileNotFoundError:
+                pass
+
+
+def scan_context(settings):
+    # Rank view, pipeline and fetch options rebuilt in the worker from the
+    # settings the UI submitted; caches and stores are shared SQLite files
+    tranco_rankings = {}
+    if settings.get("tranco_index"):
+        tranco_rankings = TrancoIndex(settings["tranco_index"]).view(settings.get("threshold"))
+    health = DomainHealth(DOMAIN_HEALTH_FILE) if settings.get("use_health", True) else None
+    pipeline = build_pipeline(
+        tranco_rankings, health=health, reprobe_unreachable=settings.get("reprobe", False),
+        max_rank=settings.get("max_rank"), allow=settings.get("allow"), deny=settings.get("deny"),
+        dns_resolver=shared_resolver(settings.get("dns_server")) if settings.get("use_dns") else None
+    )
+    options = {
+        "max_workers": settings["max_workers"],
+        "per_host": settings["per_host"],
+        "cache": AdsTxtCache(ADS_CACHE_FILE) if settings.get("use_cache", True) else None,
+        "health": health,
+        "telemetry": ScanTelemetry(),
+    }
+    return tranco_rankings, pipeline, options
+
+
+def read_domain_batches(checkpoint, batches, source):
+    # Lists each batch in the checkpoint before the scan sees it. A source that
+    # fails part-way ends the stream; the domains read so far are still scanned.
+    try:
+        for batch in batches:
+            batch = [normalize_domain(d) or d for d in batch]
+            checkpoint.add_domains(batch)
+            yield batch
+    except NoSellersFieldError as e:
+        source["warnings"].append(str(e))
+    except DomainSourceError as e:
+        source["errors"].append(str(e))
+    finally:
+        source["reading"] = False
+
+
+def run_single_job(store, job_id, params):
+    tranco_rankings, pipeline, options = scan_context(params["settings"])
+    telemetry = options["telemetry"]
+    source = {"reading": False, "warnings": [], "errors": []}
+    upload = params.get("sellers_path")
+
+    if params.get("resume"):
+        checkpoint = ScanCheckpoint.load(params["resume"])
+        refresh = False
+    else:
+        # Keyed by job too: two scans of one publisher must never share (or delete) a checkpoint
+        checkpoint = ScanCheckpoint(
+            f"{(params['pub_name'] or 'Manual')}_{params['pub_id']}_{job_id}", params["pub_name"], params["pub_id"],
+            params["sample_direct_line"], params["mode"], [], directory=CHECKPOINT_DIR
+        )
+        refresh = params.get("refresh", False)
+    run = RunRecorder(
+        RunHistory(RUN_HISTORY_FILE), checkpoint.pub_name, checkpoint.pub_id,
+        direct_line_ad_system(checkpoint.sample_direct_line), refresh=refresh
+    )
+
+    sellers_file = open(upload, "rb") if upload else None
+    try:
+        if params.get("resume"):
+            scan = iter_scan(
+                checkpoint.remaining(), checkpoint.pub_id, checkpoint.sample_direct_line, tranco_rankings,
+                pipeline=pipeline, run=run, **options
+            )
+        else:
+            source["reading"] = True
+            batches = iter_domain_batches(
+                params["mode"], params.get("pub_domain", ""), params.get("manual_domains_input", ""), "",
+                telemetry, sellers_file=sellers_file
+            )
+            scan = iter_scan_batches(
+                read_domain_batches(checkpoint, batches, source), checkpoint.pub_id, checkpoint.sample_direct_line,
+                tranco_rankings, pipeline=pipeline, run=run, **options
+            )
+
+        store.progress(job_id, checkpoint.done, checkpoint.total, len(checkpoint.results), checkpoint.path)
+        cancelled = False
+        last_progress = 0.0
+        for domain, result, reason in scan:
+            checkpoint.record(domain, result, reason)
+            checkpoint.save_if_due()
+            if time.time() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.time()
+                if store.progress(job_id, checkpoint.done, checkpoint.total, len(checkpoint.results)):
+                    cancelled = True
+                    break
+        scan.close()
+    finally:
+        if sellers_file is not None:
+            sellers_file.close()
+
+    store.progress(job_id, checkpoint.done, checkpoint.total, len(checkpoint.results))
+    if cancelled:
+        checkpoint.save()  # resumable from the sidebar, like an interrupted scan
+        run.finish(checkpoint.results, checkpoint.total, complete=False)
+        store.finish(job_id, STATUS_CANCELLED)
+        return
+    if not checkpoint.total:
+        store.finish(job_id, STATUS_FAILED,
+                     error=" ".join(source["warnings"] + source["errors"] + ["No valid domains found to check."]))
+        return
+
+    diff = run.finish(checkpoint.results, checkpoint.total)
+    result_path = write_job_result(job_id, {
+        "pub_name": checkpoint.pub_name,
+        "pub_id": checkpoint.pub_id,
+        "sample_direct_line": checkpoint.sample_direct_line,
+        "columns": RESULT_COLUMNS,
+        "results": checkpoint.results,
+        "skipped_columns": SKIPPED_COLUMNS,
+        "skipped_log": checkpoint.skipped_log,
+        "warnings": source["warnings"],
+        "errors": source["errors"],
+        "diff": diff_payload(diff),
+        "reused": run.reused,
+        "changed": run.changed,
+    }, pipeline, telemetry)
+    checkpoint.delete()
+    store.finish(job_id, STATUS_DONE, result_path)
+
+
+def run_multi_job(store, job_id, params):
+    tranco_rankings, pipeline, options = scan_context(params["settings"])
+    telemetry = options["telemetry"]
+    history = RunHistory(RUN_HISTORY_FILE)
+    publishers = read_publishers(params["publishers_input"])
+
+    warnings = []
+    scannable = []
+    for publisher in publishers:
+        try:
+            scannable.append((publisher, publisher_domains(publisher, telemetry)))
+        except DomainSourceError as e:
+            warnings.append(f"{publisher['name'] or publisher['domain'] or publisher['pub_id']}: {e}")
+    if not scannable:
+        store.finish(job_id, STATUS_FAILED, error=" ".join(warnings + ["No valid domains found to check."]))
+        return
+
+    last_progress = [0.0]
+
+    def on_progress(done, total, domain, opportunities):
+        if time.time() - last_progress[0] >= PROGRESS_INTERVAL or done == total:
+            last_progress[0] = time.time()
+            if store.progress(job_id, done, total, opportunities):
+                raise JobCancelled()
+
+    try:
+        outcomes = scan_publishers(
+            [{"domains": domains, "pub_id": p["pub_id"], "sample_direct_line": p["sample_direct_line"]}
+             for p, domains in scannable],
+            tranco_rankings, on_progress=on_progress, pipeline=pipeline, **options
+        )
+    except JobCancelled:
+        store.finish(job_id, STATUS_CANCELLED)
+        return
+
+    rows = []
+    skipped = {}
+    for (publisher, domains), (results, skipped_log) in zip(scannable, outcomes):
+        label = publisher["name"] or publisher["domain"] or publisher["pub_id"]
+        history.save_run(publisher["name"] or publisher["domain"], publisher["pub_id"], results, len(domains))
+        rows.extend(dict(result, Publisher=label) for result in results)
+        skipped.update({(label, domain, reason): None for domain, reason in skipped_log})
+
+    job = store.get(job_id)
+    store.progress(job_id, job.total, job.total, len(rows))
+    result_path = write_job_result(job_id, {
+        "pub_name": f"{len(scannable)} publishers",
+        "pub_id": ", ".join(p["pub_id"] for p, _ in scannable),
+        "columns": ["Publisher"] + RESULT_COLUMNS,
+        "results": rows,
+        "skipped_columns": ["Publisher"] + SKIPPED_COLUMNS,
+        "skipped_log": list(skipped),
+        "warnings": warnings,
+        "errors": [],
+        "diff": None,
+        "reused": 0,
+        "changed": 0,
+    }, pipeline, telemetry)
+    store.finish(job_id, STATUS_DONE, result_path)
+
+
+def diff_payload(diff):
+    if diff is None:
+        return None
+    return {"new": diff.new, "lost": diff.lost, "previous_finished": diff.previous_run.finished}
+
+
+def write_job_result(job_id, payload, pipeline, telemetry):
+    telemetry.finish()
+    payload["pipeline"] = pipeline.report()
+    payload["prefetch"] = sum(pipeline.removed[stage.name] for stage in pipeline.stages)
+    payload["telemetry_path"] = job_file(job_id, "_telemetry.json")
+    payload["metrics_path"] = job_file(job_id, "_metrics.prom")
+    with open(payload["telemetry_path"], "w", encoding="utf-8") as f:
+        f.write(telemetry.to_json())
+    with open(payload["metrics_path"], "w", encoding="utf-8") as f:
+        f.write(telemetry.to_prometheus())
+    path = job_file(job_id, ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    return path
+
+
+def results_table(payload):
+    # The opportunities table the app shows for a finished job
+    if payload["columns"] == RESULT_COLUMNS:
+        return results_frame(payload["results"])
+    return pd.DataFrame(payload["results"], columns=payload["columns"]).sort_values("Tranco Rank")
@@ -0,0 +1,340 @@
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+import pandas as pd
+import requests
+
+from ads_cache import conditional_headers
+from ads_txt import parse_ads_txt, direct_line_ad_system
+from domain_health import failure_kind
+from domain_names import normalize_domains
+from http_client import RetryBudget, get_default_client
+from pipeline import build_pipeline, REASON_NOT_RANKED, STAGE_FETCH, STAGE_PARSE, STAGE_RULES
+
+# --- CONFIGURATION ---
+MAX_CONCURRENT_FETCHES = 32
+MAX_FETCHES_PER_HOST = 2
+FETCH_TIMEOUT = 10
+
+OMS_AD_SYSTEM = "onlinemediasolutions.com"
+
+# Skip reasons shown in the "Skipped Domains" report
+REASON_NO_DIRECT = "No direct line for publisher"
+REASON_OMS_BUYING = "OMS is already buying from this publisher"
+REASON_SSL_ERROR = "⚠️ SSL Error: The site has an expired or invalid HTTPS certificate."
+REASON_UNPARSEABLE = "⚠️ Unparseable ads.txt"
+
+RESULT_COLUMNS = ["Domain", "Tranco Rank", "OMS Buying"]
+SKIPPED_COLUMNS = ["Domain", "Reason"]
+
+
+# --- PER-HOST LIMITING ---
+class HostLimiter:
+    # Hands out one bounded semaphore per host so a single slow site
+    # can't take more than `per_host` of the global worker slots.
+    def __init__(self, per_host=MAX_FETCHES_PER_HOST):
+        self.per_host = max(1, int(per_host))
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def for_host(self, host):
+        host = host.lower()
+        with self._lock:
+            sem = self._semaphores.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.per_host)
+                self._semaphores[host] = sem
+            return sem
+
+
+# --- FETCH + EVALUATION ---
+def fetch_ads_txt(domain, timeout=FETCH_TIMEOUT, cache=None, telemetry=None, client=None, retry_budget=None):
+    entry = cache.get(domain) if cache is not None else None
+    if entry is not None and cache.is_fresh(entry):
+        if telemetry is not None:
+            telemetry.cache_hit("ads_txt")
+        return entry.body
+
+    client = client or get_default_client()
+    response = client.fetch(
+        f"https://{domain}/ads.txt", timeout, headers=conditional_headers(entry), telemetry=telemetry,
+        kind="ads_txt", retry_budget=retry_budget, http_fallback=True
+    )
+    if response.status_code == 304 and entry is not None and entry.status == 200:
+        cache.mark_revalidated(domain)
+        return entry.body
+
+    if cache is not None:
+        cache.put(
+            domain, response.status_code, response.text,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified")
+        )
+    return response.text
+
+
+def evaluate_rules(domain, parsed, pub_id, direct_ad_system, tranco_rankings):
+    # All rule checks against a parsed AdsTxt: (result_row, None) or (None, reason)
+    if not parsed.has_direct(direct_ad_system):
+        return None, REASON_NO_DIRECT
+
+    if parsed.has_direct(OMS_AD_SYSTEM, pub_id):
+        return None, REASON_OMS_BUYING
+
+    is_oms_buyer = parsed.has_other_direct(OMS_AD_SYSTEM, pub_id)
+
+    rank = tranco_rankings.get(domain.lower())
+    if rank is None:
+        return None, REASON_NOT_RANKED
+
+    return {
+        "Domain": domain,
+        "Tranco Rank": rank,
+        "OMS Buying": "Yes" if is_oms_buyer else "No"
+    }, None
+
+
+def evaluate_ads_txt(domain, ads_text, pub_id, sample_direct_line, tranco_rankings):
+    # Parses the file once and evaluates every rule against that parsed form
+    return evaluate_rules(
+        domain, parse_ads_txt(ads_text), pub_id.strip(), direct_line_ad_system(sample_direct_line), tranco_rankings
+    )
+
+
+def unexpected_error(e):
+    return f"⚠️ Unexpected Error: {str(e)}"
+
+
+def record_health(health, domain, error=None):
+    # Best effort: a locked or broken health store never fails the fetch
+    if health is None:
+        return
+    try:
+        if error is None:
+            health.record_success(domain)
+        elif failure_kind(error) is not None:
+            health.record_failure(domain, failure_kind(error))
+    except sqlite3.Error:
+        pass
+
+
+def fetch_and_parse(domain, limiter=None, timeout=FETCH_TIMEOUT, cache=None, telemetry=None, client=None,
+                    retry_budget=None, health=None):
+    # Never raises: returns (AdsTxt, None), or (None, reason) with the same
+    # skip reasons the sequential loop used to record.
+    fetch_options = {"timeout": timeout, "cache": cache, "telemetry": telemetry, "client": client,
+                     "retry_budget": retry_budget}
+    try:
+        if limiter is not None:
+            with limiter.for_host(domain):
+                ads_text = fetch_ads_txt(domain, **fetch_options)
+        else:
+            ads_text = fetch_ads_txt(domain, **fetch_options)
+    except requests.exceptions.SSLError as e:
+        record_health(health, domain, e)
+        return None, REASON_SSL_ERROR
+    except requests.exceptions.RequestException as e:
+        record_health(health, domain, e)
+        return None, f"⚠️ Connection Error: {e}"
+    except Exception as e:
+        return None, unexpected_error(e)
+    record_health(health, domain)
+    try:
+        return parse_ads_txt(ads_text), None
+    except Exception as e:
+        return None, f"{REASON_UNPARSEABLE}: {e}"
+
+
+# --- SCAN ENGINE ---
+class FetchQueue:
+    # A fetch pool that takes domains as they become known. Outcomes come back
+    # as (domain, AdsTxt or None, fetch_error_reason) in completion order;
+    # fetches start in submission order. The retry budget grows with the
+    # number of domains submitted.
+    def __init__(self, max_workers=MAX_CONCURRENT_FETCHES, per_host=MAX_FETCHES_PER_HOST, timeout=FETCH_TIMEOUT,
+                 cache=None, telemetry=None, client=None, retry_budget=None, health=None):
+        self.cache = cache
+        self.telemetry = telemetry
+        self.submitted = 0
+        self._sized_budget = retry_budget is None
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget.for_scan(0)
+        self._fetch = partial(
+            fetch_and_parse, limiter=HostLimiter(per_host), timeout=timeout, cache=cache, telemetry=telemetry,
+            client=client or get_default_client(), health=health, retry_budget=self.retry_budget
+        )
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="ads-scan")
+        self._pending = {}
+
+    def submit(self, domains):
+        for domain in domains:
+            self._pending[self._pool.submit(self._fetch, domain)] = domain
+            self.submitted += 1
+        if self._sized_budget:
+            self.retry_budget.resize(RetryBudget.for_scan(self.submitted).total)
+
+    def completed(self):
+        # Outcomes ready now, without waiting for the rest
+        for future in [f for f in self._pending if f.done()]:
+            yield self._outcome(future)
+
+    def drain(self):
+        for future in as_completed(list(self._pending)):
+            yield self._outcome(future)
+
+    def _outcome(self, future):
+        domain = self._pending.pop(future)
+        parsed, reason = future.result()
+        return domain, parsed, reason
+
+    def close(self, finished=True):
+        # If the consumer stopped early (Cancel, a Streamlit rerun), drop the
+        # queued fetches and let in-flight ones finish in the background.
+        self._pool.shutdown(wait=finished, cancel_futures=True)
+        if not finished:
+            return
+        if self.cache is not None:
+            self.cache.evict()
+        if self.telemetry is not None:
+            self.telemetry.finish()
+
+
+def iter_fetch(domains, **fetch_options):
+    # Yields (domain, AdsTxt or None, fetch_error_reason) in completion order,
+    # keeping up to `max_workers` fetches in flight. Consuming the generator on
+    # the Streamlit script thread keeps all st.* calls there.
+    domains = list(domains)
+    if not domains:
+        return
+
+    fetches = FetchQueue(**fetch_options)
+    finished = False
+    try:
+        fetches.submit(domains)
+        yield from fetches.drain()
+        finished = True
+    finally:
+        fetches.close(finished)
+
+
+def count_fetch_outcome(pipeline, parsed, reason):
+    # Attributes a fetched domain to the stage that removed it, if any
+    if parsed is not None:
+        pipeline.count(STAGE_FETCH, False)
+        pipeline.count(STAGE_PARSE, False)
+    elif reason.startswith(REASON_UNPARSEABLE):
+        pipeline.count(STAGE_FETCH, False)
+        pipeline.count(STAGE_PARSE, True)
+    else:
+        pipeline.count(STAGE_FETCH, True)
+
+
+def iter_scan(domains, pub_id, sample_direct_line, tranco_rankings, pipeline=None, run=None, **fetch_options):
+    # Yields (domain, result_row, skip_reason): first every domain the cheap
+    # pipeline stages removed, then fetched domains in completion order.
+    # Domain names come out normalized.
+    return iter_scan_batches([list(domains)], pub_id, sample_direct_line, tranco_rankings, pipeline, run,
+                             **fetch_options)
+
+
+def iter_scan_batches(domain_batches, pub_id, sample_direct_line, tranco_rankings, pipeline=None, run=None,
+                      **fetch_options):
+    # Same outcomes as iter_scan for domains that arrive in batches (e.g. from
+    # a sellers.json still downloading): each batch goes through the cheap
+    # stages and into the fetch queue as soon as it is read, and results
+    # finished meanwhile are yielded between batches. A run_history.RunRecorder
+    # as `run` records every outcome and, when refreshing, supplies the stored
+    # outcome of domains whose ads.txt hasn't changed; those still fresh in the
+    # ads.txt cache skip the fetch and parse entirely.
+    if pipeline is None:
+        pipeline = build_pipeline(tranco_rankings, health=fetch_options.get("health"))
+    pub_id = pub_id.strip()
+    direct_ad_system = direct_line_ad_system(sample_direct_line)
+    cache = fetch_options.get("cache")
+    refreshing = run is not None and bool(run.previous) and cache is not None
+
+    def recorded(domain, result, reason, content_hash=None):
+        if run is not None:
+            run.record(domain, result, reason, content_hash, tranco_rankings.get(domain))
+        return domain, result, reason
+
+    def evaluate(domain, parsed, reason):
+        count_fetch_outcome(pipeline, parsed, reason)
+        if parsed is None:
+            return recorded(domain, None, reason)
+        reused = run.reuse(domain, parsed.digest, tranco_rankings.get(domain)) if run is not None else None
+        if reused is not None:
+            result, reason = reused
+        else:
+            try:
+                result, reason = evaluate_rules(domain, parsed, pub_id, direct_ad_system, tranco_rankings)
+            except Exception as e:
+                result, reason = None, unexpected_error(e)
+        pipeline.count(STAGE_RULES, result is None)
+        return recorded(domain, result, reason, parsed.digest)
+
+    fetches = None
+    finished = False
+    try:
+        for batch in domain_batches:
+            queue, skipped = pipeline.filter(batch)
+            for domain, reason in skipped:
+                yield recorded(domain, None, reason)
+            if refreshing:
+                fetch = []
+                for domain in queue:
+                    kept = run.reuse_cached(domain, cache, tranco_rankings.get(domain))
+                    if kept is None:
+                        fetch.append(domain)
+                        continue
+                    result, reason, digest = kept
+                    pipeline.count(STAGE_FETCH, False)
+                    pipeline.count(STAGE_PARSE, False)
+                    pipeline.count(STAGE_RULES, result is None)
+                    yield recorded(domain, result, reason, digest)
+                queue = fetch
+            if queue:
+                fetches = fetches or FetchQueue(**fetch_options)
+                fetches.submit(queue)
+            if fetches is not None:
+                for outcome in fetches.completed():
+                    yield evaluate(*outcome)
+        if fetches is not None:
+            for outcome in fetches.drain():
+                yield evaluate(*outcome)
+        finished = True
+    finally:
+        if fetches is not None:
+            fetches.close(finished)
+
+
+def scan_domains(domains, pub_id, sample_direct_line, tranco_rankings, on_progress=None, **scan_options):
+    # Collects a full scan; on_progress(done, total, domain) is called after each
+    # domain, with the total counted as iter_scan yields them: duplicates once
+    domains = list(domains)
+    normalized = normalize_domains(domains)
+    total = normalized.count(None) + len(set(normalized) - {None})
+    results = []
+    skipped_log = []
+    for done, (domain, result, reason) in enumerate(
+        iter_scan(domains, pub_id, sample_direct_line, tranco_rankings, **scan_options), start=1
+    ):
+        if result is not None:
+            results.append(result)
+        else:
+            skipped_log.append((domain, reason))
+        if on_progress is not None:
+            on_progress(done, total, domain)
+    return results, skipped_log
+
+
+# --- RESULT TABLES ---
+def results_frame(results):
+    df = pd.DataFrame(results, columns=RESULT_COLUMNS)
+    df.sort_values("Tranco Rank", inplace=True)
+    return df
+
+
+def skipped_frame(skipped_log):
+    return pd.DataFrame(skipped_log, columns=SKIPPED_COLUMNS)
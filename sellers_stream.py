@@ -0,0 +1,259 @@
+import codecs
+import json
+import re
+
+from domain_names import normalize_domain
+
+# --- CONFIGURATION ---
+READ_CHUNK = 64 * 1024
+MAX_ELEMENT_CHARS = 4 * 1024 * 1024  # one seller entry (or other top-level value) larger than this is an error
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_ELEMENT_SEPARATOR = re.compile(r"[ \t\n\r]*,[ \t\n\r]*")
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+# Strings (a lone quote is one still being read) and brackets, to tell a value
+# that is merely cut off from one that is closed but malformed
+_STRUCTURE = re.compile(r'"(?:[^"\\]|\\.)*"|"|[\[\]{}]')
+_SCALAR_END = re.compile(r'[^,\]}\s]*[,\]}\s]')
+
+# Parser states
+_START, _KEY, _COLON, _VALUE, _AFTER_MEMBER, _ARRAY_START, _ELEMENT, _AFTER_ELEMENT, _DONE = range(9)
+
+
+class SellersJsonError(ValueError):
+    pass
+
+
+class SellersJsonParser:
+    # Incremental reader for {"...": ..., "sellers": [{...}, {...}], ...}.
+    # Text is fed in chunks; each seller entry is decoded on its own with
+    # json's C decoder as soon as it is complete, so memory holds one entry
+    # plus the unread tail of the current chunk, whatever the file size.
+    # Top-level members other than "sellers" are decoded and dropped.
+    def __init__(self, max_element_chars=MAX_ELEMENT_CHARS):
+        self.max_element_chars = max_element_chars
+        self.found_sellers = False
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._state = _START
+        self._key = None
+
+    def feed(self, text):
+        # Returns the seller entries completed by this chunk
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return self._parse(eof=False)
+
+    def close(self):
+        sellers = self._parse(eof=True)
+        if self._state != _DONE:
+            raise SellersJsonError("sellers.json ended before the top-level object was closed")
+        return sellers
+
+    def _skip_whitespace(self):
+        self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+        return self._pos < len(self._buffer)
+
+    def _decode(self, eof):
+        # One complete JSON value at the cursor, or None if more text is needed
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as e:
+            if eof or self._closed() or len(self._buffer) - self._pos > self.max_element_chars:
+                raise SellersJsonError(f"Invalid JSON at offset {e.pos}: {e.msg}") from None
+            return None
+        if not eof and self._may_continue(value, end):
+            return None
+        self._pos = end
+        return (value,)
+
+    def _closed(self):
+        # Whether the value at the cursor has ended within the buffer, so a
+        # decode error there is in the value itself and more text won't help
+        if self._pos >= len(self._buffer):
+            return False
+        first = self._buffer[self._pos]
+        if first == '"':
+            return _STRUCTURE.match(self._buffer, self._pos).group() != '"'
+        if first not in "{[":
+            return _SCALAR_END.match(self._buffer, self._pos) is not None
+        depth = 0
+        for match in _STRUCTURE.finditer(self._buffer, self._pos):
+            token = match.group()
+            if token == '"':
+                return False
+            if token in "{[":
+                depth += 1
+            elif token in "}]":
+                depth -= 1
+                if not depth:
+                    return True
+        return False
+
+    def _may_continue(self, value, end):
+        # Strings, objects and arrays end with their closing character; a
+        # number cut off by the chunk boundary ("1" of "1.5") does not
+        if end == len(self._buffer):
+            return True
+        return self._buffer[end] in _NUMBER_CHARS and isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def _read_elements(self, sellers, eof):
+        # Hot loop over the sellers array: decode an entry, skip the comma,
+        # repeat. Returns False when more text is needed.
+        buffer = self._buffer
+        size = len(buffer)
+        scan_once = self._decoder.scan_once
+        separator = _ELEMENT_SEPARATOR.match
+        pos = self._pos
+        while True:
+            try:
+                value, end = scan_once(buffer, pos)
+            except (StopIteration, json.JSONDecodeError):
+                after_whitespace = _WHITESPACE.match(buffer, pos).end()
+                if after_whitespace != pos:
+                    pos = after_whitespace
+                    continue
+                self._pos = pos
+                self._decode(eof)  # raises unless the entry is merely incomplete
+                return False
+            if not eof and (end == size or self._may_continue(value, end)):
+                self._pos = pos
+                return False
+            sellers.append(value)
+            if end < size and buffer[end] == ",":  # compact files: no whitespace to skip
+                pos = end + 1
+                continue
+            comma = separator(buffer, end)
+            if comma is None:
+                self._pos = end
+                self._state = _AFTER_ELEMENT
+                return True
+            pos = comma.end()
+
+    def _expect(self, allowed):
+        char = self._buffer[self._pos]
+        if char not in allowed:
+            raise SellersJsonError(f"Unexpected {char!r} in sellers.json, expected one of {allowed!r}")
+        self._pos += 1
+        return char
+
+    def _parse(self, eof):
+        sellers = []
+        while self._skip_whitespace():
+            state = self._state
+            if state == _START:
+                self._expect("{")
+                self._state = _KEY
+            elif state == _KEY:
+                if self._buffer[self._pos] == "}":
+                    self._pos += 1
+                    self._state = _DONE
+                    continue
+                if self._buffer[self._pos] != '"':
+                    raise SellersJsonError("Expected a member name in sellers.json")
+                decoded = self._decode(eof)
+                if decoded is None:
+                    break
+                self._key = decoded[0]
+                self._state = _COLON
+            elif state == _COLON:
+                self._expect(":")
+                self._state = _VALUE
+            elif state == _VALUE:
+                if self._key == "sellers" and self._buffer[self._pos] == "[":
+                    self._pos += 1
+                    self.found_sellers = True
+                    self._state = _ARRAY_START
+                    continue
+                if self._decode(eof) is None:
+                    break
+                self._state = _AFTER_MEMBER
+            elif state == _AFTER_MEMBER:
+                self._state = _KEY if self._expect(",}") == "," else _DONE
+            elif state == _ARRAY_START:
+                if self._buffer[self._pos] == "]":
+                    self._pos += 1
+                    self._state = _AFTER_MEMBER
+                else:
+                    self._state = _ELEMENT
+            elif state == _ELEMENT:
+                if not self._read_elements(sellers, eof):
+                    break
+            elif state == _AFTER_ELEMENT:
+                self._state = _ELEMENT if self._expect(",]") == "," else _AFTER_MEMBER
+            else:
+                raise SellersJsonError("Unexpected data after the end of sellers.json")
+        return sellers
+
+
+def iter_text_chunks(byte_chunks):
+    # UTF-8 (BOM tolerated) decoded incrementally, so multi-byte characters
+    # split across chunk boundaries survive
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    for chunk in byte_chunks:
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_file_chunks(f, chunk_size=READ_CHUNK):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_sellers(chunks, parser=None):
+    # Seller entries from an iterable of bytes or str chunks, as they complete
+    parser = parser or SellersJsonParser()
+    for text in iter_text_chunks(chunks):
+        yield from parser.feed(text)
+    yield from parser.close()
+
+
+def seller_domain(seller):
+    # Normalized the way the scan pipeline reports it; names normalization
+    # rejects are passed through so the scan can report them as invalid
+    domain = seller.get("domain") if isinstance(seller, dict) else None
+    if not domain or not isinstance(domain, str):
+        return None
+    return normalize_domain(domain) or domain.strip().lower() or None
+
+
+def iter_seller_domain_batches(chunks, exclude_domain="", seen=None, parser=None):
+    # Per chunk read, the seller domains not seen before, so a scan can start
+    # on them while the rest of the file is still arriving. `seen` ends up
+    # holding every domain; only that set grows with the file.
+    parser = parser or SellersJsonParser()
+    seen = set() if seen is None else seen
+    exclude_domain = (exclude_domain or "").strip().lower()
+    excluded = {exclude_domain, normalize_domain(exclude_domain)} - {"", None}
+
+    def new_domains(sellers):
+        batch = []
+        for seller in sellers:
+            domain = seller_domain(seller)
+            if domain and domain not in seen and domain not in excluded:
+                seen.add(domain)
+                batch.append(domain)
+        return batch
+
+    for text in iter_text_chunks(chunks):
+        batch = new_domains(parser.feed(text))
+        if batch:
+            yield batch
+    batch = new_domains(parser.close())
+    if batch:
+        yield batch
+
+
+def iter_text_slices(text, size=READ_CHUNK):
+    # A pasted document fed through the parser piece by piece, so it is never
+    # turned into one big dict of seller objects
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
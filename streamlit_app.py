@@ -1,20 +1,42 @@
 #debugged code to fix the ranking issue
 import streamlit as st
-import requests
 import pandas as pd
 import time
-from datetime import datetime
+from datetime import date, datetime
 import os
-import re
-import smtplib
-from email.message import EmailMessage
-import unicodedata
 import json
+import shutil
+import uuid
+
+from scanner import results_frame, MAX_CONCURRENT_FETCHES, MAX_FETCHES_PER_HOST, SKIPPED_COLUMNS
+from scan_checkpoint import ScanCheckpoint, list_checkpoints, format_duration
+from scan_jobs import (
+    JobRunner, JobStore, read_job_result, results_table, JOB_STORE_FILE, JOB_DIR, KIND_SINGLE, KIND_MULTI,
+    ACTIVE_STATUSES, STATUS_QUEUED, STATUS_DONE, STATUS_FAILED
+)
+from domain_sources import (
+    domains_from_manual, read_publishers, INPUT_MODES, MODE_LIVE, MODE_MANUAL, MODE_PASTE, MODE_MULTI
+)
+from ads_cache import AdsTxtCache, ADS_CACHE_FILE
+from domain_health import DomainHealth, DOMAIN_HEALTH_FILE
+from run_history import RunHistory, RUN_HISTORY_FILE
+from tranco_index import TrancoIndex, ensure_tranco_index, index_path_for
+from tranco_history import TrancoHistory, with_rank_trends, TRANCO_HISTORY_DIR
+from tranco_delta import TrancoDeltaStore, restore_latest
+from results_view import ResultsView, export_bytes, excel_engine, PAGE_SIZE
+from email_outbox import (
+    Outbox, OutboxSender, report_message, smtp_settings, OUTBOX_FILE, STATUS_SENT, STATUS_FAILED, FINAL_STATUSES
+)
+from tranco_download import download_tranco_list, tranco_download_url, extract_list_id, TrancoDownloadError
 
 # --- CONFIGURATION ---
 TRANCO_TOP_DOMAINS_FILE = "/tmp/top-1m.csv"
 TRANCO_META_FILE = "/tmp/tranco_meta.json"
 TRANCO_THRESHOLD = 210000
+JOB_POLL_INTERVAL = 2.0  # seconds between job status polls while a scan runs
+
+JOB_STATUS_ICONS = {"queued": "⏳", "running": "🔄", "done": "✅", "failed": "❌", "cancelled": "⏹️",
+                    "interrupted": "⚠️"}
 
 # --- FUNCTIONS FOR TRANCO ---
 def get_tranco_meta():
@@ -23,13 +45,92 @@ def get_tranco_meta():
             return json.load(f)
     return None
 
-def save_tranco_meta(tranco_id):
+def save_tranco_meta(tranco_id, timestamp=None):
     with open(TRANCO_META_FILE, "w") as f:
         json.dump({
             "id": tranco_id,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp or datetime.now().isoformat()
         }, f)
 
+@st.cache_resource
+def get_ads_cache():
+    return AdsTxtCache(ADS_CACHE_FILE)
+
+@st.cache_resource
+def get_domain_health():
+    return DomainHealth(DOMAIN_HEALTH_FILE)
+
+@st.cache_resource
+def get_run_history():
+    return RunHistory(RUN_HISTORY_FILE)
+
+@st.cache_resource
+def get_tranco_history():
+    return TrancoHistory(TRANCO_HISTORY_DIR)
+
+@st.cache_resource
+def get_outbox():
+    return Outbox(OUTBOX_FILE)
+
+@st.cache_resource
+def get_outbox_sender():
+    # One sending thread per server process; raises if the email secrets are missing
+    return OutboxSender(get_outbox(), smtp_settings(st.secrets))
+
+@st.cache_resource
+def get_job_store():
+    return JobStore(JOB_STORE_FILE)
+
+@st.cache_resource
+def get_job_runner():
+    # One worker pool per server process, shared by every session
+    return JobRunner(get_job_store())
+
+def attach_job(job_id):
+    # The job ID is also kept in the URL, so a reload reattaches to it
+    st.session_state["job_id"] = job_id
+    st.session_state.pop("loaded_job", None)
+    st.query_params["job"] = job_id
+
+def detach_job():
+    st.session_state.pop("job_id", None)
+    st.query_params.pop("job", None)
+
+# --- RESULTS TABLES ---
+def set_results(df):
+    # Every new results table gets a version, which keys its prepared view and its exports
+    st.session_state.opportunities_table = df
+    st.session_state["results_version"] = uuid.uuid4().hex
+    st.session_state.pop("email_message_id", None)
+
+@st.cache_resource(max_entries=8)
+def get_results_view(version, _df):
+    return ResultsView(_df)
+
+@st.cache_data(max_entries=32)
+def results_export(version, kind, _df):
+    # CSV/Excel bytes are built once per result version, not on every rerun
+    return export_bytes(_df, kind)
+
+@st.fragment
+def show_results_table(version, df):
+    # Sorting and paging rerun only this fragment, and only the visible page is styled
+    view = get_results_view(version, df)
+    if len(view) <= PAGE_SIZE:
+        st.dataframe(view.styled_page(), use_container_width=True, hide_index=True)
+        return
+    columns = list(view.df.columns)
+    controls = st.columns([3, 2, 2])
+    sort_by = controls[0].selectbox("Sort by", columns, key=f"sort_{version}",
+                                    index=columns.index("Tranco Rank") if "Tranco Rank" in columns else 0)
+    descending = controls[1].toggle("Descending", key=f"descending_{version}")
+    page = controls[2].number_input(f"Page (of {view.pages():,})", min_value=1, max_value=view.pages(), value=1,
+                                    key=f"page_{version}")
+    st.dataframe(view.styled_page(page, PAGE_SIZE, sort_by, not descending), use_container_width=True,
+                 hide_index=True)
+    first = (page - 1) * PAGE_SIZE
+    st.caption(f"Rows {first + 1:,}–{min(first + PAGE_SIZE, len(view)):,} of {len(view):,}")
+
 def is_recent(date_str):
     try:
         ts = datetime.fromisoformat(date_str)
@@ -37,10 +138,35 @@ def is_recent(date_str):
     except:
         return False
 
+@st.cache_resource
+def restore_committed_tranco():
+    # The scheduled workflow commits the list to tranco/ as a base plus daily deltas. When that holds a
+    # newer list than /tmp (and the user hasn't downloaded one since), rebuild the CSV and its index from
+    # it locally instead of downloading the full list. Runs once per server process: tranco/ only changes
+    # with a deploy, which restarts it.
+    store = TrancoDeltaStore()
+    latest = store.latest()
+    if not latest:
+        return False
+    list_id = latest["list_id"]
+    meta = get_tranco_meta() or {}
+    if meta.get("id") == list_id and os.path.exists(TRANCO_TOP_DOMAINS_FILE):
+        return False
+    if os.path.exists(TRANCO_TOP_DOMAINS_FILE) and meta.get("timestamp", "")[:10] >= latest["date"]:
+        return False
+    restore_latest(store, TRANCO_TOP_DOMAINS_FILE, index_path_for(list_id))
+    save_tranco_meta(list_id, f"{latest['date']}T00:00:00")  # dated like the list, not the restore
+    return True
+
 # --- STREAMLIT INTERFACE ---
 st.set_page_config(page_title="Monetization Opportunity Finder", layout="wide")
 st.title("\U0001F4A1 Publisher Monetization Opportunity Finder")
 
+try:
+    restore_committed_tranco()
+except Exception as e:
+    st.warning(f"⚠️ Could not rebuild the committed Tranco list: {e}")
+
 # --- SIDEBAR ---
 with st.sidebar:
     st.header("\U0001F310 Tranco List")
@@ -57,6 +183,11 @@ with st.sidebar:
         st.markdown("<div style='font-size: 85%; color: red; margin-bottom: 0.75em;'>⚠️ Tranco list not found. Please paste a Tranco list URL below.</div>", unsafe_allow_html=True)
         show_input = True
 
+    history_stats = get_tranco_history().stats()
+    if history_stats["snapshots"]:
+        st.caption(f"Rank history: {history_stats['snapshots']} lists ({history_stats['first']} – "
+                   f"{history_stats['last']}), {history_stats['bytes'] / 1e6:.1f} MB")
+
     if st.button("🔁 Manually Update Tranco List"):
         st.session_state["show_input"] = True
         show_input = True
@@ -66,100 +197,153 @@ with st.sidebar:
         st.text_input("Paste Tranco List URL", key="tranco_url")
         if st.button("\U0001F4E5 Download Tranco List"):
             url = st.session_state.get("tranco_url", "")
-            match = re.search(r"/list/([a-zA-Z0-9]{5,})/", url)
-            if not match:
+            tranco_id = extract_list_id(url)
+            if not tranco_id:
                 st.error("Invalid Tranco URL format.")
             else:
-                tranco_id = match.group(1)
-                download_url = f"https://tranco-list.eu/download/{tranco_id}/full"
                 try:
-                    response = requests.get(download_url)
-                    if response.status_code == 200:
-                        with open(TRANCO_TOP_DOMAINS_FILE, "wb") as f:
-                            f.write(response.content)
-                        save_tranco_meta(tranco_id)
-                        st.success(f"✅ Downloaded Tranco list (ID: {tranco_id})")
-                        st.session_state["show_input"] = False
-                        show_input = False
-                    else:
-                        st.error(f"Failed to download Tranco list: HTTP {response.status_code}")
+                    with st.spinner("📥 Downloading Tranco list..."):
+                        rows = download_tranco_list(
+                            tranco_download_url(tranco_id, "full"),
+                            TRANCO_TOP_DOMAINS_FILE,
+                            index_path=index_path_for(tranco_id)
+                        )
+                    save_tranco_meta(tranco_id)
+                    st.success(f"✅ Downloaded Tranco list (ID: {tranco_id}, {rows:,} domains)")
+                    st.session_state["show_input"] = False
+                    show_input = False
+                except TrancoDownloadError as e:
+                    st.error(str(e))
                 except Exception as e:
                     st.error(f"Error downloading Tranco list: {e}")
 
+    st.markdown("---")
+    with st.expander("⚙️ Scan Settings"):
+        st.number_input("Max concurrent fetches", min_value=1, max_value=256,
+                        value=MAX_CONCURRENT_FETCHES, key="max_concurrent_fetches")
+        st.number_input("Max fetches per host", min_value=1, max_value=16,
+                        value=MAX_FETCHES_PER_HOST, key="max_fetches_per_host")
+        st.checkbox("Reuse cached ads.txt files", value=True, key="use_ads_cache")
+        cache_stats = get_ads_cache().stats()
+        st.caption(f"ads.txt cache: {cache_stats['entries']:,} files, {cache_stats['bytes'] / 1e6:.1f} MB")
+        if st.button("🗑️ Clear ads.txt cache"):
+            get_ads_cache().clear()
+            st.rerun()
+        st.checkbox("Skip recently unreachable domains", value=True, key="use_domain_health",
+                    help="Domains whose last fetches timed out or failed DNS/TLS are skipped until their backoff expires.")
+        st.checkbox("Re-probe them at the end of the scan", value=False, key="reprobe_unreachable")
+        st.checkbox("Resolve DNS before fetching", value=False, key="use_dns_stage",
+                    help="Looks up every domain at once before any ads.txt fetch; domains that neither the name "
+                         "server nor the system resolver can find are skipped right away. Each batch's fetches "
+                         "wait for its slowest lookup.")
+        health_stats = get_domain_health().stats()
+        st.caption(f"Unreachable domains: {health_stats['backing_off']:,} backing off, "
+                   f"{health_stats['domains']:,} tracked")
+        if st.button("🗑️ Forget unreachable domains"):
+            get_domain_health().clear()
+            st.rerun()
+
+    with st.expander("🧮 Domain Filters"):
+        st.caption("Applied before any ads.txt is fetched, together with the Tranco rank check.")
+        st.number_input("Only ranks up to (0 = whole list)", min_value=0, max_value=TRANCO_THRESHOLD,
+                        value=0, step=1000, key="max_rank")
+        st.text_area("Allow list (only scan these domains and their subdomains)", key="allow_list")
+        st.text_area("Deny list (never scan these domains or their subdomains)", key="deny_list")
+
+    # --- SCAN QUEUE ---
+    # Every user's jobs on this deployment; any of them can be opened from here
+    jobs = get_job_store().list_jobs(15)
+    if jobs:
+        st.markdown("---")
+        st.subheader("🗂️ Scan Queue")
+        for job in jobs:
+            cols = st.columns([4, 1])
+            progress_label = f"{job.done:,}/{job.total:,}" if job.total else job.status
+            cols[0].button(
+                f"{JOB_STATUS_ICONS.get(job.status, '')} {job.label} · {progress_label}",
+                key=f"job_{job.job_id}", on_click=attach_job, args=(job.job_id,)
+            )
+            if job.status in ACTIVE_STATUSES and not job.cancel_requested:
+                if cols[1].button("⏹️", key=f"queue_cancel_{job.job_id}", help="Cancel this scan"):
+                    get_job_store().request_cancel(job.job_id)
+                    st.rerun()
+
+    running_checkpoints = get_job_store().active_checkpoints()
+    saved_scans = [cp for cp in list_checkpoints() if cp.done < cp.total and cp.path not in running_checkpoints][:5]
+    if saved_scans:
+        st.markdown("---")
+        st.subheader("⏸️ Interrupted Scans")
+        for cp in saved_scans:
+            cols = st.columns([4, 1])
+            cols[0].button(
+                f"▶️ {cp.pub_name or 'Manual Domains'} ({cp.pub_id}) · {cp.done}/{cp.total}",
+                key=f"resume_{cp.key}",
+                on_click=st.session_state.__setitem__, args=("resume_checkpoint", cp.path)
+            )
+            if cols[1].button("✖️", key=f"discard_{cp.key}", help="Discard this saved scan"):
+                cp.delete()
+                st.rerun()
+
     st.markdown("---")
     st.subheader("\U0001F553 Recent Publishers")
-    if "history" in st.session_state:
-        recent_keys = list(reversed(list(st.session_state["history"].keys())))[:10]
-        for key in recent_keys:
-            entry = st.session_state["history"][key]
-            label = f"{entry['name']} ({entry['id']})"
-            small_date = f"<div style='font-size: 12px; color: gray;'>Generated: {entry['date']}</div>"
-            if st.button(label, key=key):
-                st.subheader(f"\U0001F4DC Past Results: {entry['name']} ({entry['id']})")
-                st.markdown(small_date, unsafe_allow_html=True)
-                styled = entry['table'].copy()
-                if "Tranco Rank" in styled.columns:
-                    styled["Highlight"] = styled["Tranco Rank"] <= 50000
-                else:
-                    styled["Highlight"] = False  # or skip highlighting entirely
-
-                styled_display = styled.drop(columns=["Highlight"])
-                st.dataframe(
-                    styled_display.style.apply(
-                        lambda x: ["background-color: #d4edda" if v else "" for v in styled["Highlight"]],
-                        axis=0
-                    ),
-                    use_container_width=True
-                )
-                st.stop()
+    # Runs are kept in the run history store, so they survive reloads and are shared between sessions
+    for run in get_run_history().recent_runs(10):
+        run_name = run.name or "Manual Domains"
+        label = f"{run_name} ({run.pub_id})"
+        generated = datetime.fromtimestamp(run.finished).strftime("%Y-%m-%d %H:%M")
+        small_date = f"<div style='font-size: 12px; color: gray;'>Generated: {generated}</div>"
+        if st.button(label, key=f"history_{run.publisher}"):
+            st.subheader(f"\U0001F4DC Past Results: {run_name} ({run.pub_id})")
+            st.markdown(small_date, unsafe_allow_html=True)
+            past = with_rank_trends(results_frame(get_run_history().run_results(run.run_id)), get_tranco_history())
+            show_results_table(f"run_{run.run_id}", past)
+            st.stop()
 
 
 # --- TRANCO LOADING ---
-@st.cache_data
-def load_tranco_top_domains(debug=False):
+@st.cache_resource
+def open_tranco_index(list_id, csv_mtime):
+    # One memory-mapped index per list ID, shared by every session in this process.
+    # csv_mtime is only part of the cache key so a fresh download reopens it.
+    index = TrancoIndex(ensure_tranco_index(TRANCO_TOP_DOMAINS_FILE, list_id))
+    if list_id:
+        # Every list the app loads also goes into the snapshot store for the rank trend columns,
+        # dated by its meta (a list rebuilt from tranco/ carries the list's own date)
+        meta = get_tranco_meta() or {}
+        listed = meta.get("timestamp", "")[:10] if meta.get("id") == list_id else ""
+        try:
+            day = date.fromisoformat(listed) if listed else date.fromtimestamp(csv_mtime)
+            get_tranco_history().add_index(list_id, index, day)
+        except ValueError:
+            pass  # older than the newest stored snapshot
+    return index
+
+def load_tranco_top_domains(debug=False, threshold=TRANCO_THRESHOLD):
     if not os.path.exists(TRANCO_TOP_DOMAINS_FILE):
         if debug:
             st.error("❌ Tranco file not found.")
         return {}
 
     try:
-        # Load raw CSV with no header; manually assign column names
-        df = pd.read_csv(
-            TRANCO_TOP_DOMAINS_FILE,
-            names=["Rank", "Domain"],
-            header=None,
-            encoding="utf-8",
-            on_bad_lines="skip"
-        )
-
-        if debug:
-            st.write("🧪 Raw Tranco rows loaded:", df.shape)
-            st.write(df.head(5))  # Show top entries for inspection
-
-        # Attempt to convert Rank to numeric values
-        df["Rank"] = pd.to_numeric(df["Rank"], errors="coerce")
+        meta = get_tranco_meta() or {}
+        index = open_tranco_index(meta.get("id"), os.path.getmtime(TRANCO_TOP_DOMAINS_FILE))
         if debug:
-            st.success(f"✅ Valid 'Rank' entries after coercion: {df['Rank'].notna().sum():,}")
-
-        df.dropna(subset=["Rank"], inplace=True)
-        df["Rank"] = df["Rank"].astype(int)
+            st.write("🧪 Tranco index entries:", len(index), index.path)
 
-        # Filter domains under the rank threshold
-        df = df[df["Rank"] <= TRANCO_THRESHOLD]
+        rankings = index.view(threshold)
         if debug:
-            st.info(f"📉 Domains under threshold: {TRANCO_THRESHOLD:,}, {df.shape}")
+            st.info(f"📉 Domains under threshold: {threshold:,}, {len(rankings):,}")
 
-        if df.empty:
+        if not rankings:
             if debug:
                 st.warning("⚠️ Tranco file loaded but no valid data found under the rank threshold.")
             return {}
 
-        # Convert to dict for fast lookup
-        return dict(zip(df["Domain"].str.lower(), df["Rank"]))
+        return rankings
 
     except Exception as e:
         if debug:
-            st.error(f"❌ Error reading Tranco CSV: {e}")
+            st.error(f"❌ Error reading Tranco index: {e}")
         return {}
 
 # Load Tranco rankings (normal silent mode)
@@ -177,33 +361,152 @@ pub_id = ""
 sample_direct_line = ""
 manual_domains_input = ""
 sellersjson_input = ""
+sellers_file = None
+publishers_input = ""
+mode = st.session_state.get("mode", MODE_LIVE)
 
 if "opportunities_table" not in st.session_state or st.session_state.opportunities_table.empty:
     st.markdown("### 📝 Enter Publisher Details")
 
-    mode = st.radio("Select Input Mode", ["Live (from domain)", "Manual Domains", "Paste sellers.json"])
+    mode = st.radio("Select Input Mode", INPUT_MODES)
 
 # Handle invalid dual-mode selection
-    if mode == "Live (from domain)":
+    if mode == MODE_LIVE:
         pub_domain = st.text_input("Publisher Domain", placeholder="example.com")
         pub_name = st.text_input("Publisher Name", placeholder="connatix.com")
         manual_domains_input = ""
         sellersjson_input = ""
-    elif mode == "Manual Domains":
+    elif mode == MODE_MANUAL:
         st.info("Manual Domains Mode: Paste domains manually.")
         manual_domains_input = st.text_area("Paste domains manually (comma or newline separated)", height=100)
         pub_domain = ""
         pub_name = ""
         sellersjson_input = ""
-    elif mode == "Paste sellers.json":
-        st.info("Paste sellers.json content.")
+    elif mode == MODE_PASTE:
+        st.info("Paste sellers.json content, or upload the file (better for large files).")
         sellersjson_input = st.text_area("Paste sellers.json content", height=200)
+        sellers_file = st.file_uploader("Upload sellers.json", type=["json"])
         pub_domain = ""
         pub_name = ""
         manual_domains_input = ""
+    elif mode == MODE_MULTI:
+        st.info("Multiple Publishers Mode: each ads.txt is checked once for all publishers. "
+                "Paste a CSV with a header row: name, pub_id, sample_direct_line and either "
+                "domain (live sellers.json) or domains (manual list). Quote values that contain commas.")
+        publishers_input = st.text_area(
+            "Paste publishers CSV", height=200,
+            placeholder='name,domain,pub_id,sample_direct_line\nConnatix,connatix.com,1536788745730056,"connatix.com, 12345, DIRECT"'
+        )
+
+if mode != MODE_MULTI:
+    pub_id = st.text_input("Publisher ID", placeholder="1536788745730056")
+    sample_direct_line = st.text_input("Example ads.txt Direct Line", placeholder="connatix.com, 12345, DIRECT")
+    st.checkbox("🔄 Refresh: only re-evaluate domains whose ads.txt changed since the last run", key="refresh_scan",
+                help="Unchanged ads.txt files (same content, still ranked) keep the outcome from the last run. "
+                     "The results show which opportunities are new or lost since then.")
+
+
+def job_settings():
+    # Everything a worker process needs to rebuild this session's scan setup
+    return {
+        "tranco_index": getattr(getattr(tranco_rankings, "index", None), "path", None),
+        "threshold": getattr(tranco_rankings, "threshold", TRANCO_THRESHOLD),
+        "max_workers": st.session_state.get("max_concurrent_fetches", MAX_CONCURRENT_FETCHES),
+        "per_host": st.session_state.get("max_fetches_per_host", MAX_FETCHES_PER_HOST),
+        "use_cache": st.session_state.get("use_ads_cache", True),
+        "use_health": st.session_state.get("use_domain_health", True),
+        "reprobe": st.session_state.get("reprobe_unreachable", False),
+        "use_dns": st.session_state.get("use_dns_stage", False),
+        "max_rank": st.session_state.get("max_rank") or None,
+        "allow": sorted(domains_from_manual(st.session_state.get("allow_list", ""))),
+        "deny": sorted(domains_from_manual(st.session_state.get("deny_list", ""))),
+    }
+
+
+def save_sellers_upload(upload=None, text=""):
+    # Pasted or uploaded sellers.json handed to the worker as a file, copied in chunks
+    path = os.path.join(JOB_DIR, f"upload_{uuid.uuid4().hex}.json")
+    os.makedirs(JOB_DIR, exist_ok=True)
+    with open(path, "wb") as f:
+        if upload is not None:
+            shutil.copyfileobj(upload, f)
+        else:
+            f.write(text.encode("utf-8"))
+    return path
+
+
+def submit_scan(kind, label, params):
+    # Results of the previous scan give way to the new job's progress
+    params["settings"] = job_settings()
+    set_results(pd.DataFrame())
+    st.session_state.skipped_log = []
+    for key in ("run_diff", "pipeline_report", "scan_telemetry_json", "scan_metrics_prom"):
+        st.session_state.pop(key, None)
+    attach_job(get_job_runner().submit(kind, label, params))
+
+
+def job_readout(job):
+    if job.status == STATUS_QUEUED:
+        return "waiting for a free worker"
+    elapsed = max(time.time() - (job.started or time.time()), 1e-6)
+    rate = job.done / elapsed
+    if rate <= 0 or not job.total:
+        return "– domains/s, ETA –"
+    return f"{rate:.1f} domains/s, ETA {format_duration((job.total - job.done) / rate)}"
+
+
+def load_job_result(job):
+    # Puts a finished job's output where the results sections below read it
+    payload = read_job_result(job)
+    set_results(with_rank_trends(results_table(payload), get_tranco_history()))
+    st.session_state.skipped_log = [tuple(entry) for entry in payload["skipped_log"]]
+    st.session_state["skipped_columns"] = payload.get("skipped_columns", SKIPPED_COLUMNS)
+    st.session_state["pub_name"] = payload["pub_name"]
+    st.session_state["pub_id"] = payload["pub_id"]
+    st.session_state["run_diff"] = payload["diff"]
+    st.session_state["run_reused"] = payload["reused"]
+    st.session_state["run_changed"] = payload.get("changed", 0)
+    st.session_state["pipeline_report"] = (payload["pipeline"], payload["prefetch"])
+    for key, path_key in (("scan_telemetry_json", "telemetry_path"), ("scan_metrics_prom", "metrics_path")):
+        with open(payload[path_key], encoding="utf-8") as f:
+            st.session_state[key] = f.read()
+    st.session_state["job_messages"] = payload["warnings"], payload["errors"]
+    st.session_state["loaded_job"] = job.job_id
+
+
+def load_partial_result(job):
+    # A cancelled or interrupted scan: show what its checkpoint had found
+    if not job.checkpoint_path or not os.path.exists(job.checkpoint_path):
+        return
+    checkpoint = ScanCheckpoint.load(job.checkpoint_path)
+    set_results(with_rank_trends(results_frame(checkpoint.results), get_tranco_history()))
+    st.session_state.skipped_log = list(checkpoint.skipped_log)
+    st.session_state["skipped_columns"] = SKIPPED_COLUMNS
+    st.session_state["pub_name"] = checkpoint.pub_name
+    st.session_state["pub_id"] = checkpoint.pub_id
+    st.session_state["loaded_job"] = job.job_id
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_running_job(job_id):
+    # Polls the job table; the scan itself runs in a worker process, so
+    # widget clicks and reloads here never touch it
+    job = get_job_store().get(job_id)
+    if job is None or job.status not in ACTIVE_STATUSES:
+        st.rerun()
+    st.markdown(f"### 🔎 Scanning: {job.label}")
+    st.progress(job.done / max(job.total, 1))
+    st.text(f"Checked domain {job.done}/{job.total} · {job.opportunities} opportunities so far · "
+            f"{job_readout(job)}")
+    if job.checkpoint_path and os.path.exists(job.checkpoint_path):
+        partial = ScanCheckpoint.load(job.checkpoint_path)
+        if partial.results:
+            st.dataframe(results_frame(partial.results), use_container_width=True)
+    if job.cancel_requested:
+        st.caption("Cancelling…")
+    elif st.button("⏹️ Cancel Scan", key=f"cancel_{job_id}"):
+        get_job_store().request_cancel(job_id)
 
-pub_id = st.text_input("Publisher ID", placeholder="1536788745730056")
-sample_direct_line = st.text_input("Example ads.txt Direct Line", placeholder="connatix.com, 12345, DIRECT")
 
 # --- MAIN FUNCTIONALITY BUTTON ---
 if st.button("🔍 Find Monetization Opportunities"):
@@ -214,127 +517,68 @@ if st.button("🔍 Find Monetization Opportunities"):
     st.session_state["manual_domains_input"] = manual_domains_input
     st.session_state["sellersjson_input"] = sellersjson_input
     st.session_state["mode"] = mode
-
-    if not pub_id or not sample_direct_line:
+    st.session_state["publishers_input"] = publishers_input
+
+    if mode == MODE_MULTI:
+        try:
+            read_publishers(publishers_input)
+        except Exception as e:
+            st.error(f"Failed to parse publishers CSV: {e}")
+            st.stop()
+        submit_scan(KIND_MULTI, "Multiple publishers", {"publishers_input": publishers_input})
+    elif not pub_id or not sample_direct_line:
         st.error("Publisher ID and Example Direct Line are required.")
     else:
-        with st.spinner("🔎 Checking domains..."):
-            try:
-                st.session_state.skipped_log = []
-                results = []
-                domains = set()
-
-                # --- DOMAIN EXTRACTION LOGIC BY MODE ---
-                if mode == "Manual Domains":
-                    manual_lines = re.split(r'[\n,]+', manual_domains_input.strip())
-                    domains = {d.strip().lower() for d in manual_lines if d.strip()}
-
-                elif mode == "Paste sellers.json":
-                    try:
-                        data = json.loads(sellersjson_input)
-                        domains = {
-                            s.get("domain").strip().lower()
-                            for s in data.get("sellers", [])
-                            if s.get("domain")
-                        }
-                    except Exception as e:
-                        st.error(f"Failed to parse sellers.json: {e}")
-                        st.stop()
-
-                else:  # Live mode
-                    sellers_url = f"https://{pub_domain}/sellers.json"
-                    try:
-                        sellers_response = requests.get(sellers_url, timeout=10)
-                        sellers_data = sellers_response.json()
-                        if "sellers" in sellers_data:
-                            domains = {
-                                s.get("domain").lower()
-                                for s in sellers_data["sellers"]
-                                if s.get("domain") and s.get("domain").lower() != pub_domain.lower()
-                            }
-                        else:
-                            st.warning("No sellers field in sellers.json. Provide manual domains if needed.")
-                    except Exception:
-                        st.error(f"Invalid sellers.json at {sellers_url}")
-                        st.stop()
-
-                if not domains:
-                    st.error("No valid domains found to check.")
-                    st.stop()
-
-                # --- ANALYSIS ---
-                progress = st.progress(0)
-                progress_text = st.empty()
-
-                for idx, domain in enumerate(domains, start=1):
-                    try:
-                        ads_url = f"https://{domain}/ads.txt"
-                        ads_response = requests.get(ads_url, timeout=10)
-                        ads_lines = ads_response.text.splitlines()
-
-                        has_direct = any(
-                            sample_direct_line.split(",")[0].strip().lower() in line.lower() and "direct" in line.lower()
-                            for line in ads_lines
-                        )
-                        if not has_direct:
-                            st.session_state.skipped_log.append((domain, "No direct line for publisher"))
-                            continue
-
-                        if any(
-                            "onlinemediasolutions.com" in line.lower() and pub_id in line and "direct" in line.lower()
-                            for line in ads_lines
-                        ):
-                            st.session_state.skipped_log.append((domain, "OMS is already buying from this publisher"))
-                            continue
-
-                        is_oms_buyer = any(
-                            "onlinemediasolutions.com" in line.lower() and pub_id not in line and "direct" in line.lower()
-                            for line in ads_lines
-                        )
-
-                        if domain.lower() not in tranco_rankings:
-                            st.session_state.skipped_log.append((domain, "Not in Tranco top list"))
-                            continue
-
-                        rank = tranco_rankings[domain.lower()]
-                        results.append({
-                            "Domain": domain,
-                            "Tranco Rank": rank,
-                            "OMS Buying": "Yes" if is_oms_buyer else "No"
-                        })
-                        time.sleep(0.1)
-
-                    except requests.exceptions.SSLError:
-                        st.session_state.skipped_log.append((domain, "⚠️ SSL Error: The site has an expired or invalid HTTPS certificate."))
-                    except requests.exceptions.RequestException as e:
-                        st.session_state.skipped_log.append((domain, f"⚠️ Connection Error: {e}"))
-                    except Exception as e:
-                        st.session_state.skipped_log.append((domain, f"⚠️ Unexpected Error: {str(e)}"))
-
-                    progress.progress(idx / len(domains))
-                    progress_text.text(f"Checking domain {idx}/{len(domains)}: {domain}")
-
-                # --- SAVE RESULTS TO SESSION ---
-                df_results = pd.DataFrame(results)
-                df_results.sort_values("Tranco Rank", inplace=True)
-                st.session_state.opportunities_table = df_results
-
-                key = f"{(pub_name or 'Manual')}_{pub_id}"
-                st.session_state.setdefault("history", {})
-                st.session_state["history"][key] = {
-                    "name": pub_name or "Manual Domains",
-                    "id": pub_id,
-                    "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                    "table": df_results.copy()
-                }
-
-                progress.empty()
-                progress_text.empty()
-                st.success("✅ Analysis complete")
-                st.balloons()
-
-            except Exception as e:
-                st.error(f"Error while processing: {e}")
+        # --- DOMAIN EXTRACTION LOGIC BY MODE ---
+        # The worker reads sellers.json incrementally and starts scanning with
+        # the first batch of domains, long before a big file is done.
+        params = {
+            "pub_name": pub_name, "pub_id": pub_id, "sample_direct_line": sample_direct_line, "mode": mode,
+            "pub_domain": pub_domain, "manual_domains_input": manual_domains_input,
+            "refresh": st.session_state.get("refresh_scan", False),
+        }
+        if mode == MODE_PASTE:
+            params["sellers_path"] = save_sellers_upload(sellers_file, sellersjson_input)
+        submit_scan(KIND_SINGLE, f"{pub_name or pub_domain or 'Manual Domains'} ({pub_id})", params)
+
+# --- RESUME AN INTERRUPTED SCAN ---
+resume_path = st.session_state.pop("resume_checkpoint", None)
+if resume_path:
+    try:
+        saved = ScanCheckpoint.load(resume_path)
+        submit_scan(KIND_SINGLE, f"{saved.pub_name or 'Manual Domains'} ({saved.pub_id}) · resumed",
+                    {"resume": resume_path})
+    except Exception as e:
+        st.error(f"Error while resuming scan: {e}")
+
+# --- ATTACHED JOB ---
+attached_job_id = st.session_state.get("job_id") or st.query_params.get("job")
+attached_job = get_job_store().get(attached_job_id) if attached_job_id else None
+if attached_job_id and attached_job is None:
+    detach_job()
+elif attached_job is not None:
+    st.session_state["job_id"] = attached_job.job_id
+    if attached_job.status in ACTIVE_STATUSES:
+        show_running_job(attached_job.job_id)
+    elif st.session_state.get("loaded_job") != attached_job.job_id:
+        if attached_job.status == STATUS_DONE:
+            load_job_result(attached_job)
+            st.success("✅ Analysis complete")
+            st.balloons()
+        elif attached_job.status == STATUS_FAILED:
+            st.error(f"Error while processing: {attached_job.error}")
+            st.session_state["loaded_job"] = attached_job.job_id
+        else:
+            load_partial_result(attached_job)
+            st.warning(
+                f"⏹️ Scan {attached_job.status} after {attached_job.done}/{attached_job.total} domains. "
+                "Partial results are shown below; resume it from the sidebar."
+            )
+    job_warnings, job_errors = st.session_state.pop("job_messages", ([], []))
+    for message in job_warnings:
+        st.warning(message)
+    for message in job_errors:
+        st.error(message)
 
 # --- RESULTS DISPLAY ---
 st.session_state.setdefault("opportunities_table", pd.DataFrame())
@@ -351,41 +595,76 @@ if not st.session_state.opportunities_table.empty:
 
     st.markdown(f"📊 **{total + skipped} domains scanned** | ✅ {total} opportunities found | ⛔ {skipped} skipped")
 
-    styled_df = st.session_state.opportunities_table.copy()
-    styled_df["Highlight"] = styled_df["Tranco Rank"] <= 50000
-    styled_df_display = styled_df.drop(columns=["Highlight"])
-
-    st.dataframe(
-        styled_df_display.style.apply(
-            lambda x: ["background-color: #d4edda" if v else "" for v in styled_df["Highlight"]],
-            axis=0
-        ),
-        use_container_width=True
-    )
-
-    # ✅ CSV + comment appear ONLY if analysis was run
-    csv_data = st.session_state.opportunities_table.to_csv(index=False)
-    st.download_button(
+    results_version = st.session_state.setdefault("results_version", uuid.uuid4().hex)
+    show_results_table(results_version, st.session_state.opportunities_table)
+
+    run_diff = st.session_state.get("run_diff")
+    if run_diff is not None:
+        previous_date = datetime.fromtimestamp(run_diff["previous_finished"]).strftime("%Y-%m-%d %H:%M")
+        diff_label = (f"🔁 Changes since the last run ({previous_date}): "
+                      f"{len(run_diff['new'])} new, {len(run_diff['lost'])} lost")
+        with st.expander(diff_label, expanded=bool(run_diff["new"] or run_diff["lost"])):
+            reused = st.session_state.get("run_reused", 0)
+            changed = st.session_state.get("run_changed", 0)
+            if reused or changed:
+                st.caption(f"{reused:,} domains had an unchanged ads.txt and kept their outcome from the last run; "
+                           f"{changed:,} had a changed ads.txt and were evaluated again.")
+            diff_cols = st.columns(2)
+            diff_cols[0].markdown("**🆕 New opportunities**")
+            diff_cols[0].dataframe(results_frame(run_diff["new"]), use_container_width=True, hide_index=True)
+            diff_cols[1].markdown("**➖ Lost opportunities**")
+            diff_cols[1].dataframe(results_frame(run_diff["lost"]), use_container_width=True, hide_index=True)
+
+    # ✅ Downloads appear ONLY if analysis was run
+    download_cols = st.columns(4)
+    download_cols[0].download_button(
         "⬇️ Download Opportunities CSV",
-        data=csv_data,
+        data=results_export(results_version, "csv", st.session_state.opportunities_table),
         file_name=f"opportunities_{datetime.now().strftime('%Y%m%d')}.csv",
         mime="text/csv"
     )
+    if excel_engine():
+        download_cols[1].download_button(
+            "⬇️ Download Excel",
+            data=results_export(results_version, "xlsx", st.session_state.opportunities_table),
+            file_name=f"opportunities_{datetime.now().strftime('%Y%m%d')}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
 
+# --- EMAIL SECTION ---
+def show_email_status(message_id):
+    message = get_outbox().get(message_id)
+    if message is None:
+        return
+    if message.status == STATUS_SENT:
+        st.success(f"Email sent to {message.recipient}!")
+        st.info("✅ Want to analyze another publisher? Update the fields above or refresh the page.")
+    elif message.status == STATUS_FAILED:
+        st.error(f"Failed to send email: {message.error}")
+    elif message.attempts:
+        st.warning(f"📤 Email to {message.recipient} not sent yet (attempt {message.attempts} failed: "
+                   f"{message.error}); retrying automatically.")
+    else:
+        st.info(f"📤 Email to {message.recipient} is queued and will be sent in the background.")
+
+# Polled while the email is still in the outbox; reruns the page once it is sent or given up on
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def poll_email_status(message_id):
+    show_email_status(message_id)
+    message = get_outbox().get(message_id)
+    if message is None or message.status in FINAL_STATUSES:
+        st.rerun(scope="app")
+
+@st.fragment
+def email_section(opportunities_table):
+    # A fragment, so typing a comment or an address doesn't rerun (or re-render) the results above
     # ✅ COMMENT BOX: only visible after results
     st.markdown("### 🗒️ Optional Comment for Email")
-    comment_text = st.text_area(
+    st.text_area(
         "Write a message to include in the email (optional)",
         key="comment_text"
     )
 
-# --- EMAIL SECTION ---
-if not st.session_state.opportunities_table.empty:
-    def sanitize_header(text):
-        text = unicodedata.normalize("NFKD", text)
-        text = re.sub(r'[^ -~]', '', text)
-        return text.strip().replace("\r", "").replace("\n", "")
-
     st.markdown("### 📧 Email This List")
     st.markdown("<label>Email Address</label>", unsafe_allow_html=True)
     email_cols = st.columns([3, 5])
@@ -396,92 +675,50 @@ if not st.session_state.opportunities_table.empty:
         "<div style='margin-top: 0.6em; font-size: 16px;'>@onlinemediasolutions.com</div>",
         unsafe_allow_html=True
     )
-    comment_text = st.session_state.get("comment_text", "").strip()
     if st.button("Send Email"):
         if not email_local_part.strip():
             st.error("Please enter a valid username before sending the email.")
         else:
             try:
-                full_email = f"{email_local_part.strip()}@onlinemediasolutions.com"
-                from_email = st.secrets["EMAIL_ADDRESS"]
-                email_password = st.secrets["EMAIL_PASSWORD"]
-
-                subject_name = sanitize_header(st.session_state.get("pub_name", "") or "Manual Domains")
-                subject_id = sanitize_header(st.session_state.get("pub_id", "") or "NoID")
-
-                msg = EmailMessage()
-                msg["Subject"] = f"{subject_name} ({subject_id}) opportunities"
-                msg["From"] = from_email.strip()
-                msg["To"] = full_email.strip()
-
-                html_table = st.session_state.opportunities_table.to_html(
-                    index=False, border=1, justify='center', classes='styled-table'
+                # Queued, not sent here: the outbox thread sends it (and retries) without holding the page
+                sender = get_outbox_sender()
+                msg = report_message(
+                    sender.settings.sender, f"{email_local_part.strip()}@onlinemediasolutions.com",
+                    opportunities_table, st.session_state.get("pub_name", ""), st.session_state.get("pub_id", ""),
+                    st.session_state.get("comment_text", "")
                 )
-                comment_text = st.session_state.get("comment_text", "").strip()
-
-                body = f"""
-<html>
-  <head>
-    <style>
-      * {{ font-family: Arial, sans-serif; font-size: 14px; color: #333; }}
-      .styled-table {{
-        border-collapse: collapse;
-        margin: 10px 0;
-        font-size: 14px;
-        min-width: 400px;
-        border: 1px solid #ddd;
-      }}
-      .styled-table th, .styled-table td {{
-        border: 1px solid #ddd;
-        padding: 8px;
-        text-align: left;
-      }}
-      .styled-table th {{
-        background-color: #f2f2f2;
-        font-weight: bold;
-      }}
-    </style>
-  </head>
-  <body>
-    <p>Hi there!</p>
-    <p>Here is the list of opportunities for <strong>{subject_name}</strong> ({subject_id}):</p>
-    {html_table}
-    {f"<p><strong>Adding here your manual comments:</strong><br>{comment_text}</p>" if comment_text else ""}
-    <p>Warm regards,<br/>Automation bot</p>
-  </body>
-</html>
-"""
-
-                msg.set_content("This email requires an HTML-capable email client.")
-                msg.add_alternative(body, subtype="html")
-
-                with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-                    smtp.login(from_email, email_password)
-                    smtp.send_message(msg)
-
-                st.success("Email sent successfully!")
-                st.info("✅ Want to analyze another publisher? Update the fields above or refresh the page.")
+                st.session_state["email_message_id"] = get_outbox().enqueue(msg)
+                sender.notify()
             except Exception as e:
                 st.error(f"Failed to send email: {e}")
 
+    message_id = st.session_state.get("email_message_id")
+    if message_id:
+        message = get_outbox().get(message_id)
+        if message and message.status in FINAL_STATUSES:
+            show_email_status(message_id)
+        else:
+            poll_email_status(message_id)
+
+if not st.session_state.opportunities_table.empty:
+    email_section(st.session_state.opportunities_table)
+
 # --- START OVER BUTTON ---
 if st.button("🔁 Start Over"):
-    # Keep recent publishers
-    history_backup = st.session_state.get("history", {}).copy()
-
     # Explicitly clear known input keys (must match widget keys)
     keys_to_clear = [
         "pub_domain", "pub_name", "pub_id", "sample_direct_line",
-        "manual_domains_input", "sellersjson_input", "comment_text", "mode"
+        "manual_domains_input", "sellersjson_input", "publishers_input", "comment_text", "mode"
     ]
     for key in keys_to_clear:
         if key in st.session_state:
             del st.session_state[key]
 
     # Reset output
-    st.session_state["opportunities_table"] = pd.DataFrame()
+    set_results(pd.DataFrame())
     st.session_state["skipped_log"] = []
-    st.session_state["history"] = history_backup
+    st.session_state.pop("run_diff", None)
+    detach_job()
 
     st.rerun()
 
@@ -492,7 +729,8 @@ st.session_state.setdefault("skipped_log", [])
 if st.session_state.skipped_log:
     with st.expander("⛔ Skipped Domains", expanded=False):
         st.subheader("⛔ Skipped Domains")
-        skipped_df = pd.DataFrame(st.session_state.skipped_log, columns=["Domain", "Reason"])
+        skipped_df = pd.DataFrame(st.session_state.skipped_log,
+                                  columns=st.session_state.get("skipped_columns", SKIPPED_COLUMNS))
         st.dataframe(skipped_df, use_container_width=True)
 
         skipped_csv = skipped_df.to_csv(index=False)
@@ -502,3 +740,66 @@ if st.session_state.skipped_log:
             file_name="skipped_domains.csv",
             mime="text/csv"
         )
+
+
+# --- FILTER PIPELINE REPORT ---
+pipeline_report = st.session_state.get("pipeline_report")
+if pipeline_report is not None and any(row["In"] for row in pipeline_report[0]):
+    with st.expander("🧮 Filter Pipeline", expanded=False):
+        stages_df = pd.DataFrame(pipeline_report[0])
+        st.dataframe(stages_df, use_container_width=True, hide_index=True)
+        prefetch = pipeline_report[1]
+        st.caption(f"{prefetch:,} domains were settled without an HTTP request.")
+
+# --- SCAN PERFORMANCE REPORT ---
+scan_telemetry_json = st.session_state.get("scan_telemetry_json")
+perf = json.loads(scan_telemetry_json) if scan_telemetry_json else None
+if perf is not None and perf["requests"]:
+    with st.expander("📡 Scan Performance", expanded=False):
+        metric_cols = st.columns(5)
+        metric_cols[0].metric("Requests", f"{perf['requests']:,}")
+        metric_cols[1].metric("Requests / s", f"{perf['requests_per_second']:.1f}")
+        metric_cols[2].metric("p50 total", f"{perf['latency_seconds']['total']['p50'] * 1000:.0f} ms")
+        metric_cols[3].metric("p90 total", f"{perf['latency_seconds']['total']['p90'] * 1000:.0f} ms")
+        metric_cols[4].metric("Cache hits", f"{sum(perf['cache_hits'].values()):,}")
+        st.caption(
+            f"{perf['bytes'] / 1e6:.1f} MB read · {perf['connections_opened']:,} connections opened · "
+            f"{perf['redirects']:,} redirects followed · {perf['retries']:,} retries · "
+            f"{perf['duration_seconds']:.1f}s"
+        )
+
+        st.markdown("**Latency by phase (ms)**")
+        latency_df = pd.DataFrame(perf["latency_seconds"]).T * 1000
+        st.dataframe(latency_df.round(1), use_container_width=True)
+
+        perf_cols = st.columns(2)
+        with perf_cols[0]:
+            st.markdown("**Slowest hosts**")
+            st.dataframe(pd.DataFrame(perf["slowest_hosts"]), use_container_width=True)
+        with perf_cols[1]:
+            st.markdown("**Errors**")
+            if perf["errors"]:
+                st.dataframe(
+                    pd.DataFrame(list(perf["errors"].items()), columns=["Error", "Count"]),
+                    use_container_width=True
+                )
+            else:
+                st.write("No request errors.")
+
+        if perf["throughput"]:
+            st.markdown("**Throughput over time (completed requests per second)**")
+            st.line_chart(pd.DataFrame(perf["throughput"]).set_index("second")["requests"])
+
+        export_cols = st.columns(2)
+        export_cols[0].download_button(
+            "⬇️ Download Telemetry JSON",
+            data=scan_telemetry_json,
+            file_name=f"scan_telemetry_{datetime.now().strftime('%Y%m%d_%H%M')}.json",
+            mime="application/json"
+        )
+        export_cols[1].download_button(
+            "⬇️ Download Prometheus Metrics",
+            data=st.session_state.get("scan_metrics_prom", ""),
+            file_name="scan_metrics.prom",
+            mime="text/plain"
+        )
@@ -0,0 +1,188 @@
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from net_hooks import install_network_hooks, set_probe
+
+# --- CONFIGURATION ---
+PHASES = ["dns", "connect", "tls", "ttfb", "transfer", "total"]
+QUANTILES = [0.5, 0.9, 0.99]
+SLOWEST_HOSTS = 10
+METRIC_PREFIX = "oms_scan"
+
+
+# --- PER-REQUEST PROBE ---
+class FetchProbe:
+    # Phase durations in seconds. dns/connect/tls add up across redirect hops
+    # and are 0 when a pooled connection was reused; ttfb is the wait between
+    # the connection being ready and the response headers arriving.
+    __slots__ = ("kind", "url", "host", "started", "dns", "connect", "tls", "ttfb", "transfer", "total",
+                 "bytes", "status", "redirects", "retries", "connections", "error")
+
+    def __init__(self, kind, url):
+        self.kind = kind
+        self.url = url
+        self.host = (urlsplit(url).hostname or "").lower()
+        self.started = time.time()
+        self.dns = self.connect = self.tls = self.ttfb = self.transfer = self.total = 0.0
+        self.bytes = 0
+        self.status = None
+        self.redirects = 0
+        self.retries = 0
+        self.connections = 0
+        self.error = None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# --- SCAN-LEVEL RECORDER ---
+class ScanTelemetry:
+    def __init__(self):
+        install_network_hooks()
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.finished = None
+        self.probes = []
+        self.cache_hits = Counter()
+
+    @contextmanager
+    def probe(self, kind, url):
+        probe = FetchProbe(kind, url)
+        set_probe(probe)
+        started = time.perf_counter()
+        try:
+            yield probe
+        except Exception as e:
+            probe.error = type(e).__name__
+            raise
+        finally:
+            set_probe(None)
+            probe.total = time.perf_counter() - started
+            with self._lock:
+                self.probes.append(probe)
+
+    def cache_hit(self, kind):
+        with self._lock:
+            self.cache_hits[kind] += 1
+
+    def finish(self):
+        self.finished = time.time()
+
+    # --- SUMMARIES ---
+    def summary(self):
+        with self._lock:
+            probes = list(self.probes)
+            cache_hits = dict(self.cache_hits)
+        finished = self.finished or time.time()
+        duration = max(finished - self.started, 1e-6)
+
+        latency = {}
+        for phase in PHASES:
+            values = np.array([getattr(p, phase) for p in probes], dtype=float)
+            latency[phase] = {
+                f"p{int(q * 100)}": float(np.quantile(values, q)) if len(values) else 0.0 for q in QUANTILES
+            }
+            latency[phase]["max"] = float(values.max()) if len(values) else 0.0
+
+        by_host = {}
+        for p in probes:
+            by_host[p.host] = max(by_host.get(p.host, 0.0), p.total)
+        slowest = sorted(by_host.items(), key=lambda item: item[1], reverse=True)[:SLOWEST_HOSTS]
+
+        errors = Counter(outcome(p) for p in probes)
+        errors.pop("ok", None)
+
+        # Completed requests and bytes per second of scan time
+        throughput = {}
+        for p in probes:
+            second = int(p.started + p.total - self.started)
+            bucket = throughput.setdefault(second, [0, 0])
+            bucket[0] += 1
+            bucket[1] += p.bytes
+
+        return {
+            "started": self.started,
+            "duration_seconds": duration,
+            "requests": len(probes),
+            "requests_per_second": len(probes) / duration,
+            "bytes": int(sum(p.bytes for p in probes)),
+            "connections_opened": int(sum(p.connections for p in probes)),
+            "redirects": int(sum(p.redirects for p in probes)),
+            "retries": int(sum(p.retries for p in probes)),
+            "cache_hits": cache_hits,
+            "latency_seconds": latency,
+            "slowest_hosts": [{"host": host, "seconds": seconds} for host, seconds in slowest],
+            "errors": dict(errors),
+            "throughput": [
+                {"second": second, "requests": count, "bytes": size}
+                for second, (count, size) in sorted(throughput.items())
+            ],
+        }
+
+    def to_json(self, include_requests=True):
+        data = self.summary()
+        if include_requests:
+            with self._lock:
+                data["requests_detail"] = [p.as_dict() for p in self.probes]
+        return json.dumps(data, indent=2)
+
+    def to_prometheus(self):
+        with self._lock:
+            probes = list(self.probes)
+            cache_hits = dict(self.cache_hits)
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value:g}" if label_text
+                             else f"{METRIC_PREFIX}_{name} {value:g}")
+
+        counts = Counter((p.kind, outcome(p)) for p in probes)
+        metric("requests_total", "counter", "HTTP requests made during the scan",
+               [({"kind": kind, "outcome": result}, n) for (kind, result), n in sorted(counts.items())])
+        metric("cache_hits_total", "counter", "Responses served from the local cache without a request",
+               [({"kind": kind}, n) for kind, n in sorted(cache_hits.items())])
+        metric("response_bytes_total", "counter", "Response body bytes read",
+               [({"kind": kind}, sum(p.bytes for p in probes if p.kind == kind))
+                for kind in sorted({p.kind for p in probes})])
+        metric("connections_opened_total", "counter", "New TCP connections opened",
+               [({}, sum(p.connections for p in probes))])
+        metric("retries_total", "counter", "Retries spent from the scan's retry budget",
+               [({}, sum(p.retries for p in probes))])
+
+        samples = []
+        for kind in sorted({p.kind for p in probes}):
+            kind_probes = [p for p in probes if p.kind == kind]
+            for phase in PHASES:
+                values = np.array([getattr(p, phase) for p in kind_probes], dtype=float)
+                for q in QUANTILES:
+                    samples.append(({"kind": kind, "phase": phase, "quantile": q}, float(np.quantile(values, q))))
+        metric("request_phase_seconds", "summary", "Request phase latency", samples)
+        for kind in sorted({p.kind for p in probes}):
+            kind_probes = [p for p in probes if p.kind == kind]
+            for phase in PHASES:
+                labels = f'kind="{kind}",phase="{phase}"'
+                lines.append(f"{METRIC_PREFIX}_request_phase_seconds_sum{{{labels}}} "
+                             f"{sum(getattr(p, phase) for p in kind_probes):g}")
+                lines.append(f"{METRIC_PREFIX}_request_phase_seconds_count{{{labels}}} {len(kind_probes)}")
+        return "\n".join(lines) + "\n"
+
+
+def outcome(probe):
+    if probe.error:
+        return probe.error
+    if probe.status is None:
+        return "no_response"
+    if probe.status >= 400:
+        return f"http_{probe.status // 100}xx"
+    return "ok"
+
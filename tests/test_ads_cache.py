@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+import ads_cache
+from ads_cache import AdsTxtCache, conditional_headers
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AdsTxtCache(str(tmp_path / "ads.sqlite"))
+    yield cache
+    cache.close()
+
+
+def aged(cache, domain, seconds):
+    cache._conn.execute("UPDATE ads_txt SET fetched_at = ? WHERE domain = ?", (time.time() - seconds, domain))
+    return cache.get(domain)
+
+
+@pytest.mark.parametrize("status", [200, 404])
+def test_files_and_missing_files_last_the_full_ttl(cache, status):
+    cache.put("example.com", status, "body", etag='"v1"')
+    assert cache.is_fresh(aged(cache, "example.com", ads_cache.ERROR_CACHE_TTL + 60))
+    assert not cache.is_fresh(aged(cache, "example.com", cache.ttl + 1))
+
+
+@pytest.mark.parametrize("status", [403, 429, 503])
+def test_error_responses_expire_quickly(cache, status):
+    cache.put("example.com", status, "Service Unavailable", etag='"v1"')
+    assert cache.is_fresh(cache.get("example.com"))
+    entry = aged(cache, "example.com", ads_cache.ERROR_CACHE_TTL + 1)
+    assert not cache.is_fresh(entry)
+    assert conditional_headers(entry) == {}
+
+
+def test_stored_file_is_revalidated(cache):
+    cache.put("example.com", 200, "body", etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    assert conditional_headers(cache.get("example.com")) == {
+        "If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
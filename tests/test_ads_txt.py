@@ -0,0 +1,100 @@
+import pytest
+
+from ads_txt import AdsTxtRecord, DIRECT, RESELLER, content_hash, direct_line_ad_system, parse_ads_txt
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("google.com, pub-1, DIRECT", ("google.com", "pub-1", DIRECT, None)),
+    ("google.com,pub-1,DIRECT,f08c47fec0942fa0", ("google.com", "pub-1", DIRECT, "f08c47fec0942fa0")),
+    ("  Google.COM ,\tpub-1 , direct  ", ("google.com", "pub-1", DIRECT, None)),
+    ("google.com, pub-1, Reseller", ("google.com", "pub-1", RESELLER, None)),
+    ("google.com, pub-1, DIRECT, ", ("google.com", "pub-1", DIRECT, None)),
+    ("google.com, pub-1, DIRECT # inline comment, x", ("google.com", "pub-1", DIRECT, None)),
+    ("google.com, pub-1, DIRECT, abc;extension=data", ("google.com", "pub-1", DIRECT, "abc")),
+    ("google.com, Pub-AbC, DIRECT", ("google.com", "Pub-AbC", DIRECT, None)),  # account IDs keep their case
+])
+def test_record_fields(line, expected):
+    parsed = parse_ads_txt(line)
+    assert len(parsed) == 1
+    assert [r for records in parsed.records.values() for r in records] == [AdsTxtRecord(*expected)]
+
+
+@pytest.mark.parametrize("line", [
+    "",
+    "# google.com, pub-1, DIRECT",
+    "   # indented comment",
+    "google.com, pub-1",
+    "google.com, pub-1, PARTNER",
+    ", pub-1, DIRECT",
+    "google.com, , DIRECT",
+    "google.com pub-1 DIRECT",
+    "contact=ads@example.com",
+    "unknownvar=value",
+])
+def test_lines_that_are_not_records(line):
+    assert len(parse_ads_txt(line)) == 0
+
+
+def test_variables_are_collected_case_insensitively():
+    parsed = parse_ads_txt(
+        "CONTACT=ads@example.com\n"
+        "subdomain=News.Example.com # comment\n"
+        "Subdomain = sport.example.com\n"
+        "OwnerDomain=Example.com\n"
+        "somethingelse=ignored\n"
+    )
+    assert parsed.variables == {
+        "contact": ["ads@example.com"],
+        "subdomain": ["news.example.com", "sport.example.com"],
+        "ownerdomain": ["Example.com"],
+    }
+    assert parsed.subdomains == ["news.example.com", "sport.example.com"]
+    assert len(parsed) == 0
+
+
+def test_record_with_equals_sign_is_still_a_record():
+    parsed = parse_ads_txt("example.com, id=5, DIRECT")
+    assert parsed.has_direct("example.com", "id=5")
+
+
+def test_bom_and_line_endings():
+    parsed = parse_ads_txt("\ufeffgoogle.com, pub-1, DIRECT\r\nappnexus.com, 7, RESELLER\rrubicon.com, 9, DIRECT")
+    assert sorted(parsed.records) == ["appnexus.com", "google.com", "rubicon.com"]
+
+
+@pytest.mark.parametrize("query, account, expected", [
+    ("google.com", None, True),
+    ("GOOGLE.com", None, True),
+    ("google.com", "pub-1", True),
+    ("google.com", "pub-9", False),  # only a RESELLER line
+    ("google.com", "PUB-1", False),
+    ("appnexus.com", None, False),
+    ("missing.com", None, False),
+])
+def test_has_direct(query, account, expected):
+    parsed = parse_ads_txt("google.com, pub-1, DIRECT\ngoogle.com, pub-9, RESELLER\nappnexus.com, 7, RESELLER")
+    assert parsed.has_direct(query, account) is expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("oms.com, 1, DIRECT", False),
+    ("oms.com, 1, DIRECT\noms.com, 2, DIRECT", True),
+    ("oms.com, 2, DIRECT", True),
+    ("oms.com, 2, RESELLER", False),
+    ("oms.com, 1, DIRECT\noms.com, 1, DIRECT", False),
+])
+def test_has_other_direct(text, expected):
+    assert parse_ads_txt(text).has_other_direct("oms.com", "1") is expected
+
+
+def test_digest_is_the_content_hash():
+    assert parse_ads_txt("a.com, 1, DIRECT").digest == content_hash("a.com, 1, DIRECT")
+    assert parse_ads_txt(None).digest == content_hash("")
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("connatix.com, 12345, DIRECT", "connatix.com"),
+    ("  Connatix.COM ,12345,DIRECT", "connatix.com"),
+])
+def test_direct_line_ad_system(line, expected):
+    assert direct_line_ad_system(line) == expected
@@ -0,0 +1,237 @@
+import asyncio
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+import net_hooks
+from dns_resolver import (
+    DNS_ERROR, DNS_NO_ADDRESS, DNS_NXDOMAIN, DNS_OK, RCODE_NXDOMAIN, TYPE_A, TYPE_AAAA, TYPE_CNAME, TYPE_SOA,
+    DnsCache, DnsFormatError, DnsResolver, build_query, parse_response
+)
+
+RCODE_SERVFAIL = 2
+
+
+# --- STUB NAME SERVER ---
+def encode_name(name):
+    return b"".join(bytes([len(label)]) + label.encode("ascii") for label in name.split(".")) + b"\0"
+
+
+def encode_record(name, rtype, ttl, value):
+    if rtype == TYPE_A:
+        rdata = socket.inet_pton(socket.AF_INET, value)
+    elif rtype == TYPE_AAAA:
+        rdata = socket.inet_pton(socket.AF_INET6, value)
+    elif rtype == TYPE_CNAME:
+        rdata = encode_name(value)
+    else:  # SOA: root mname/rname, then serial refresh retry expire minimum
+        rdata = b"\0\0" + struct.pack("!IIIII", 1, 3600, 600, 86400, value)
+    return encode_name(name) + struct.pack("!HHIH", rtype, 1, ttl, len(rdata)) + rdata
+
+
+def encode_response(query_id, question, rcode=0, answers=(), authority=(), truncated=False):
+    flags = 0x8180 | rcode | (0x200 if truncated else 0)
+    header = struct.pack("!HHHHHH", query_id, flags, 1, len(answers), len(authority), 0)
+    return header + question + b"".join(encode_record(*r) for r in list(answers) + list(authority))
+
+
+class StubServer(asyncio.DatagramProtocol):
+    # Answers from `zone`: {name: [(name, type, ttl, value), ...]} (all types;
+    # each query gets the CNAMEs plus the records of its type), `nxdomain`
+    # names with an SOA minimum of `negative_ttl`, and SERVFAIL for `broken`.
+    def __init__(self, zone, nxdomain=(), broken=(), negative_ttl=120):
+        self.zone = zone
+        self.nxdomain = set(nxdomain)
+        self.broken = set(broken)
+        self.negative_ttl = negative_ttl
+        self.queries = Counter()
+        self.clients = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        query_id = struct.unpack_from("!H", data)[0]
+        end = data.index(b"\0", 12) + 5
+        question = data[12:end]
+        labels, offset = [], 12
+        while data[offset]:
+            labels.append(data[offset + 1:offset + 1 + data[offset]].decode())
+            offset += 1 + data[offset]
+        name = ".".join(labels)
+        qtype = struct.unpack_from("!H", data, offset + 1)[0]
+        self.queries[name, qtype] += 1
+        self.clients.add(addr)
+        soa = [("test", TYPE_SOA, 3600, self.negative_ttl)]
+        if name in self.broken:
+            reply = encode_response(query_id, question, RCODE_SERVFAIL)
+        elif name in self.nxdomain:
+            reply = encode_response(query_id, question, RCODE_NXDOMAIN, authority=soa)
+        else:
+            records = [r for r in self.zone.get(name, []) if r[1] in (TYPE_CNAME, qtype)]
+            reply = encode_response(query_id, question, answers=records, authority=[] if records else soa)
+        self.transport.sendto(reply, addr)
+
+
+@pytest.fixture
+def serve():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    transports = []
+
+    def start(**kwargs):
+        transport, protocol = asyncio.run_coroutine_threadsafe(
+            loop.create_datagram_endpoint(lambda: StubServer(**kwargs), local_addr=("127.0.0.1", 0)), loop
+        ).result()
+        transports.append(transport)
+        host, port = transport.get_extra_info("sockname")
+        return f"{host}:{port}", protocol
+
+    yield start
+    for transport in transports:
+        loop.call_soon_threadsafe(transport.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+@pytest.fixture
+def system_resolver():
+    # What the system resolver fallback sees: {host: ip}; anything else is EAI_NONAME
+    hosts = {}
+
+    def resolve(host, port, family):
+        if host not in hosts:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (hosts[host], port))]
+
+    net_hooks.set_resolver(resolve)
+    yield hosts
+    net_hooks.set_resolver(None)
+    net_hooks.set_dns_cache(None)
+
+
+# --- WIRE FORMAT ---
+def test_parse_response_reads_records_and_compressed_names():
+    query = build_query(0x1234, "www.Example.test", TYPE_A)
+    question = query[12:-15]  # the name, without its type/class and the OPT record
+    pointer = b"\xc0\x0c"  # back to the question name
+    cname = pointer + struct.pack("!HHIH", TYPE_CNAME, 1, 60, 2) + pointer
+    answer = encode_record("www.example.test", TYPE_A, 300, "192.0.2.1")
+    aaaa = encode_record("www.example.test", TYPE_AAAA, 200, "2001:db8::1")
+    message = struct.pack("!HHHHHH", 0x1234, 0x8180, 1, 3, 1, 0) + question + struct.pack("!HH", TYPE_A, 1)
+    message += cname + answer + aaaa + encode_record("example.test", TYPE_SOA, 900, 45)
+
+    query_id, name, response = parse_response(message)
+    assert (query_id, name) == (0x1234, "www.example.test")
+    assert response.rcode == 0 and not response.truncated
+    assert response.records == [
+        ("www.example.test", TYPE_CNAME, 60, "www.example.test"),
+        ("www.example.test", TYPE_A, 300, "192.0.2.1"),
+        ("www.example.test", TYPE_AAAA, 200, "2001:db8::1"),
+    ]
+    assert response.negative_ttl == 45
+
+
+@pytest.mark.parametrize("message", [
+    b"\x00\x01",
+    struct.pack("!HHHHHH", 1, 0x8180, 1, 0, 0, 0) + b"\x07example",
+    struct.pack("!HHHHHH", 1, 0x8180, 1, 0, 0, 0) + b"\xc0\x0c",
+])
+def test_parse_response_rejects_malformed_messages(message):
+    with pytest.raises(DnsFormatError):
+        parse_response(message)
+
+
+# --- RESOLVER ---
+def test_cname_chain_answer_and_targets_are_cached(serve, system_resolver):
+    address, _ = serve(zone={"www.pub.test": [
+        ("www.pub.test", TYPE_CNAME, 60, "pub.edge.test"),
+        ("pub.edge.test", TYPE_CNAME, 600, "edge.cdn.test"),
+        ("edge.cdn.test", TYPE_A, 300, "192.0.2.10"),
+        ("edge.cdn.test", TYPE_AAAA, 300, "2001:db8::10"),
+    ]})
+    cache = DnsCache()
+    now = time.time()
+    answer = DnsResolver(address, cache=cache).resolve("www.pub.test")
+
+    assert answer.status == DNS_OK
+    assert answer.addresses == ((socket.AF_INET, "192.0.2.10"), (socket.AF_INET6, "2001:db8::10"))
+    assert now + 55 < answer.expires <= time.time() + 60  # the shortest link in the chain
+    assert cache.get("edge.cdn.test").addresses == answer.addresses
+    assert cache.addrinfo("www.pub.test", 443, socket.AF_INET) == [
+        (socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("192.0.2.10", 443))]
+
+
+def test_short_ttls_are_respected(serve, system_resolver):
+    address, _ = serve(zone={"fast.test": [("fast.test", TYPE_A, 5, "192.0.2.5")]})
+    answer = DnsResolver(address, cache=DnsCache()).resolve("fast.test")
+    assert answer.status == DNS_OK
+    assert answer.expires <= time.time() + 5
+
+
+def test_negative_answers_are_cached_for_the_soa_minimum(serve, system_resolver):
+    address, server = serve(zone={}, nxdomain={"gone.test"}, negative_ttl=120)
+    resolver = DnsResolver(address, cache=DnsCache())
+    now = time.time()
+    answers = resolver.resolve_many(["gone.test", "empty.test"])
+    assert answers["gone.test"].status == DNS_NXDOMAIN
+    assert answers["empty.test"].status == DNS_NO_ADDRESS
+    assert now + 115 < answers["gone.test"].expires <= time.time() + 120
+
+    assert resolver.resolve_many(["gone.test", "empty.test"]) == answers
+    assert server.queries["gone.test", TYPE_A] == 1
+    assert server.queries["empty.test", TYPE_AAAA] == 1
+
+
+def test_system_resolver_can_still_find_a_missing_name(serve, system_resolver):
+    address, _ = serve(zone={}, nxdomain={"intranet"})
+    system_resolver["intranet"] = "10.0.0.7"
+    answer = DnsResolver(address, cache=DnsCache()).resolve("intranet")
+    assert answer.status == DNS_OK
+    assert answer.addresses == ((socket.AF_INET, "10.0.0.7"),)
+
+
+def test_resolve_many_mixes_statuses_and_only_caches_what_it_learned(serve, system_resolver):
+    address, server = serve(
+        zone={"a.test": [("a.test", TYPE_A, 300, "192.0.2.1")], "b.test": [("b.test", TYPE_A, 300, "192.0.2.2")]},
+        nxdomain={"nx.test"}, broken={"broken.test"}
+    )
+    cache = DnsCache()
+    resolver = DnsResolver(address, timeout=0.5, attempts=1, cache=cache)
+    answers = resolver.resolve_many(["A.test", "b.test.", "nx.test", "broken.test", "a.test"])
+
+    assert {host: answer.status for host, answer in answers.items()} == {
+        "a.test": DNS_OK, "b.test": DNS_OK, "nx.test": DNS_NXDOMAIN, "broken.test": DNS_ERROR}
+    assert server.queries["a.test", TYPE_A] == 1
+    assert cache.get("broken.test") is None
+    assert len(cache) == 3
+
+    resolver.resolve_many(["a.test", "broken.test"])
+    assert server.queries["a.test", TYPE_A] == 1
+    assert server.queries["broken.test", TYPE_A] == 2
+
+
+def test_batches_share_one_socket_until_closed(serve, system_resolver):
+    address, server = serve(zone={f"{name}.test": [(f"{name}.test", TYPE_A, 300, "192.0.2.1")] for name in "abc"})
+    resolver = DnsResolver(address, cache=DnsCache())
+    resolver.resolve_many(["a.test"])
+    resolver.resolve_many(["b.test"])
+    assert len(server.clients) == 1
+
+    resolver.close()
+    assert resolver.resolve("c.test").status == DNS_OK
+    assert len(server.clients) == 2
+    resolver.close()
+
+
+def test_unreachable_server_leaves_hosts_to_the_fetch(system_resolver):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    resolver = DnsResolver(f"127.0.0.1:{port}", timeout=0.2, attempts=1, cache=DnsCache())
+    assert resolver.resolve("a.test").status == DNS_ERROR
@@ -0,0 +1,113 @@
+import socket
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NameResolutionError
+
+import scanner
+from domain_health import (
+    BACKOFF_BASE, BACKOFF_MAX, FAILURE_CONNECTION, FAILURE_DNS, FAILURE_SSL, FAILURE_TIMEOUT,
+    REASON_RECENTLY_UNREACHABLE, DomainHealth, backoff_seconds, failure_kind, unreachable_reason
+)
+from http_client import RedirectPolicyError
+from pipeline import HealthStage
+
+
+def dns_error():
+    reason = NameResolutionError("gone.test", None, socket.gaierror(socket.EAI_NONAME, "Name or service not known"))
+    return requests.exceptions.ConnectionError(MaxRetryError(None, "/ads.txt", reason))
+
+
+@pytest.fixture
+def health(tmp_path):
+    health = DomainHealth(str(tmp_path / "health.sqlite"))
+    yield health
+    health.close()
+
+
+@pytest.mark.parametrize("exc, kind", [
+    (requests.exceptions.SSLError("certificate has expired"), FAILURE_SSL),
+    (requests.exceptions.ConnectTimeout("connect timed out"), FAILURE_TIMEOUT),
+    (requests.exceptions.ReadTimeout("read timed out"), FAILURE_TIMEOUT),
+    (dns_error(), FAILURE_DNS),
+    (requests.exceptions.ConnectionError("Connection refused"), FAILURE_CONNECTION),
+    (requests.exceptions.HTTPError("404 Client Error"), None),
+    (RedirectPolicyError("Exceeded 5 redirects"), None),
+    (ValueError("not a transport failure"), None),
+])
+def test_failure_kind(exc, kind):
+    assert failure_kind(exc) == kind
+
+
+def test_backoff_doubles_up_to_a_week():
+    assert [backoff_seconds(n) for n in (0, 1, 2, 3)] == [BACKOFF_BASE, BACKOFF_BASE, 2 * BACKOFF_BASE,
+                                                          4 * BACKOFF_BASE]
+    assert backoff_seconds(50) == BACKOFF_MAX
+
+
+def test_failures_back_off_until_a_success(health):
+    assert health.record_failure("Slow.test", FAILURE_TIMEOUT) == 1
+    assert health.record_failure("slow.test", FAILURE_CONNECTION) == 2
+    health.record_failure("dead.test", FAILURE_DNS)
+
+    entry = health.unreachable(["SLOW.test", "ok.test"])["slow.test"]
+    assert (entry.failure, entry.failures) == (FAILURE_CONNECTION, 2)
+    assert entry.retry_after == pytest.approx(entry.last_failed + 2 * BACKOFF_BASE)
+    assert entry.first_failed <= entry.last_failed
+    assert set(health.unreachable(["slow.test", "dead.test"], now=entry.last_failed + BACKOFF_BASE + 1)) == {
+        "slow.test"}
+    assert health.stats() == {"domains": 2, "backing_off": 2}
+
+    health.record_success("slow.test")
+    assert set(health.unreachable(["slow.test", "dead.test"])) == {"dead.test"}
+    assert health.record_failure("slow.test", FAILURE_TIMEOUT) == 1  # the streak starts over
+    health.clear()
+    assert health.stats() == {"domains": 0, "backing_off": 0}
+
+
+def test_lookups_past_the_parameter_limit(health):
+    domains = [f"site{i}.test" for i in range(1200)]
+    for domain in domains[::100]:
+        health.record_failure(domain, FAILURE_SSL)
+    assert set(health.unreachable(domains)) == set(domains[::100])
+
+
+@pytest.mark.parametrize("exc, kind, reason", [
+    (requests.exceptions.SSLError("bad certificate"), FAILURE_SSL, scanner.REASON_SSL_ERROR),
+    (requests.exceptions.ConnectTimeout("timed out"), FAILURE_TIMEOUT, "⚠️ Connection Error: timed out"),
+    (dns_error(), FAILURE_DNS, "⚠️ Connection Error: "),
+    (requests.exceptions.ConnectionError("refused"), FAILURE_CONNECTION, "⚠️ Connection Error: refused"),
+    (requests.exceptions.HTTPError("503 Server Error"), None, "⚠️ Connection Error: 503 Server Error"),
+    (RedirectPolicyError("Exceeded 5 redirects"), None, "⚠️ Connection Error: Exceeded 5 redirects"),
+])
+def test_fetch_failures_give_a_skip_reason_and_update_health(health, monkeypatch, exc, kind, reason):
+    def fetch(domain, **fetch_options):
+        raise exc
+
+    monkeypatch.setattr(scanner, "fetch_ads_txt", fetch)
+    parsed, skip_reason = scanner.fetch_and_parse("pub.test", health=health)
+    assert parsed is None and skip_reason.startswith(reason)
+    recorded = health.unreachable(["pub.test"])
+    assert (recorded["pub.test"].failure if recorded else None) == kind
+
+
+def test_successful_fetch_clears_the_domain(health, monkeypatch):
+    health.record_failure("pub.test", FAILURE_TIMEOUT)
+    monkeypatch.setattr(scanner, "fetch_ads_txt", lambda domain, **fetch_options: "google.com, 1, DIRECT\n")
+    parsed, reason = scanner.fetch_and_parse("pub.test", health=health)
+    assert reason is None and len(parsed) == 1
+    assert health.unreachable(["pub.test"]) == {}
+
+
+@pytest.mark.parametrize("kind, times", [(FAILURE_SSL, 1), (FAILURE_TIMEOUT, 3), (FAILURE_DNS, 2),
+                                         (FAILURE_CONNECTION, 1)])
+def test_health_stage_skip_reason_names_the_failure(health, kind, times):
+    for _ in range(times):
+        health.record_failure("down.test", kind)
+    kept, dropped = HealthStage(health).apply(["up.test", "down.test"])
+    assert kept == ["up.test"]
+    [(domain, reason)] = dropped
+    assert domain == "down.test"
+    assert reason.startswith(f"{REASON_RECENTLY_UNREACHABLE} ({kind} failure ")
+    assert ("once" if times == 1 else f"{times} times in a row") in reason
+    assert reason == unreachable_reason(health.unreachable(["down.test"])["down.test"])
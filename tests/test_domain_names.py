@@ -0,0 +1,78 @@
+import pytest
+
+from domain_names import PublicSuffixList, normalize_domain, registrable_domain, registrable_domains, to_ascii
+
+# checkPublicSuffix() vectors from publicsuffix.org's tests/test_psl.txt
+# (None: the input is itself a public suffix). Mixed-case and leading-dot
+# inputs are left out: hosts reach the lookup normalized.
+PSL_VECTORS = [
+    # Unlisted TLD
+    ("example", None), ("example.example", "example.example"), ("b.example.example", "example.example"),
+    ("a.b.example.example", "example.example"),
+    # TLD with only one rule
+    ("biz", None), ("domain.biz", "domain.biz"), ("b.domain.biz", "domain.biz"), ("a.b.domain.biz", "domain.biz"),
+    # TLD with some two-level rules
+    ("com", None), ("example.com", "example.com"), ("b.example.com", "example.com"),
+    ("a.b.example.com", "example.com"), ("uk.com", None), ("example.uk.com", "example.uk.com"),
+    ("b.example.uk.com", "example.uk.com"), ("a.b.example.uk.com", "example.uk.com"), ("test.ac", "test.ac"),
+    # TLD with only one wildcard rule
+    ("mm", None), ("c.mm", None), ("b.c.mm", "b.c.mm"), ("a.b.c.mm", "b.c.mm"),
+    # More complex TLD
+    ("jp", None), ("test.jp", "test.jp"), ("www.test.jp", "test.jp"), ("ac.jp", None),
+    ("test.ac.jp", "test.ac.jp"), ("www.test.ac.jp", "test.ac.jp"), ("kyoto.jp", None),
+    ("test.kyoto.jp", "test.kyoto.jp"), ("ide.kyoto.jp", None), ("b.ide.kyoto.jp", "b.ide.kyoto.jp"),
+    ("a.b.ide.kyoto.jp", "b.ide.kyoto.jp"), ("c.kobe.jp", None), ("b.c.kobe.jp", "b.c.kobe.jp"),
+    ("a.b.c.kobe.jp", "b.c.kobe.jp"), ("city.kobe.jp", "city.kobe.jp"), ("www.city.kobe.jp", "city.kobe.jp"),
+    # TLD with a wildcard rule and exceptions
+    ("ck", None), ("test.ck", None), ("b.test.ck", "b.test.ck"), ("a.b.test.ck", "b.test.ck"),
+    ("www.ck", "www.ck"), ("www.www.ck", "www.ck"),
+    # US K12
+    ("us", None), ("test.us", "test.us"), ("www.test.us", "test.us"), ("ak.us", None),
+    ("test.ak.us", "test.ak.us"), ("www.test.ak.us", "test.ak.us"), ("k12.ak.us", None),
+    ("test.k12.ak.us", "test.k12.ak.us"), ("www.test.k12.ak.us", "test.k12.ak.us"),
+    # IDN labels
+    ("食狮.com.cn", "食狮.com.cn"), ("食狮.公司.cn", "食狮.公司.cn"), ("www.食狮.公司.cn", "食狮.公司.cn"),
+    ("shishi.公司.cn", "shishi.公司.cn"), ("公司.cn", None), ("食狮.中国", "食狮.中国"),
+    ("www.食狮.中国", "食狮.中国"), ("shishi.中国", "shishi.中国"), ("中国", None),
+    # Same as above, but punycoded
+    ("xn--85x722f.com.cn", "xn--85x722f.com.cn"), ("xn--85x722f.xn--55qx5d.cn", "xn--85x722f.xn--55qx5d.cn"),
+    ("www.xn--85x722f.xn--55qx5d.cn", "xn--85x722f.xn--55qx5d.cn"), ("xn--55qx5d.cn", None),
+    ("www.xn--85x722f.xn--fiqs8s", "xn--85x722f.xn--fiqs8s"), ("xn--fiqs8s", None),
+]
+
+
+@pytest.mark.parametrize("domain, expected", PSL_VECTORS)
+def test_psl_vectors(domain, expected):
+    assert registrable_domain(to_ascii(domain)) == (to_ascii(expected) if expected else None)
+
+
+def test_exception_rules_prevail_over_longer_matches():
+    rules = PublicSuffixList(["ck", "*.ck", "!www.ck", "sub.www.ck", "*.www.ck"])
+    assert rules.registrable_domain("a.sub.www.ck") == "www.ck"
+    assert rules.registrable_domain("x.y.www.ck") == "www.ck"
+    assert rules.registrable_domain("a.b.other.ck") == "b.other.ck"
+
+
+def test_registrable_domains_matches_single_lookups():
+    hosts = ["www.example.co.uk", "example.co.uk", "co.uk", "www.example.co.uk", "a.b.c.kobe.jp"]
+    assert registrable_domains(hosts) == [registrable_domain(h) for h in hosts]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("Example.COM", "example.com"),
+    ("HTTPS://Example.com:443/ads.txt?x=1#top", "example.com"),
+    ("user@example.com", "example.com"),
+    ("example.com.", "example.com"),
+    ("Bücher.de", "xn--bcher-kva.de"),
+    ("https://www.食狮.中国/", "www.xn--85x722f.xn--fiqs8s"),
+    ("xn--bcher-kva.de", "xn--bcher-kva.de"),
+    ("_dmarc.example.com", "_dmarc.example.com"),
+    ("localhost", None),
+    ("not a domain", None),
+    ("-bad-.example", None),
+    ("1.2.3.4", None),
+    ("", None),
+    (None, None),
+])
+def test_normalize_domain(value, expected):
+    assert normalize_domain(value) == expected
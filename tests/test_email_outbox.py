@@ -0,0 +1,140 @@
+import gzip
+import io
+import socket
+from email import message_from_bytes, policy
+
+import pandas as pd
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+import email_outbox
+from email_outbox import Outbox, deliver, report_message, smtp_settings, STATUS_FAILED, STATUS_QUEUED, STATUS_SENT
+
+
+class SinkHandler:
+    # Keeps every message; answers 451 to a "flaky" recipient the first time
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+        self.refused = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("flaky@") and address not in self.refused:
+            self.refused.add(address)
+            return "451 Try again later"
+        if address.startswith("bounce@"):
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(message_from_bytes(envelope.content, policy=policy.default))
+        self.sessions.add(id(session))
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def sink():
+    handler = SinkHandler()
+    port = free_port()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        yield handler, smtp_settings({"EMAIL_ADDRESS": "bot@example.test", "SMTP_HOST": "127.0.0.1",
+                                      "SMTP_PORT": port})
+    finally:
+        controller.stop()
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite"))
+    yield outbox
+    outbox.close()
+
+
+def opportunities(rows):
+    return pd.DataFrame({"Domain": [f"site{i}.example" for i in range(rows)],
+                         "Tranco Rank": [rows * 10 - i for i in range(rows)], "OMS Buying": "No"})
+
+
+def test_messages_are_sent_in_batches_over_shared_connections(sink, outbox):
+    handler, settings = sink
+    ids = [outbox.enqueue(report_message(settings.sender, f"user{i}@example.test", opportunities(3)))
+           for i in range(12)]
+    totals = deliver(outbox, settings, batch_size=5)
+    assert totals["sent"] == 12
+    assert totals["connections"] == 3
+    assert len(handler.sessions) == 3
+    assert all(outbox.get(message_id).status == STATUS_SENT for message_id in ids)
+
+
+def test_temporary_refusal_is_retried_after_backoff(sink, outbox, monkeypatch):
+    handler, settings = sink
+    monkeypatch.setattr(email_outbox, "RETRY_DELAY", 0.2)
+    flaky = outbox.enqueue(report_message(settings.sender, "flaky@example.test", opportunities(3)))
+    bounce = outbox.enqueue(report_message(settings.sender, "bounce@example.test", opportunities(3)))
+
+    totals = deliver(outbox, settings)
+    assert totals == {"sent": 0, "retrying": 1, "failed": 1, "connections": 1}
+    message = outbox.get(flaky)
+    assert message.status == STATUS_QUEUED and message.attempts == 1 and "451" in message.error
+    assert message.next_attempt > message.created
+    assert outbox.get(bounce).status == STATUS_FAILED
+
+    assert deliver(outbox, settings, wait=True)["sent"] == 1
+    assert outbox.get(flaky).status == STATUS_SENT
+    assert [m["To"] for m in handler.messages] == ["flaky@example.test"]
+
+
+def test_deliver_can_be_limited_to_given_messages(sink, outbox):
+    handler, settings = sink
+    older = outbox.enqueue(report_message(settings.sender, "older@example.test", opportunities(3)))
+    mine = outbox.enqueue(report_message(settings.sender, "mine@example.test", opportunities(3)))
+    assert deliver(outbox, settings, message_ids=[mine])["sent"] == 1
+    assert outbox.get(older).status == STATUS_QUEUED
+
+
+def test_large_table_is_attached_as_gzipped_csv(sink, outbox):
+    handler, settings = sink
+    table = opportunities(email_outbox.INLINE_ROWS * 4)
+    outbox.enqueue(report_message(settings.sender, "user@example.test", table, "Publisher", "P1"))
+    deliver(outbox, settings)
+
+    message = handler.messages[0]
+    attachment = next(message.iter_attachments())
+    assert attachment.get_filename().endswith(".csv.gz")
+    assert pd.read_csv(io.BytesIO(gzip.decompress(attachment.get_content()))).equals(table)
+    html = message.get_body(("html",)).get_content()
+    assert html.count("<td>site") == email_outbox.INLINE_ROWS
+
+
+def test_best_ranked_rows_are_inlined_from_text_ranks():
+    # A CSV report read back with dtype=str still inlines by numeric rank
+    table = pd.DataFrame({"Domain": [f"site{i}.example" for i in range(60)],
+                          "Tranco Rank": [str(r) for r in [10000] + list(range(2, 61))]})
+    msg = report_message("bot@example.test", "user@example.test", table)
+    html = msg.get_body(("html",)).get_content()
+    assert "<td>site0.example</td>" not in html  # rank 10000 sorts first as text
+    assert "<td>site50.example</td>" in html  # rank 51
+    assert "<td>site51.example</td>" not in html
+
+
+def test_unsendable_message_is_failed_not_left_claimed(sink, outbox, monkeypatch):
+    handler, settings = sink
+    message_id = outbox.enqueue(report_message(settings.sender, "user@example.test", opportunities(3)))
+
+    def broken_send(self, msg):
+        raise UnicodeEncodeError("ascii", "ü", 0, 1, "not encodable")
+
+    monkeypatch.setattr(email_outbox.SmtpConnection, "send", broken_send)
+    assert deliver(outbox, settings)["failed"] == 1
+    message = outbox.get(message_id)
+    assert message.status == STATUS_FAILED and message.attempts == 1
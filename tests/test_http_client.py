@@ -0,0 +1,201 @@
+import socket
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_client
+import net_hooks
+from http_client import HttpClient, RedirectPolicyError, RetryBudget, is_fallback_worthy, is_transient
+from telemetry import ScanTelemetry
+
+BODY = "# ads.txt für Bücher\ngoogle.com, pub-1, DIRECT\n".encode("utf-8")
+
+
+class AdsTxtHandler(BaseHTTPRequestHandler):
+    # Serves BODY, except where `routes` has "<host><path>" -> a redirect
+    # target, or "<host><path>" -> a list of statuses to answer first
+    routes = {}
+    hits = Counter()
+
+    def do_GET(self):
+        key = self.headers["Host"].split(":")[0] + self.path
+        self.hits[key] += 1
+        route = self.routes.get(key)
+        if isinstance(route, str):
+            self.send_response(302)
+            self.send_header("Location", route)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if route:
+            self.send_response(route.pop(0))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AdsTxtHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    AdsTxtHandler.routes = {}
+    AdsTxtHandler.hits = Counter()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def hosts():
+    # Every "*.test" name resolves to the local server; anything else (and
+    # "missing.test") fails as the system resolver would. Counts lookups.
+    lookups = Counter()
+
+    def resolve(host, port, family):
+        lookups[host] += 1
+        if host == "missing.test" or not (host.endswith(".test") or host == "127.0.0.1"):
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("127.0.0.1", port))]
+
+    net_hooks.install_network_hooks()
+    net_hooks.set_resolver(resolve)
+    yield lookups
+    net_hooks.set_resolver(None)
+
+
+def port_of(server):
+    return server.rsplit(":", 1)[1]
+
+
+@pytest.mark.parametrize("max_bytes", [0, 1024])
+def test_probe_records_bytes_not_characters(server, max_bytes):
+    telemetry = ScanTelemetry()
+    result = HttpClient().fetch(f"{server}/ads.txt", 5, telemetry=telemetry, max_bytes=max_bytes)
+    assert len(result.text) < len(BODY)
+    assert telemetry.probes[0].bytes == len(BODY)
+
+
+# --- REDIRECT POLICY ---
+def chain(port, hosts_and_paths):
+    # Redirects each (host, path) to the next; the last one serves the file
+    for (host, path), (next_host, next_path) in zip(hosts_and_paths, hosts_and_paths[1:]):
+        AdsTxtHandler.routes[host + path] = f"http://{next_host}:{port}{next_path}"
+
+
+def test_follows_up_to_five_redirects_within_the_root(server, hosts):
+    port = port_of(server)
+    hops = [("pub.test", "/ads.txt"), ("www.pub.test", "/ads.txt")] + [("cdn.pub.test", f"/{i}") for i in range(4)]
+    chain(port, hops)
+    result = HttpClient().fetch(f"http://pub.test:{port}/ads.txt", 5)
+    assert (result.status_code, result.redirects) == (200, 5)
+    assert result.url == f"http://cdn.pub.test:{port}/3"
+
+    chain(port, hops + [("cdn.pub.test", "/4")])
+    with pytest.raises(RedirectPolicyError, match="5 redirects"):
+        HttpClient().fetch(f"http://pub.test:{port}/ads.txt", 5)
+
+
+def test_only_one_hop_may_leave_the_root(server, hosts):
+    port = port_of(server)
+    chain(port, [("www.pub.test", "/ads.txt"), ("pub.test", "/ads.txt"), ("host.test", "/pub/ads.txt")])
+    result = HttpClient().fetch(f"http://www.pub.test:{port}/ads.txt", 5)
+    assert (result.status_code, result.redirects) == (200, 2)
+
+    chain(port, [("pub.test", "/two"), ("host.test", "/ads.txt"), ("host.test", "/final")])
+    with pytest.raises(RedirectPolicyError, match="outside pub.test"):
+        HttpClient().fetch(f"http://pub.test:{port}/two", 5)
+    # the third party's host redirecting back into the root is an error too
+    chain(port, [("pub.test", "/back"), ("host.test", "/back"), ("www.pub.test", "/back")])
+    with pytest.raises(RedirectPolicyError, match="outside pub.test"):
+        HttpClient().fetch(f"http://pub.test:{port}/back", 5)
+
+
+def test_redirects_to_other_schemes_are_refused(server, hosts):
+    AdsTxtHandler.routes["pub.test/ads.txt"] = "ftp://pub.test/ads.txt"
+    with pytest.raises(RedirectPolicyError, match="unsupported"):
+        HttpClient().fetch(f"http://pub.test:{port_of(server)}/ads.txt", 5)
+
+
+# --- HTTP FALLBACK ---
+def test_tls_failure_falls_back_to_plain_http(server, hosts):
+    url = f"https://pub.test:{port_of(server)}/ads.txt"
+    with pytest.raises(requests.exceptions.SSLError):
+        HttpClient().fetch(url, 5)
+    result = HttpClient().fetch(url, 5, http_fallback=True)
+    assert result.status_code == 200
+    assert result.url == f"http://pub.test:{port_of(server)}/ads.txt"
+
+
+def test_dns_failure_does_not_fall_back(server, hosts):
+    with pytest.raises(requests.exceptions.ConnectionError) as raised:
+        HttpClient().fetch(f"https://missing.test:{port_of(server)}/ads.txt", 5, http_fallback=True,
+                           retry_budget=RetryBudget(10))
+    assert not is_fallback_worthy(raised.value) and not is_transient(raised.value)
+    assert hosts["missing.test"] == 1  # neither retried nor tried again over HTTP
+
+
+def test_refused_connection_is_transient_and_fallback_worthy(hosts):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    with pytest.raises(requests.exceptions.ConnectionError) as raised:
+        HttpClient().fetch(f"https://pub.test:{port}/ads.txt", 5)
+    assert is_fallback_worthy(raised.value) and is_transient(raised.value)
+
+
+# --- RETRIES ---
+def test_retry_budget_sizing_and_resize():
+    assert RetryBudget.for_scan(5).total == http_client.MIN_RETRY_BUDGET
+    assert RetryBudget.for_scan(1000).total == 100
+    budget = RetryBudget(2)
+    assert budget.take() and budget.take() and not budget.take()
+    assert budget.used == 2
+    budget.resize(5)
+    assert (budget.total, budget.remaining) == (5, 3)
+    budget.resize(1)
+    assert (budget.total, budget.remaining, budget.used) == (1, 0, 1)
+    assert not RetryBudget(-3).take()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_client, "backoff_delay", lambda attempt: 0)
+
+
+def test_retryable_statuses_are_retried_within_the_budget(server, no_backoff):
+    AdsTxtHandler.routes["127.0.0.1/ads.txt"] = [503, 429]
+    budget = RetryBudget(5)
+    telemetry = ScanTelemetry()
+    result = HttpClient().fetch(f"{server}/ads.txt", 5, retry_budget=budget, telemetry=telemetry)
+    assert result.status_code == 200
+    assert budget.used == 2
+    assert telemetry.probes[0].retries == 2
+
+
+def test_spent_budget_returns_the_last_status(server, no_backoff):
+    AdsTxtHandler.routes["127.0.0.1/ads.txt"] = [503, 503, 503]
+    budget = RetryBudget(1)
+    assert HttpClient().fetch(f"{server}/ads.txt", 5, retry_budget=budget).status_code == 503
+    assert AdsTxtHandler.hits["127.0.0.1/ads.txt"] == 2
+    assert HttpClient().fetch(f"{server}/ads.txt", 5).status_code == 503  # no budget: no retries
+    assert AdsTxtHandler.hits["127.0.0.1/ads.txt"] == 3
+
+
+def test_attempts_are_capped_whatever_the_budget(server, no_backoff):
+    AdsTxtHandler.routes["127.0.0.1/ads.txt"] = [502] * 5
+    budget = RetryBudget(10)
+    assert HttpClient().fetch(f"{server}/ads.txt", 5, retry_budget=budget).status_code == 502
+    assert AdsTxtHandler.hits["127.0.0.1/ads.txt"] == http_client.MAX_ATTEMPTS
+    assert budget.used == http_client.MAX_ATTEMPTS - 1
@@ -0,0 +1,105 @@
+import pytest
+
+import multi_scan
+from ads_txt import direct_line_ad_system, parse_ads_txt
+from multi_scan import AdsTxtIndex, evaluate_publisher, scan_publishers
+from pipeline import REASON_INVALID_DOMAIN, REASON_NOT_RANKED
+from scanner import OMS_AD_SYSTEM, evaluate_rules
+
+OMS = OMS_AD_SYSTEM
+FILES = {
+    "plain.com": "google.com, pub-1, DIRECT\n",
+    "oms-us.com": f"google.com, pub-1, DIRECT\n{OMS}, 100, DIRECT\n",
+    "oms-other.com": f"google.com, pub-2, DIRECT\n{OMS}, 200, DIRECT\n",
+    "oms-both.com": f"google.com, pub-3, DIRECT\n{OMS}, 100, DIRECT\n{OMS}, 200, DIRECT\n",
+    "oms-reseller.com": f"google.com, pub-4, DIRECT\n{OMS}, 300, RESELLER\n",
+    "reseller-only.com": "google.com, pub-5, RESELLER\nappnexus.com, 9, DIRECT\n",
+    "appnexus.com": "AppNexus.com, 7, DIRECT\n",
+    "unranked.com": "google.com, pub-6, DIRECT\n",
+    "empty.com": "",
+}
+RANKS = {domain: rank for rank, domain in enumerate(FILES, start=1) if domain != "unranked.com"}
+PUBLISHERS = [
+    {"pub_id": "100", "sample_direct_line": "google.com, pub-x, DIRECT"},
+    {"pub_id": " 200 ", "sample_direct_line": "google.com, pub-x, DIRECT"},
+    {"pub_id": "300", "sample_direct_line": "google.com, pub-x, DIRECT"},
+    {"pub_id": "100", "sample_direct_line": "appnexus.com, 1, DIRECT"},
+]
+
+
+def index_of(files, ad_systems=None):
+    index = AdsTxtIndex(ad_systems)
+    for domain, text in files.items():
+        index.add(domain, parse_ads_txt(text))
+    return index
+
+
+def rules_for_each_domain(domains, publisher):
+    # The single-publisher scanner's rules, one parsed file at a time
+    results, skipped = [], []
+    for domain in domains:
+        result, reason = evaluate_rules(domain, parse_ads_txt(FILES[domain]), publisher["pub_id"].strip(),
+                                        direct_line_ad_system(publisher["sample_direct_line"]), RANKS)
+        if result is None:
+            skipped.append((domain, reason))
+        else:
+            results.append(result)
+    return results, skipped
+
+
+@pytest.mark.parametrize("publisher", PUBLISHERS)
+def test_index_gives_the_same_outcomes_as_evaluate_rules(publisher):
+    index = index_of(FILES, {OMS, "google.com", "appnexus.com"})
+    outcome = evaluate_publisher(index, list(FILES), publisher["pub_id"], publisher["sample_direct_line"], RANKS)
+    assert outcome == rules_for_each_domain(list(FILES), publisher)
+
+
+def test_index_lookups_by_ad_system_and_account():
+    index = index_of(FILES)
+    assert index.domains_with_account(OMS.upper(), "100") == {"oms-us.com", "oms-both.com"}
+    assert index.domains_with_other_account(OMS, "100") == {"oms-other.com", "oms-both.com"}
+    assert index.domains_with_other_account(OMS, "999") == {"oms-us.com", "oms-other.com", "oms-both.com"}
+    assert index.domains_with_other_account("nobody.com", "1") == set()
+    assert index.domains_with_direct("appnexus.com") == {"reseller-only.com", "appnexus.com"}
+    assert index.domains_with_account("google.com", "pub-5") == set()  # RESELLER lines aren't indexed
+
+
+def test_only_requested_ad_systems_are_indexed():
+    index = index_of(FILES, {OMS})
+    assert set(index.direct) == {OMS}
+    assert index.domains_with_direct("google.com") == set()
+    assert index.fetched == set(FILES)
+
+
+def test_scan_publishers_fetches_each_domain_once(monkeypatch):
+    fetched = []
+
+    def fake_fetch(domains, **fetch_options):
+        for domain in domains:
+            fetched.append(domain)
+            if domain == "down.com":
+                yield domain, None, "⚠️ Connection Error"
+            else:
+                yield domain, parse_ads_txt(FILES[domain]), None
+
+    monkeypatch.setattr(multi_scan, "iter_fetch", fake_fetch)
+    ranks = dict(RANKS, **{"down.com": 50})
+    first = dict(PUBLISHERS[0], domains=["Plain.com", "oms-us.com", "down.com", "unranked.com", "not a domain"])
+    second = dict(PUBLISHERS[1], domains=["plain.com", "https://oms-other.com/", "oms-both.com", "down.com"])
+    progress = []
+    outcomes = scan_publishers([first, second], ranks, on_progress=lambda done, total, _, found: progress.append(
+        (done, total, found)))
+
+    assert sorted(fetched) == ["down.com", "oms-both.com", "oms-other.com", "oms-us.com", "plain.com"]
+    (first_results, first_skipped), (second_results, second_skipped) = outcomes
+    assert progress[-1] == (7, 7, len(first_results) + len(second_results)) and len(progress) == 7
+    assert [found for _, _, found in progress] == sorted(found for _, _, found in progress)
+    assert [r["Domain"] for r in first_results] == ["plain.com"]
+    assert sorted(first_skipped) == sorted([
+        ("oms-us.com", "OMS is already buying from this publisher"), ("down.com", "⚠️ Connection Error"),
+        ("unranked.com", REASON_NOT_RANKED), ("not a domain", REASON_INVALID_DOMAIN),
+    ])
+    assert [(r["Domain"], r["OMS Buying"]) for r in second_results] == [("plain.com", "No")]
+    assert second_skipped == [("oms-other.com", "OMS is already buying from this publisher"),
+                              ("oms-both.com", "OMS is already buying from this publisher"),
+                              ("down.com", "⚠️ Connection Error")]
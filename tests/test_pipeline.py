@@ -0,0 +1,114 @@
+import pytest
+
+from dns_resolver import DNS_ERROR, DNS_NO_ADDRESS, DNS_NXDOMAIN, DNS_OK, DnsAnswer
+from domain_health import DomainHealth, FAILURE_TIMEOUT, REASON_RECENTLY_UNREACHABLE
+from pipeline import (
+    DedupStage, DnsStage, RankStage, build_pipeline, REASON_DENY_LIST, REASON_INVALID_DOMAIN, REASON_NOT_ALLOWED,
+    REASON_NOT_RANKED, REASON_NO_ADDRESS, REASON_NXDOMAIN, STAGE_DEDUP, STAGE_DNS, STAGE_DOMAIN_LIST,
+    STAGE_HEALTH, STAGE_NORMALIZE, STAGE_RANK
+)
+from tranco_index import TrancoIndex, TrancoIndexBuilder
+
+RANKS = {"a.example": 1, "b.example": 2, "c.example": 3, "example.co.uk": 4, "deny.example": 5,
+         "far.example": 900}
+
+
+class FakeResolver:
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    def resolve_many(self, hosts):
+        self.calls.append(list(hosts))
+        return {host: DnsAnswer(self.statuses.get(host, DNS_OK), (), 0) for host in hosts}
+
+
+@pytest.fixture
+def index_view(tmp_path):
+    builder = TrancoIndexBuilder()
+    for domain, rank in RANKS.items():
+        builder.add(rank, domain)
+    builder.write(str(tmp_path / "index.bin"))
+    return TrancoIndex(str(tmp_path / "index.bin")).view(1000)
+
+
+@pytest.fixture
+def health(tmp_path):
+    health = DomainHealth(str(tmp_path / "health.sqlite"))
+    yield health
+    health.close()
+
+
+def test_dedup_removes_repeats_without_skip_entries():
+    kept, dropped = DedupStage().apply(["a.example", "b.example", "a.example", "a.example"])
+    assert kept == ["a.example", "b.example"]
+    assert dropped == [(None, None), (None, None)]
+
+
+@pytest.mark.parametrize("rankings", ["dict", "index"])
+def test_rank_stage_lookups(rankings, index_view):
+    stage = RankStage(RANKS if rankings == "dict" else index_view, max_rank=100)
+    kept, dropped = stage.apply(["b.example", "missing.example", "far.example", "a.example"])
+    assert kept == ["b.example", "a.example"]
+    assert dropped == [("missing.example", REASON_NOT_RANKED), ("far.example", "Ranked below the top 100")]
+
+
+def test_rank_stage_index_falls_back_to_the_registrable_domain(index_view):
+    kept, dropped = RankStage(index_view).apply(["news.example.co.uk", "other.co.uk"])
+    assert kept == ["news.example.co.uk"]
+    assert dropped == [("other.co.uk", REASON_NOT_RANKED)]
+
+
+def test_stages_run_in_order_and_report_their_reasons(index_view, health):
+    health.record_failure("c.example", FAILURE_TIMEOUT)
+    resolver = FakeResolver({"b.example": DNS_NXDOMAIN, "news.example.co.uk": DNS_NO_ADDRESS,
+                             "a.example": DNS_ERROR})
+    pipeline = build_pipeline(index_view, health=health, deny=["deny.example"], dns_resolver=resolver)
+    domains = ["A.example", "a.example", "not a domain", "b.example", "c.example", "sub.deny.example",
+               "missing.example", "news.example.co.uk"]
+
+    kept, skipped = pipeline.filter(domains)
+
+    assert kept == ["a.example"]  # a failed lookup is left to the fetch
+    reasons = dict(skipped)
+    assert reasons.pop("c.example").startswith(REASON_RECENTLY_UNREACHABLE)
+    assert skipped[:3] == [("not a domain", REASON_INVALID_DOMAIN), ("sub.deny.example", REASON_DENY_LIST),
+                           ("missing.example", REASON_NOT_RANKED)]
+    assert reasons == {"not a domain": REASON_INVALID_DOMAIN, "sub.deny.example": REASON_DENY_LIST,
+                       "missing.example": REASON_NOT_RANKED, "b.example": REASON_NXDOMAIN,
+                       "news.example.co.uk": REASON_NO_ADDRESS}
+    # Only what the cheaper stages left reaches DNS
+    assert resolver.calls == [["a.example", "b.example", "news.example.co.uk"]]
+    assert {row["Stage"]: (row["In"], row["Removed"]) for row in pipeline.report()}["Deduplication"] == (7, 1)
+    assert [(pipeline.entered[s], pipeline.removed[s])
+            for s in (STAGE_NORMALIZE, STAGE_DEDUP, STAGE_DOMAIN_LIST, STAGE_RANK, STAGE_HEALTH, STAGE_DNS)] == [
+        (8, 1), (7, 1), (6, 1), (5, 1), (4, 1), (3, 2)]
+
+
+def test_allow_list_is_exhaustive_and_deny_wins():
+    pipeline = build_pipeline(RANKS, allow=["a.example", "deny.example"], deny=["deny.example"])
+    kept, skipped = pipeline.filter(["a.example", "b.example", "deny.example"])
+    assert kept == ["a.example"]
+    assert skipped == [("b.example", REASON_NOT_ALLOWED), ("deny.example", REASON_DENY_LIST)]
+
+
+def test_reprobe_moves_unreachable_domains_last(health):
+    health.record_failure("a.example", FAILURE_TIMEOUT)
+    kept, skipped = build_pipeline(RANKS, health=health, reprobe_unreachable=True).filter(
+        ["a.example", "b.example", "c.example"])
+    assert kept == ["b.example", "c.example", "a.example"]
+    assert skipped == []
+
+
+def test_counts_accumulate_across_batches():
+    pipeline = build_pipeline(RANKS)
+    pipeline.filter(["a.example", "missing.example"])
+    pipeline.filter(["b.example", "b.example"])
+    assert (pipeline.entered[STAGE_RANK], pipeline.removed[STAGE_RANK]) == (3, 1)
+    assert pipeline.removed[STAGE_DEDUP] == 1
+
+
+def test_dns_stage_keeps_hosts_without_an_answer():
+    kept, dropped = DnsStage(FakeResolver({"x.example": DNS_NXDOMAIN})).apply(["x.example", "y.example"])
+    assert kept == ["y.example"]
+    assert dropped == [("x.example", REASON_NXDOMAIN)]
@@ -0,0 +1,82 @@
+import pytest
+
+from ads_cache import AdsTxtCache
+from run_history import RunHistory, RunRecorder
+from scanner import scan_domains
+
+DIRECT_LINE = "google.com, pub-1, DIRECT"
+RANKS = {"a.example": 10, "b.example": 20, "c.example": 30}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.status_code = 200
+        self.text = text
+        self.headers = {}
+
+
+class FakeClient:
+    # Serves ads.txt bodies from a dict and counts the requests
+    def __init__(self, files):
+        self.files = files
+        self.fetched = []
+
+    def fetch(self, url, timeout, headers=None, **kwargs):
+        domain = url.split("/")[2]
+        self.fetched.append(domain)
+        return FakeResponse(self.files[domain])
+
+
+@pytest.fixture
+def stores(tmp_path):
+    history = RunHistory(str(tmp_path / "history.sqlite"))
+    cache = AdsTxtCache(str(tmp_path / "ads.sqlite"))
+    yield history, cache
+    cache.close()
+    history.close()
+
+
+def scan(history, cache, client, refresh, ranks=RANKS):
+    run = RunRecorder(history, "Pub", "1", "google.com", refresh=refresh)
+    results, skipped = scan_domains(list(RANKS), "1", DIRECT_LINE, ranks, run=run, cache=cache, client=client)
+    run.finish(results, len(RANKS))
+    return run, results, skipped
+
+
+def test_refresh_skips_fetching_unchanged_cached_domains(stores):
+    history, cache = stores
+    client = FakeClient({"a.example": DIRECT_LINE, "b.example": "other.com, 9, DIRECT", "c.example": DIRECT_LINE})
+    scan(history, cache, client, refresh=False)
+    assert sorted(client.fetched) == sorted(RANKS)
+
+    client.fetched.clear()
+    run, results, skipped = scan(history, cache, client, refresh=True, ranks=dict(RANKS, **{"a.example": 5}))
+    assert client.fetched == []
+    assert run.reused == 3
+    assert sorted((r["Domain"], r["Tranco Rank"]) for r in results) == [("a.example", 5), ("c.example", 30)]
+    assert [domain for domain, _ in skipped] == ["b.example"]
+
+
+def test_refresh_fetches_domains_whose_cache_expired(stores):
+    history, cache = stores
+    client = FakeClient({domain: DIRECT_LINE for domain in RANKS})
+    scan(history, cache, client, refresh=False)
+    cache._conn.execute("UPDATE ads_txt SET fetched_at = 0 WHERE domain = 'b.example'")
+
+    client.fetched.clear()
+    run, results, _ = scan(history, cache, client, refresh=True)
+    assert client.fetched == ["b.example"]
+    assert run.reused == 3
+    assert len(results) == 3
+
+
+def test_refresh_counts_domains_whose_ads_txt_changed(stores):
+    history, cache = stores
+    client = FakeClient({domain: DIRECT_LINE for domain in RANKS})
+    scan(history, cache, client, refresh=False)
+    cache._conn.execute("UPDATE ads_txt SET fetched_at = 0 WHERE domain = 'b.example'")
+
+    client.files["b.example"] = "other.com, 9, DIRECT"
+    run, results, skipped = scan(history, cache, client, refresh=True)
+    assert (run.reused, run.changed) == (2, 1)
+    assert [domain for domain, _ in skipped] == ["b.example"]
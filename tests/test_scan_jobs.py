@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+import multi_scan
+import scan_jobs
+from ads_txt import parse_ads_txt
+from domain_sources import MODE_MANUAL
+from pipeline import build_pipeline
+from scan_checkpoint import ScanCheckpoint
+from scan_jobs import JobStore, run_job, KIND_MULTI, KIND_SINGLE, STATUS_CANCELLED, STATUS_DONE, STATUS_FAILED
+from telemetry import ScanTelemetry
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def upload(tmp_path):
+    path = tmp_path / "sellers.json"
+    path.write_text('{"sellers": []}')
+    return path
+
+
+def test_job_cancelled_while_queued_removes_its_upload(store, upload):
+    job_id = store.submit(KIND_SINGLE, "Pub", {"sellers_path": str(upload)})
+    store.request_cancel(job_id)
+    run_job(job_id, store.path)
+    assert store.get(job_id).status == STATUS_CANCELLED
+    assert not upload.exists()
+
+
+def test_failed_job_removes_its_upload(store, upload):
+    job_id = store.submit(KIND_SINGLE, "Pub", {"sellers_path": str(upload)})  # no settings: fails at once
+    run_job(job_id, store.path)
+    assert store.get(job_id).status == STATUS_FAILED
+    assert not upload.exists()
+
+
+@pytest.fixture
+def job_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(scan_jobs, "CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(scan_jobs, "JOB_DIR", str(tmp_path))
+    monkeypatch.setattr(scan_jobs, "RUN_HISTORY_FILE", str(tmp_path / "history.sqlite"))
+    return tmp_path
+
+
+def manual_scan(domains):
+    # No Tranco list: every domain is skipped as unranked, with no network use
+    return {
+        "mode": MODE_MANUAL, "pub_name": "Pub", "pub_id": "1", "sample_direct_line": "google.com, pub-1, DIRECT",
+        "manual_domains_input": "\n".join(domains),
+        "settings": {"max_workers": 2, "per_host": 1, "use_cache": False, "use_health": False, "use_dns": False},
+    }
+
+
+def test_jobs_for_the_same_publisher_keep_separate_checkpoints(store, job_files, monkeypatch):
+    first = store.submit(KIND_SINGLE, "Pub", manual_scan(["a.example", "b.example"]))
+    second = store.submit(KIND_SINGLE, "Pub", manual_scan(["c.example"]))
+
+    # The first job is cancelled as soon as it starts, leaving a resumable checkpoint
+    mark_running = JobStore.mark_running
+
+    def cancel_first(self, job_id):
+        mark_running(self, job_id)
+        if job_id == first:
+            self.request_cancel(job_id)
+
+    monkeypatch.setattr(JobStore, "mark_running", cancel_first)
+    run_job(first, store.path)
+    run_job(second, store.path)
+
+    cancelled, done = store.get(first), store.get(second)
+    assert (cancelled.status, done.status) == (STATUS_CANCELLED, STATUS_DONE)
+    assert cancelled.checkpoint_path != done.checkpoint_path
+    assert not os.path.exists(done.checkpoint_path)
+    checkpoint = ScanCheckpoint.load(cancelled.checkpoint_path)
+    assert checkpoint.checked and checkpoint.checked <= {"a.example", "b.example"}
+
+
+def test_multi_publisher_job_reports_opportunities_as_it_goes(store, job_files, monkeypatch):
+    files = {"a.example": "google.com, 1, DIRECT\n", "b.example": "google.com, 2, DIRECT\n",
+             "c.example": "appnexus.com, 3, DIRECT\n"}
+    monkeypatch.setattr(scan_jobs, "publisher_domains", lambda publisher, telemetry=None: publisher["domains"].split())
+    ranks = dict.fromkeys(files, 1)
+    monkeypatch.setattr(scan_jobs, "scan_context", lambda settings: (ranks, build_pipeline(ranks),
+                                                                      {"telemetry": ScanTelemetry()}))
+    monkeypatch.setattr(multi_scan, "iter_fetch", lambda domains, **options: (
+        (domain, parse_ads_txt(files[domain]), None) for domain in sorted(domains)))
+    reported = []
+    progress = JobStore.progress
+
+    def record(self, job_id, done, total, opportunities):
+        reported.append(opportunities)
+        return progress(self, job_id, done, total, opportunities)
+
+    monkeypatch.setattr(JobStore, "progress", record)
+    monkeypatch.setattr(scan_jobs, "PROGRESS_INTERVAL", 0)
+    publishers = ("name,pub_id,sample_direct_line,domains\n"
+                  "One,1,\"google.com, x, DIRECT\",a.example b.example\n"
+                  "Two,2,\"google.com, x, DIRECT\",b.example c.example\n")
+    job_id = store.submit(KIND_MULTI, "Publishers", {"publishers_input": publishers, "settings": {}})
+    run_job(job_id, store.path)
+
+    assert store.get(job_id).status == STATUS_DONE
+    assert reported == [1, 3, 3, 3]  # a: One; b: One and Two; c: nobody; then the final count
@@ -0,0 +1,14 @@
+from pipeline import REASON_INVALID_DOMAIN, REASON_NOT_RANKED
+from scanner import scan_domains
+
+
+def test_progress_total_counts_each_domain_once():
+    # No rankings: every valid domain is skipped before any fetch
+    domains = ["A.example", "a.example", "https://a.example/", "b.example", "not a domain", "not a domain"]
+    progress = []
+    results, skipped = scan_domains(domains, "1", "google.com, pub-1, DIRECT", {},
+                                    on_progress=lambda done, total, domain: progress.append((done, total)))
+    assert results == []
+    assert sorted(skipped) == [("a.example", REASON_NOT_RANKED), ("b.example", REASON_NOT_RANKED),
+                               ("not a domain", REASON_INVALID_DOMAIN), ("not a domain", REASON_INVALID_DOMAIN)]
+    assert progress == [(done, 4) for done in range(1, 5)]
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from sellers_stream import SellersJsonError, SellersJsonParser, iter_seller_domain_batches, iter_sellers
+
+SELLERS = [
+    {"seller_id": "1", "domain": "alpha.example", "seller_type": "PUBLISHER", "name": "Alpha \"Quoted\" Media"},
+    {"seller_id": 22, "domain": "BETA.example", "seller_type": "INTERMEDIARY", "share": 1.5e3, "ratio": -0.25},
+    {"seller_id": "3", "domain": "gamma.example", "name": "Gämma \\ Ltd é😀", "tags": ["a", {"b": []}]},
+    {"seller_id": "4", "is_confidential": 1, "flags": [True, False, None]},
+    {"seller_id": 123456789012, "domain": "delta.example"},
+]
+DOCUMENT = json.dumps({
+    "contact_email": "ads@example.com",
+    "identifiers": [{"name": "TAG-ID", "value": "28cb65e5bbc0bd5f"}],
+    "sellers": SELLERS,
+    "version": 1.0,
+}, ensure_ascii=False, indent=2)
+COMPACT = json.dumps({"version": 1, "sellers": SELLERS, "x": {"y": [1, 2]}}, ensure_ascii=True, separators=(",", ":"))
+
+
+def fed_in_chunks(text, size):
+    parser = SellersJsonParser()
+    sellers = []
+    for start in range(0, len(text), size):
+        sellers.extend(parser.feed(text[start:start + size]))
+    sellers.extend(parser.close())
+    return sellers
+
+
+@pytest.mark.parametrize("document", [DOCUMENT, COMPACT], ids=["indented", "compact"])
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, 64, 100000])
+def test_chunk_size_never_changes_the_result(document, size):
+    assert fed_in_chunks(document, size) == SELLERS
+
+
+@pytest.mark.parametrize("needle", ['\\"Quoted', "\\\\ Ltd", "\\ud83d", "1500.0", "-0.25", "123456789012", "true"])
+def test_split_inside_strings_escapes_and_numbers(needle):
+    at = COMPACT.index(needle) + len(needle) // 2
+    parser = SellersJsonParser()
+    sellers = parser.feed(COMPACT[:at]) + parser.feed(COMPACT[at:]) + parser.close()
+    assert sellers == SELLERS
+
+
+def test_multibyte_characters_split_across_byte_chunks():
+    data = DOCUMENT.encode("utf-8")
+    at = data.index("ä".encode("utf-8")) + 1
+    assert list(iter_sellers([b"\xef\xbb\xbf" + data[:at], data[at:]])) == SELLERS
+
+
+def test_malformed_entry_raises_as_soon_as_it_closes():
+    head = '{"sellers": [{"domain": "a.example"}, '
+    parser = SellersJsonParser()
+    assert parser.feed(head) == [{"domain": "a.example"}]
+    assert parser.feed('{"domain": "b.exa') == []  # merely incomplete
+    with pytest.raises(SellersJsonError):
+        parser.feed('mple", "seller_id": 01}, ')
+
+
+@pytest.mark.parametrize("bad", ['{"domain": x}', '{"domain" "x"}', "nul", '"\\q"'])
+def test_malformed_values_are_reported_before_eof(bad):
+    parser = SellersJsonParser()
+    with pytest.raises(SellersJsonError):
+        parser.feed('{"sellers": [{"domain": "a.example"}, ' + bad + ', {"domain": "b.example"}')
+
+
+@pytest.mark.parametrize("document", ['{"sellers": [{"domain": "a.example"}', '{"sellers": []', '{"sell'])
+def test_truncated_document_raises_at_close(document):
+    parser = SellersJsonParser()
+    parser.feed(document)
+    with pytest.raises(SellersJsonError):
+        parser.close()
+
+
+def test_domain_batches_skip_repeats_and_the_publisher_itself():
+    document = json.dumps({"sellers": [{"domain": "Pub.example"}, {"domain": "a.example"}, {"domain": "A.example."},
+                                       {"domain": "b.example"}, {"seller_id": "9"}]})
+    batches = list(iter_seller_domain_batches([document[:40], document[40:]], exclude_domain="pub.example"))
+    assert [domain for batch in batches for domain in batch] == ["a.example", "b.example"]
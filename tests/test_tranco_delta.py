@@ -0,0 +1,81 @@
+import random
+
+import numpy as np
+import pytest
+
+import tranco_delta
+from tranco_delta import (
+    TrancoDeltaError, TrancoDeltaStore, apply_delta, decode_base, encode_base, encode_delta, pack_ints, unpack_ints
+)
+
+
+def daily_lists(days, size=500, seed=7):
+    # Each day a few domains move, some drop out and new ones come in
+    rng = random.Random(seed)
+    domains = [f"site{i}.example" for i in range(size)]
+    fresh = size
+    lists = [list(domains)]
+    for _ in range(days - 1):
+        for _ in range(size // 10):
+            i, j = rng.randrange(size), rng.randrange(size)
+            domains[i], domains[j] = domains[j], domains[i]
+        for _ in range(size // 50):
+            domains[rng.randrange(size)] = f"new{fresh}.example"
+            fresh += 1
+        lists.append(list(domains))
+    return lists
+
+
+def test_pack_ints_round_trip():
+    values = np.array([0, -1, 1, 5, -5, 2 ** 31 - 1, -(2 ** 31) + 1, 300, -70000])
+    assert unpack_ints(pack_ints(values), len(values)).tolist() == values.tolist()
+    with pytest.raises(TrancoDeltaError):
+        unpack_ints(pack_ints(values), len(values) + 1)
+
+
+def test_delta_handles_repeats_drops_and_shrinking_lists():
+    previous = ["a.com", "b.com", "a.com", "c.com", "d.com"]
+    domains = ["c.com", "e.com", "a.com", "a.com"]
+    assert apply_delta(previous, encode_delta(previous, domains)) == domains
+    with pytest.raises(TrancoDeltaError):
+        apply_delta(previous[:-1], encode_delta(previous, domains))
+
+
+def test_base_and_delta_chain_rebuild_every_day_exactly(tmp_path):
+    store = TrancoDeltaStore(str(tmp_path))
+    lists = daily_lists(12)
+    kinds = [store.add(f"L{day}", domains) for day, domains in enumerate(lists)]
+    assert kinds == ["base"] + ["delta"] * 11
+    assert store.domains() == lists[-1]
+    assert store.latest()["list_id"] == "L11"
+    assert store.add("L11", lists[-1]) is None
+
+    rebuilt = decode_base(store.read(store.manifest()["base"]["file"]))
+    for delta, domains in zip(store.manifest()["deltas"], lists[1:]):
+        rebuilt = apply_delta(rebuilt, store.read(delta["file"]))
+        assert rebuilt == domains
+
+
+def test_new_base_after_max_deltas(tmp_path, monkeypatch):
+    monkeypatch.setattr(tranco_delta, "MAX_DELTAS", 3)
+    store = TrancoDeltaStore(str(tmp_path))
+    lists = daily_lists(6)
+    kinds = [store.add(f"L{day}", domains) for day, domains in enumerate(lists)]
+    assert kinds == ["base", "delta", "delta", "delta", "base", "delta"]
+    assert store.domains() == lists[-1]
+    assert sorted(p.name for p in tmp_path.iterdir() if not p.name.startswith(".")) == [
+        "L4.base", "L5.delta", "manifest.json"]
+
+
+def test_unrelated_list_is_stored_as_a_base(tmp_path):
+    store = TrancoDeltaStore(str(tmp_path))
+    store.add("A", [f"a{i}.example" for i in range(300)])
+    assert store.add("B", [f"b{i}.example" for i in range(300)]) == "base"
+
+
+def test_corrupt_files_are_rejected():
+    base = encode_base(["a.com", "b.com"])
+    with pytest.raises(TrancoDeltaError):
+        decode_base(b"XXXX" + base[4:])
+    with pytest.raises(TrancoDeltaError):
+        apply_delta(["a.com"], base)
@@ -0,0 +1,132 @@
+import io
+import zipfile
+
+import pytest
+
+from tranco_download import TrancoDownloadError, download_tranco_list, extract_list_id
+from tranco_index import TrancoIndex
+
+ROWS = 200
+CSV = "".join(f"{rank},site{rank}.example\n" for rank in range(1, ROWS + 1)).encode()
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200, chunk=97, length=None):
+        self.body = body
+        self.status_code = status_code
+        self.chunk = chunk
+        self.headers = {"Content-Length": str(len(body) if length is None else length)}
+
+    def iter_content(self, size):
+        for start in range(0, len(self.body), self.chunk):
+            yield self.body[start:start + self.chunk]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, stream=False, timeout=None):
+        return self.response
+
+
+class Unseekable(io.RawIOBase):
+    # zipfile writes a data descriptor after the member when it can't seek back
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def zipped(data=CSV, compression=zipfile.ZIP_DEFLATED, seekable=True):
+    out = io.BytesIO() if seekable else Unseekable()
+    with zipfile.ZipFile(out, "w", compression=compression) as archive:
+        archive.writestr("top-1m.csv", data)
+    return out.getvalue() if seekable else bytes(out.data)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    csv_path, index_path = tmp_path / "top-1m.csv", tmp_path / "index.bin"
+    csv_path.write_bytes(b"1,previous.example\n")
+    download_tranco_list("x", str(csv_path), str(index_path), min_rows=1,
+                         session=FakeSession(FakeResponse(b"1,previous.example\n")))
+    return csv_path, index_path
+
+
+def download(paths, response, **kwargs):
+    csv_path, index_path = paths
+    return download_tranco_list("https://tranco.test/list", str(csv_path), str(index_path), min_rows=10,
+                                session=FakeSession(response), **kwargs)
+
+
+def assert_previous_list_kept(paths):
+    csv_path, index_path = paths
+    assert csv_path.read_bytes() == b"1,previous.example\n"
+    assert TrancoIndex(str(index_path)).rank("previous.example") == 1
+    assert sorted(p.name for p in csv_path.parent.iterdir()) == ["index.bin", "top-1m.csv"]
+
+
+@pytest.mark.parametrize("body", [
+    CSV,
+    zipped(),
+    zipped(seekable=False),
+    zipped(compression=zipfile.ZIP_STORED),
+], ids=["csv", "deflate", "deflate-descriptor", "stored"])
+def test_download_writes_list_and_index(paths, body):
+    assert download(paths, FakeResponse(body), expected_rows=ROWS) == ROWS
+    csv_path, index_path = paths
+    assert csv_path.read_bytes() == CSV
+    index = TrancoIndex(str(index_path))
+    assert (len(index), index.rank("site1.example"), index.rank("site200.example")) == (ROWS, 1, 200)
+    assert index.rank("previous.example") is None
+
+
+def corrupt_crc(body):
+    body = bytearray(body)
+    body[14] ^= 0xFF  # local header CRC-32
+    return bytes(body)
+
+
+def corrupt_descriptor(body):
+    body = bytearray(body)
+    at = body.index(b"PK\x07\x08") + 4
+    body[at] ^= 0xFF
+    return bytes(body)
+
+
+@pytest.mark.parametrize("response, message", [
+    (FakeResponse(corrupt_crc(zipped())), "CRC mismatch"),
+    (FakeResponse(corrupt_descriptor(zipped(seekable=False))), "CRC mismatch"),
+    (FakeResponse(zipped()[:300], length=len(zipped())), "truncated"),
+    (FakeResponse(zipped()[:300]), "ended before"),
+    (FakeResponse(CSV[:-500]), "rows, expected"),
+    (FakeResponse(CSV.replace(b"50,site50", b"5,site50")), "out of order"),
+    (FakeResponse(b"PK\x03\x04\x14\x00\x00\x00\x63\x00" + b"\0" * 40), "compression method 99"),
+    (FakeResponse(b"", status_code=404), "HTTP 404"),
+], ids=["crc", "descriptor-crc", "short-body", "cut-off-zip", "row-count", "order", "bad-zip", "http-error"])
+def test_failed_download_keeps_the_previous_list(paths, response, message):
+    with pytest.raises(TrancoDownloadError, match=message):
+        download(paths, response, expected_rows=ROWS)
+    assert_previous_list_kept(paths)
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://tranco-list.eu/list/X5QNN/1000000", "X5QNN"),
+    ('<a href="/list/AB12C/full">', "AB12C"),
+    ("https://tranco-list.eu/", None),
+    (None, None),
+])
+def test_extract_list_id(url, expected):
+    assert extract_list_id(url) == expected
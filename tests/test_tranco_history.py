@@ -0,0 +1,75 @@
+import json
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import tranco_history
+from tranco_history import TrancoHistory
+
+DAY = date(2024, 1, 1)
+
+
+def daily_list(day):
+    # 100 domains, a fifth of them replaced every day, ranks reshuffled
+    hashes = np.arange(100, dtype=np.uint64) + 20 * day + 1
+    ranks = np.random.default_rng(day).permutation(100) + 1
+    return hashes, ranks
+
+
+def ranks_by_hash(history):
+    snapshots = history.snapshots()
+    dictionary = history.dictionary()
+    return [{int(dictionary[i]): int(r) for i, r in enumerate(column) if r}
+            for column in history.columns(snapshots)]
+
+
+def stored_files(directory):
+    return sorted(name for name in os.listdir(directory) if not name.startswith("."))
+
+
+def test_fold_keeps_ranks_and_compacts_the_dictionary(tmp_path):
+    history = TrancoHistory(str(tmp_path), max_snapshots=3)
+    for day in range(8):
+        history.add_snapshot(f"L{day}", *daily_list(day), day=DAY + timedelta(days=day))
+
+    snapshots = history.snapshots()
+    assert [s["list_id"] for s in snapshots] == ["L5", "L6", "L7"]
+    expected = [dict(zip(map(int, h), map(int, r))) for h, r in map(daily_list, range(5, 8))]
+    assert ranks_by_hash(history) == expected
+    # Domains only the folded lists had don't pile up in the dictionary
+    listed = set().union(*expected)
+    assert listed <= set(map(int, history.dictionary()))
+    assert len(history.dictionary()) <= len(listed) / (1 - tranco_history.COMPACT_UNUSED) < 100 + 20 * 7
+
+    manifest = json.loads((tmp_path / "snapshots.json").read_text())
+    assert stored_files(tmp_path) == sorted([manifest["dictionary"], "snapshots.json"] +
+                                            [s["file"] for s in snapshots])
+
+
+def test_same_day_list_replaces_the_first(tmp_path):
+    history = TrancoHistory(str(tmp_path))
+    history.add_snapshot("A", *daily_list(0), day=DAY)
+    history.add_snapshot("B", *daily_list(1), day=DAY)
+    assert [s["list_id"] for s in history.snapshots()] == ["B"]
+    assert len(stored_files(tmp_path)) == 3
+
+
+def test_failed_add_leaves_the_previous_store_intact(tmp_path, monkeypatch):
+    history = TrancoHistory(str(tmp_path), max_snapshots=2)
+    for day in range(2):
+        history.add_snapshot(f"L{day}", *daily_list(day), day=DAY + timedelta(days=day))
+    before = ranks_by_hash(history)
+
+    def crash(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(tranco_history.TrancoHistory, "_save_manifest", crash)
+    with pytest.raises(OSError):
+        history.add_snapshot("L2", *daily_list(2), day=DAY + timedelta(days=2))
+    monkeypatch.undo()
+
+    reopened = TrancoHistory(str(tmp_path), max_snapshots=2)
+    assert [s["list_id"] for s in reopened.snapshots()] == ["L0", "L1"]
+    assert ranks_by_hash(reopened) == before
@@ -0,0 +1,90 @@
+import pytest
+
+from tranco_index import TrancoIndex, TrancoIndexBuilder, build_tranco_index, ensure_tranco_index, index_path_for
+
+RANKS = {"google.com": 1, "example.co.uk": 2, "news.example.co.uk": 5, "blog.test.com": 7, "test.com": 9,
+         "edge.com": 10}
+
+
+@pytest.fixture
+def index(tmp_path):
+    builder = TrancoIndexBuilder()
+    for domain, rank in RANKS.items():
+        builder.add(rank, domain)
+    builder.add(50, "google.com")  # listed twice: the best rank is kept
+    path = tmp_path / "index.bin"
+    assert builder.write(path) == len(RANKS)
+    return TrancoIndex(path)
+
+
+def test_exact_lookups_and_misses(index):
+    assert len(index) == len(RANKS)
+    assert {domain: index.rank(domain) for domain in RANKS} == RANKS
+    assert index.rank("GOOGLE.com ") == 1
+    assert index.rank("missing.com") is None
+    assert index.lookup_many(["test.com", "missing.com", "google.com"]).tolist() == [9, 0, 1]
+
+
+@pytest.mark.parametrize("domain, rank", [
+    ("google.com", 1),
+    ("news.example.co.uk", 5),  # listed itself: its own rank, not the parent's
+    ("www.example.co.uk", 2),  # falls back to the registrable domain
+    ("a.b.test.com", 9),  # to the registrable domain, not the nearer listed parent
+    ("www.missing.com", None),
+    ("co.uk", None),  # a bare public suffix has no registrable domain
+])
+def test_view_falls_back_to_the_registrable_domain(index, domain, rank):
+    view = index.view()
+    assert view.get(domain) == rank
+    assert view.get_many([domain]) == [rank]
+    assert (domain in view) == (rank is not None)
+
+
+def test_threshold_boundary_is_inclusive(index):
+    view = index.view(9)
+    domains = ["test.com", "edge.com", "www.edge.com", "www.test.com", "missing.com"]
+    assert [view.get(d) for d in domains] == [9, None, None, 9, None]
+    assert view.get_many(domains) == [9, None, None, 9, None]
+    assert view.get("edge.com", default=0) == 0
+    assert view["test.com"] == 9
+    with pytest.raises(KeyError):
+        view["edge.com"]
+    assert len(view) == 5
+    assert len(index.view(10)) == len(index.view()) == 6
+    assert index.view(0).get_many(["google.com"]) == [None]
+
+
+def test_get_many_matches_get(index):
+    view = index.view(5)
+    domains = list(RANKS) + ["www.google.com", "x.news.example.co.uk", "unknown.org", "google.com"]
+    assert view.get_many(domains) == [view.get(d) for d in domains]
+    assert view.get_many([]) == []
+
+
+def test_empty_index(tmp_path):
+    path = tmp_path / "empty.bin"
+    TrancoIndexBuilder().write(path)
+    index = TrancoIndex(path)
+    assert index.rank("google.com") is None
+    assert index.view().get_many(["google.com", "www.google.com"]) == [None, None]
+    assert len(index.view(10)) == 0
+
+
+def test_csv_build_skips_bad_rows_and_ensure_rebuilds_only_when_stale(tmp_path):
+    csv_path = tmp_path / "top.csv"
+    csv_path.write_text("1,google.com\nrank,domain\n0,zero.com\n2,\n3\n4, Example.org \n", encoding="utf-8")
+    assert build_tranco_index(csv_path, tmp_path / "built.bin") == 2
+
+    path = ensure_tranco_index(csv_path, list_id="AB-12", index_dir=tmp_path)
+    assert path == index_path_for("AB-12", tmp_path) == str(tmp_path / "tranco_index_AB12.bin")
+    assert TrancoIndex(path).rank("example.org") == 4
+    built = (tmp_path / "tranco_index_AB12.bin").stat().st_mtime_ns
+    assert ensure_tranco_index(csv_path, list_id="AB-12", index_dir=tmp_path) == path
+    assert (tmp_path / "tranco_index_AB12.bin").stat().st_mtime_ns == built
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not_an_index.bin"
+    path.write_bytes(b"NOPE" + bytes(12))
+    with pytest.raises(ValueError):
+        TrancoIndex(path)
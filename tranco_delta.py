@@ -0,0 +1,233 @@
+import json
+import os
+import struct
+import tempfile
+import zlib
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from tranco_index import TrancoIndexBuilder
+
+# --- CONFIGURATION ---
+TRANCO_DELTA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tranco")
+MAX_DELTAS = 30  # a new full base after this many deltas (about a month of daily lists)
+COMPRESS_LEVEL = 9
+
+BASE_MAGIC = b"TRDB"
+DELTA_MAGIC = b"TRDD"
+FORMAT_VERSION = 1
+BASE_HEADER = struct.Struct("<4sIQ")  # magic, version, domain count
+DELTA_HEADER = struct.Struct("<4sIQQQQ")  # magic, version, domain count, previous count, added, source bytes
+
+# --- FILE LAYOUT ---
+# tranco/manifest.json   the base and the deltas after it, oldest first
+# tranco/<id>.base       every domain in rank order, newline-separated, zlib
+# tranco/<id>.delta      the list as positions into the previous list plus
+#                        the domains that are new today: rank i holds
+#                        (previous + added)[source[i]]. Dropped domains are
+#                        simply never referenced. `source[i] - i` is small
+#                        for a domain that only moved a little, so it is
+#                        packed with pack_ints.
+# Ranks are positions: Tranco lists are ranked 1..N without gaps.
+
+
+class TrancoDeltaError(Exception):
+    pass
+
+
+# --- INTEGER PACKING ---
+def pack_ints(values):
+    # Signed ints, mostly small: zigzag-coded (0, -1, 1, -2 -> 0, 1, 2, 3) and
+    # split into byte planes before zlib, so the mostly-zero high bytes
+    # compress to almost nothing
+    values = np.asarray(values, dtype=np.int64)
+    zigzag = np.where(values >= 0, values * 2, -values * 2 - 1).astype("<u4")
+    return zlib.compress(zigzag.view(np.uint8).reshape(-1, 4).T.tobytes(), 6)
+
+
+def unpack_ints(data, length):
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    if len(planes) != 4 * length:
+        raise TrancoDeltaError("Packed integers are truncated")
+    zigzag = planes.reshape(4, length).T.copy().view("<u4").ravel().astype(np.int64)
+    return np.where(zigzag & 1, -(zigzag + 1) // 2, zigzag // 2)
+
+
+# --- ENCODING ---
+def _pack_domains(domains):
+    return zlib.compress("\n".join(domains).encode("utf-8"), COMPRESS_LEVEL)
+
+
+def _unpack_domains(data, count):
+    domains = zlib.decompress(data).decode("utf-8").split("\n") if count else []
+    if len(domains) != count:
+        raise TrancoDeltaError(f"Expected {count:,} domains, found {len(domains):,}")
+    return domains
+
+
+def encode_base(domains):
+    return BASE_HEADER.pack(BASE_MAGIC, FORMAT_VERSION, len(domains)) + _pack_domains(domains)
+
+
+def decode_base(data):
+    if len(data) < BASE_HEADER.size:
+        raise TrancoDeltaError("Tranco base file is truncated")
+    magic, version, count = BASE_HEADER.unpack_from(data)
+    if magic != BASE_MAGIC or version != FORMAT_VERSION:
+        raise TrancoDeltaError(f"Not a Tranco base file (version {FORMAT_VERSION})")
+    return _unpack_domains(data[BASE_HEADER.size:], count)
+
+
+def encode_delta(previous, domains):
+    lookup = pd.Index(previous)
+    first = np.flatnonzero(~lookup.duplicated())  # a repeated domain refers to its first position
+    positions = lookup[first].get_indexer(domains)
+    positions = np.where(positions >= 0, first[np.maximum(positions, 0)], -1)
+    added = [domain for domain, position in zip(domains, positions) if position < 0]
+    source = positions.astype(np.int64)
+    source[positions < 0] = len(previous) + np.arange(len(added))
+    packed = pack_ints(source - np.arange(len(domains)))
+    header = DELTA_HEADER.pack(DELTA_MAGIC, FORMAT_VERSION, len(domains), len(previous), len(added), len(packed))
+    return header + packed + _pack_domains(added)
+
+
+def apply_delta(previous, data):
+    if len(data) < DELTA_HEADER.size:
+        raise TrancoDeltaError("Tranco delta file is truncated")
+    magic, version, count, previous_count, added_count, source_bytes = DELTA_HEADER.unpack_from(data)
+    if magic != DELTA_MAGIC or version != FORMAT_VERSION:
+        raise TrancoDeltaError(f"Not a Tranco delta file (version {FORMAT_VERSION})")
+    if previous_count != len(previous):
+        raise TrancoDeltaError(f"Delta expects {previous_count:,} previous domains, got {len(previous):,}")
+    start = DELTA_HEADER.size
+    source = unpack_ints(data[start:start + source_bytes], count) + np.arange(count)
+    added = _unpack_domains(data[start + source_bytes:], added_count)
+    pool = np.array(list(previous) + added, dtype=object)
+    if count and (source.min() < 0 or source.max() >= len(pool)):
+        raise TrancoDeltaError("Delta refers to domains that don't exist")
+    return pool[source].tolist()
+
+
+# --- STORE ---
+class TrancoDeltaStore:
+    # The Tranco lists the scheduled workflow commits: one full base and the
+    # daily deltas after it. Rebuilding the newest list reads the base and at
+    # most MAX_DELTAS small files, however long the workflow has been running.
+    def __init__(self, directory=TRANCO_DELTA_DIR):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def manifest(self):
+        try:
+            with open(self._path("manifest.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def latest(self):
+        # Manifest entry of the newest list, or None
+        manifest = self.manifest()
+        if not manifest:
+            return None
+        return manifest["deltas"][-1] if manifest["deltas"] else manifest["base"]
+
+    def read(self, name):
+        with open(self._path(name), "rb") as f:
+            return f.read()
+
+    def domains(self):
+        # The newest list, base plus deltas applied in order
+        manifest = self.manifest()
+        if not manifest:
+            return None
+        domains = decode_base(self.read(manifest["base"]["file"]))
+        for delta in manifest["deltas"]:
+            domains = apply_delta(domains, self.read(delta["file"]))
+        return domains
+
+    def add(self, list_id, domains, day=None):
+        # Stores a new list as a delta, or as a new base after MAX_DELTAS
+        # deltas (or when a delta would be no smaller than a base). Returns
+        # "base", "delta" or None (already stored).
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self.manifest()
+        entry = {"list_id": str(list_id), "date": (day or date.today()).isoformat(), "rows": len(domains)}
+        if manifest and entry["list_id"] in [manifest["base"]["list_id"]] + [d["list_id"] for d in manifest["deltas"]]:
+            return None
+
+        safe_id = "".join(ch for ch in entry["list_id"] if ch.isalnum()) or "list"
+        stale = []
+        if manifest:
+            delta = encode_delta(self.domains(), domains)
+            if len(manifest["deltas"]) < MAX_DELTAS and len(delta) < manifest["base"]["bytes"]:
+                entry.update(file=f"{safe_id}.delta", bytes=len(delta))
+                self._write(entry["file"], delta)
+                manifest["deltas"].append(entry)
+                self._save_manifest(manifest)
+                return "delta"
+            stale = [manifest["base"]["file"]] + [d["file"] for d in manifest["deltas"]]
+
+        base = encode_base(domains)
+        entry.update(file=f"{safe_id}.base", bytes=len(base))
+        self._write(entry["file"], base)
+        self._save_manifest({"base": entry, "deltas": []})
+        for name in stale:
+            if name != entry["file"] and os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        return "base"
+
+    def _write(self, name, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tranco_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _save_manifest(self, manifest):
+        self._write("manifest.json", json.dumps(manifest, indent=1).encode("utf-8"))
+
+
+# --- CSV ---
+def read_ranked_domains(csv_path):
+    # Domains of a "<rank>,<domain>" CSV in rank order
+    ranked = pd.read_csv(csv_path, header=None, names=["rank", "domain"], usecols=[0, 1], dtype={"domain": str},
+                         keep_default_na=False)
+    return ranked.sort_values("rank", kind="stable")["domain"].str.strip().tolist()
+
+
+def write_ranked_csv(domains, csv_path):
+    # Atomically, like a download: nothing at csv_path changes on failure
+    directory = os.path.dirname(os.path.abspath(csv_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tranco_", suffix=".csv.tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(f"{rank},{domain}\n" for rank, domain in enumerate(domains, start=1))
+        os.replace(tmp_path, csv_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def restore_latest(store, csv_path, index_path=None):
+    # Leaves the newest stored list at csv_path (and its rank index at
+    # index_path) just as a download would; returns its manifest entry
+    entry = store.latest()
+    if entry is None:
+        raise TrancoDeltaError(f"No Tranco lists stored in {store.directory}")
+    domains = store.domains()
+    write_ranked_csv(domains, csv_path)
+    if index_path:
+        builder = TrancoIndexBuilder()
+        for rank, domain in enumerate(domains, start=1):
+            builder.add(rank, domain)
+        builder.write(index_path)
+    return entry
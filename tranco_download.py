@@ -0,0 +1,226 @@
+import os
+import re
+import struct
+import tempfile
+import zlib
+
+from http_client import get_default_client
+from tranco_index import TrancoIndexBuilder
+
+# --- CONFIGURATION ---
+TRANCO_SITE = "https://tranco-list.eu"
+CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 60
+MIN_EXPECTED_ROWS = 1000
+MAX_BAD_ROW_RATIO = 0.001
+
+ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+ZIP_LOCAL_MAGIC = b"PK\x03\x04"
+ZIP_DESCRIPTOR_MAGIC = b"PK\x07\x08"
+
+
+class TrancoDownloadError(Exception):
+    pass
+
+
+# --- URLS ---
+def extract_list_id(url):
+    match = re.search(r"/list/([a-zA-Z0-9]{5,})", url or "")
+    return match.group(1) if match else None
+
+
+def latest_list_id(page_url=f"{TRANCO_SITE}/", timeout=DOWNLOAD_TIMEOUT, session=None):
+    page = (session or get_default_client().session).get(page_url, timeout=timeout)
+    if page.status_code != 200:
+        raise TrancoDownloadError(f"Failed to fetch Tranco page: HTTP {page.status_code}")
+    list_id = extract_list_id(page.text)
+    if not list_id:
+        raise TrancoDownloadError("Could not extract latest Tranco list ID")
+    return list_id
+
+
+def tranco_download_url(list_id, size="full", zipped=False):
+    if zipped:
+        return f"{TRANCO_SITE}/download_daily/{list_id}"
+    return f"{TRANCO_SITE}/download/{list_id}/{size}"
+
+
+# --- ZIP STREAMING ---
+class ZipMemberStream:
+    # Inflates the first member of a zip archive as the bytes arrive. The
+    # central directory at the end of the file is never needed: the local
+    # header gives the method, and a deflate stream knows where it ends.
+    def __init__(self):
+        self._buffer = b""
+        self._header_done = False
+        self._inflater = None
+        self._stored_left = None
+        self._crc = 0
+        self._expected_crc = None
+        self._size = 0
+        self.finished = False
+
+    def feed(self, chunk):
+        if self.finished:
+            self._buffer += chunk
+            return b""
+        if not self._header_done:
+            self._buffer += chunk
+            if len(self._buffer) < ZIP_LOCAL_HEADER.size:
+                return b""
+            (magic, _, flags, method, _, _, crc, csize, _, name_len, extra_len) = \
+                ZIP_LOCAL_HEADER.unpack_from(self._buffer)
+            if magic != ZIP_LOCAL_MAGIC:
+                raise TrancoDownloadError("Download is not a zip archive")
+            start = ZIP_LOCAL_HEADER.size + name_len + extra_len
+            if len(self._buffer) < start:
+                return b""
+            if method == 8:
+                self._inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+            elif method == 0 and not flags & 0x08:
+                self._stored_left = csize
+            else:
+                raise TrancoDownloadError(f"Unsupported zip compression method {method}")
+            if not flags & 0x08:
+                self._expected_crc = crc
+            self._header_done = True
+            chunk, self._buffer = self._buffer[start:], b""
+
+        if self._inflater is not None:
+            data = self._inflater.decompress(chunk)
+            if self._inflater.eof:
+                self.finished = True
+                self._buffer = self._inflater.unused_data
+        else:
+            data = chunk[:self._stored_left]
+            self._stored_left -= len(data)
+            if self._stored_left == 0:
+                self.finished = True
+                self._buffer = chunk[len(data):]
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        return data
+
+    def verify(self):
+        if not self.finished:
+            raise TrancoDownloadError("Zip download ended before the compressed data did")
+        expected = self._expected_crc
+        if expected is None:
+            # Data descriptor: optional signature, then crc32
+            tail = self._buffer
+            if tail.startswith(ZIP_DESCRIPTOR_MAGIC):
+                tail = tail[4:]
+            if len(tail) < 4:
+                raise TrancoDownloadError("Zip download is missing its data descriptor")
+            expected = struct.unpack_from("<I", tail)[0]
+        if expected != self._crc:
+            raise TrancoDownloadError("Zip CRC mismatch: the download is corrupt")
+
+
+# --- ROW CHECKING ---
+class TrancoRowChecker:
+    # Parses "<rank>,<domain>" lines from arbitrary byte chunks, feeding the
+    # index builder and tracking what the integrity check needs.
+    def __init__(self, builder=None):
+        self.builder = builder
+        self.rows = 0
+        self.bad_rows = 0
+        self.last_rank = 0
+        self.out_of_order = 0
+        self._partial = b""
+
+    def feed(self, data):
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+
+    def close(self):
+        if self._partial.strip():
+            self._line(self._partial)
+        self._partial = b""
+
+    def _line(self, line):
+        line = line.strip()
+        if not line:
+            return
+        rank_part, _, domain = line.partition(b",")
+        try:
+            rank = int(rank_part)
+            domain = domain.decode("utf-8").strip()
+        except (ValueError, UnicodeDecodeError):
+            self.bad_rows += 1
+            return
+        if rank <= 0 or not domain:
+            self.bad_rows += 1
+            return
+        if rank <= self.last_rank:
+            self.out_of_order += 1
+        self.last_rank = rank
+        self.rows += 1
+        if self.builder is not None:
+            self.builder.add(rank, domain)
+
+    def verify(self, min_rows=MIN_EXPECTED_ROWS, expected_rows=None):
+        if self.rows < min_rows:
+            raise TrancoDownloadError(f"Tranco list has only {self.rows:,} rows (expected at least {min_rows:,})")
+        if expected_rows is not None and self.rows != expected_rows:
+            raise TrancoDownloadError(f"Tranco list has {self.rows:,} rows, expected {expected_rows:,}")
+        if self.bad_rows > max(1, self.rows * MAX_BAD_ROW_RATIO):
+            raise TrancoDownloadError(f"Tranco list has {self.bad_rows:,} malformed rows")
+        if self.out_of_order:
+            raise TrancoDownloadError(f"Tranco list ranks are out of order in {self.out_of_order:,} rows")
+
+
+# --- DOWNLOAD ---
+def download_tranco_list(url, csv_path, index_path=None, min_rows=MIN_EXPECTED_ROWS, expected_rows=None,
+                         timeout=DOWNLOAD_TIMEOUT, session=None):
+    # Streams `url` (plain CSV or zip) into a temp file next to `csv_path`,
+    # building the rank index from the same bytes. Nothing at `csv_path` or
+    # `index_path` changes unless the whole list arrived and checks out.
+    directory = os.path.dirname(os.path.abspath(csv_path))
+    builder = TrancoIndexBuilder() if index_path else None
+    checker = TrancoRowChecker(builder)
+    unzip = None
+    received = 0
+
+    http = session or get_default_client().session
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tranco_", suffix=".csv.tmp")
+    try:
+        with os.fdopen(fd, "wb") as out, http.get(url, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                raise TrancoDownloadError(f"Failed to download Tranco list: HTTP {response.status_code}")
+            expected_length = response.headers.get("Content-Length")
+            if response.headers.get("Content-Encoding"):
+                expected_length = None  # length is of the encoded body
+
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if not chunk:
+                    continue
+                received += len(chunk)
+                if unzip is None and received == len(chunk) and chunk.startswith(ZIP_LOCAL_MAGIC):
+                    unzip = ZipMemberStream()
+                data = unzip.feed(chunk) if unzip is not None else chunk
+                if data:
+                    out.write(data)
+                    checker.feed(data)
+
+            if expected_length is not None and received != int(expected_length):
+                raise TrancoDownloadError(f"Download truncated: {received:,} of {int(expected_length):,} bytes")
+            if unzip is not None:
+                unzip.verify()
+            checker.close()
+            checker.verify(min_rows=min_rows, expected_rows=expected_rows)
+            out.flush()
+            os.fsync(out.fileno())
+
+        os.replace(tmp_path, csv_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Written after the CSV so the index is never older than the list it indexes
+    if builder is not None:
+        builder.write(index_path)
+    return checker.rows
@@ -0,0 +1,293 @@
+import fcntl
+import json
+import os
+import struct
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from domain_names import registrable_domains
+from tranco_delta import pack_ints, unpack_ints
+from tranco_index import domain_hash
+
+# --- CONFIGURATION ---
+TRANCO_HISTORY_DIR = "/tmp/tranco_history"
+MAX_SNAPSHOTS = 90  # oldest snapshots are folded away beyond this
+TREND_WINDOWS = (7, 30)  # days
+BEST_RANK_WINDOW = 30  # days
+SNAPSHOT_MAGIC = b"TRSN"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sIQ")  # magic, version, column length
+COMPACT_UNUSED = 0.2  # a fold rebuilds the dictionary once this share of it is listed by no snapshot
+
+TREND_COLUMNS = [f"Rank Change {days}d" for days in TREND_WINDOWS] + [f"Best Rank {BEST_RANK_WINDOW}d"]
+
+# --- STORE LAYOUT ---
+# dictionary.*.bin uint64 domain hashes in first-seen order; a domain's
+#                  position is its ID in every snapshot
+# snapshots.json   the snapshots, oldest first (list ID, date, rows, file),
+#                  and the dictionary file they use
+# <list_id>.*.snap one rank column (rank per dictionary ID, 0 = not listed),
+#                  stored as the difference from the previous snapshot's
+#                  column, packed with pack_ints. The oldest snapshot is stored
+#                  against an all-zero column. Consecutive daily lists differ
+#                  by small rank moves, so a 1M-row day packs into a fraction
+#                  of its CSV.
+# Files are never rewritten in place: changes go to new names, then
+# snapshots.json is replaced, then files it no longer lists are deleted, so a
+# crash at any point leaves the previous manifest and all of its files intact.
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tranco_history_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _encode_column(column, previous):
+    delta = column.astype(np.int64)
+    delta[:len(previous)] -= previous
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(column)) + pack_ints(delta)
+
+
+def _new_name(stem, suffix):
+    return f"{stem}.{os.urandom(4).hex()}{suffix}"
+
+
+def _last(iterable, default=None):
+    for default in iterable:
+        pass
+    return default
+
+
+def _gather(column, ids):
+    # column[ids], 0 for unknown IDs and IDs added after this snapshot
+    ranks = np.zeros(len(ids), dtype=np.int64)
+    valid = (ids >= 0) & (ids < len(column))
+    ranks[valid] = column[ids[valid]]
+    return ranks
+
+
+def _nullable(values, known):
+    return pd.arrays.IntegerArray(np.where(known, values, 0).astype(np.int64), ~known)
+
+
+def _decode_column(data, previous):
+    magic, version, length = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"Not a Tranco snapshot (version {SNAPSHOT_VERSION})")
+    column = unpack_ints(data[SNAPSHOT_HEADER.size:], length)
+    column[:len(previous)] += previous
+    return column
+
+
+class TrancoHistory:
+    # Many Tranco snapshots in one directory, for rank trends. Snapshots are
+    # added in date order; one per day (a second list on the same day
+    # replaces the first).
+    def __init__(self, directory=TRANCO_HISTORY_DIR, max_snapshots=MAX_SNAPSHOTS):
+        self.directory = directory
+        self.max_snapshots = max_snapshots
+        os.makedirs(directory, exist_ok=True)
+        self._dictionary = None
+        self._dictionary_key = None
+        self._sorted = None
+
+    # --- FILES ---
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _manifest(self):
+        try:
+            with open(self._path("snapshots.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {"snapshots": []}
+        manifest.setdefault("dictionary", "dictionary.bin")  # stores written before dictionaries were renamed
+        return manifest
+
+    def snapshots(self):
+        return self._manifest()["snapshots"]
+
+    def _save_manifest(self, manifest):
+        _write_atomic(self._path("snapshots.json"), json.dumps(manifest, indent=1).encode("utf-8"))
+        # Only now are the files the previous manifest used safe to delete
+        listed = {manifest["dictionary"]} | {s["file"] for s in manifest["snapshots"]}
+        for name in os.listdir(self.directory):
+            if (name.endswith(".snap") or name.startswith("dictionary")) and name not in listed:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+
+    def _read_dictionary(self, manifest):
+        snapshots = manifest["snapshots"]
+        if not snapshots:
+            return np.empty(0, dtype="<u8")
+        return np.fromfile(self._path(manifest["dictionary"]), dtype="<u8", count=snapshots[-1]["entries"])
+
+    def dictionary(self):
+        # Cached until a snapshot is added or replaced
+        manifest = self._manifest()
+        snapshots = manifest["snapshots"]
+        key = (manifest["dictionary"], snapshots[-1]["file"], snapshots[-1]["entries"]) if snapshots else None
+        if self._dictionary is None or self._dictionary_key != key:
+            hashes = self._read_dictionary(manifest)
+            order = np.argsort(hashes, kind="stable")
+            self._dictionary, self._dictionary_key = hashes, key
+            self._sorted = (hashes[order], order)
+        return self._dictionary
+
+    def _ids(self, hashes):
+        # Dictionary IDs for an array of hashes, -1 where the domain is unknown
+        self.dictionary()
+        sorted_hashes, order = self._sorted
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(sorted_hashes):
+            return np.full(len(hashes), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_hashes, hashes), len(sorted_hashes) - 1)
+        return np.where(sorted_hashes[pos] == hashes, order[pos], -1)
+
+    def columns(self, snapshots=None):
+        # Decoded rank columns, oldest first
+        previous = np.zeros(0, dtype=np.int64)
+        for snapshot in snapshots if snapshots is not None else self.snapshots():
+            with open(self._path(snapshot["file"]), "rb") as f:
+                previous = _decode_column(f.read(), previous)
+            yield previous
+
+    # --- ADDING ---
+    def has(self, list_id):
+        return any(s["list_id"] == str(list_id) for s in self.snapshots())
+
+    def add_index(self, list_id, index, day=None):
+        # From a TrancoIndex: its hashes are already unique
+        return self.add_snapshot(list_id, np.asarray(index.hashes), np.asarray(index.ranks), day)
+
+    def add_snapshot(self, list_id, hashes, ranks, day=None):
+        # Returns False if this list ID is already stored
+        day = (day or date.today()).isoformat()
+        with open(self._path(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self._manifest()
+            snapshots = list(manifest["snapshots"])
+            if any(s["list_id"] == str(list_id) for s in snapshots):
+                return False
+            if snapshots and day < snapshots[-1]["date"]:
+                raise ValueError(f"Tranco snapshots are added in date order (latest is {snapshots[-1]['date']})")
+            dictionary = self._read_dictionary(manifest)
+            if snapshots and day == snapshots[-1]["date"]:
+                snapshots.pop()
+
+            hashes = np.asarray(hashes, dtype="<u8")
+            dictionary = np.concatenate((dictionary, hashes[~np.isin(hashes, dictionary)]))
+            order = np.argsort(dictionary, kind="stable")
+            column = np.zeros(len(dictionary), dtype=np.int64)
+            column[order[np.searchsorted(dictionary[order], hashes)]] = ranks
+            previous = _last(self.columns(snapshots), np.zeros(0, dtype=np.int64))
+            name = _new_name(''.join(ch for ch in str(list_id) if ch.isalnum()) or 'list', ".snap")
+            _write_atomic(self._path(name), _encode_column(column, previous))
+            snapshots.append({"list_id": str(list_id), "date": day, "rows": int(len(hashes)),
+                              "entries": int(len(dictionary)), "file": name})
+            snapshots, dictionary = self._fold_oldest(snapshots, dictionary)
+
+            dictionary_name = _new_name("dictionary", ".bin")
+            _write_atomic(self._path(dictionary_name), dictionary.tobytes())
+            self._save_manifest({"snapshots": snapshots, "dictionary": dictionary_name})
+            self._dictionary = None
+        return True
+
+    def _fold_oldest(self, snapshots, dictionary):
+        # Beyond max_snapshots the oldest go. The new oldest is rewritten (to
+        # a new file) against an all-zero column so the delta chain starts
+        # with it; once enough of the dictionary only lists domains of dropped
+        # snapshots, it is rebuilt from the kept ones and all of them are
+        # rewritten with the new IDs. Returns (snapshots, dictionary).
+        if len(snapshots) <= self.max_snapshots:
+            return snapshots, dictionary
+        drop = len(snapshots) - self.max_snapshots
+        keep = [dict(s) for s in snapshots[drop:]]
+        # Decoding the kept chain needs the dropped snapshots' columns first
+        used = np.zeros(len(dictionary), dtype=bool)
+        for i, column in enumerate(self.columns(snapshots)):
+            if i >= drop:
+                used[:len(column)] |= column > 0
+        columns = (column for i, column in enumerate(self.columns(snapshots)) if i >= drop)
+
+        if used.sum() > (1 - COMPACT_UNUSED) * len(dictionary):
+            keep[0]["file"] = _new_name(keep[0]["file"].split(".")[0], ".snap")
+            _write_atomic(self._path(keep[0]["file"]), _encode_column(next(columns), np.zeros(0, dtype=np.int64)))
+            return keep, dictionary
+
+        ids = np.flatnonzero(used)
+        previous = np.zeros(0, dtype=np.int64)
+        for snapshot, column in zip(keep, columns):
+            compacted = column[ids[ids < len(column)]]
+            snapshot["entries"] = int(len(compacted))
+            snapshot["file"] = _new_name(snapshot["file"].split(".")[0], ".snap")
+            _write_atomic(self._path(snapshot["file"]), _encode_column(compacted, previous))
+            previous = compacted
+        return keep, dictionary[ids]
+
+    # --- TRENDS ---
+    def rank_matrix(self, domains):
+        # (snapshots x domains) ranks, 0 where not listed. A host that isn't
+        # listed takes its registrable domain's rank, as in the rank index.
+        domains = list(domains)
+        parents = registrable_domains(domains)
+        host_ids = self._ids(np.fromiter((domain_hash(d) for d in domains), dtype=np.uint64, count=len(domains)))
+        parent_ids = self._ids(np.fromiter((domain_hash(p) if p else 0 for p in parents), dtype=np.uint64,
+                                           count=len(domains)))
+        snapshots = self.snapshots()
+        ranks = np.zeros((len(snapshots), len(domains)), dtype=np.int64)
+        for i, column in enumerate(self.columns(snapshots)):
+            exact = _gather(column, host_ids)
+            ranks[i] = np.where(exact > 0, exact, _gather(column, parent_ids))
+        return snapshots, ranks
+
+    def rank_trends(self, domains):
+        # DataFrame indexed like `domains`: rank change over each trend window
+        # (positive = moved up the list) and best rank in the last 30 days,
+        # all relative to the newest snapshot. Empty where unknown.
+        domains = list(domains)
+        trends = pd.DataFrame(index=range(len(domains)), columns=TREND_COLUMNS, dtype="Int64")
+        snapshots, ranks = self.rank_matrix(domains) if domains else (self.snapshots(), None)
+        if not snapshots or not domains:
+            return trends
+        days = np.array([date.fromisoformat(s["date"]) for s in snapshots])
+        latest = ranks[-1]
+        for days_back, name in zip(TREND_WINDOWS, TREND_COLUMNS):
+            earlier = np.flatnonzero(days <= days[-1] - timedelta(days=days_back))
+            if len(earlier):
+                before = ranks[earlier[-1]]
+                trends[name] = _nullable(before - latest, (before > 0) & (latest > 0))
+        window = ranks[days >= days[-1] - timedelta(days=BEST_RANK_WINDOW)]
+        best = np.where(window > 0, window, np.iinfo(np.int64).max).min(axis=0)
+        trends[TREND_COLUMNS[-1]] = _nullable(best, best != np.iinfo(np.int64).max)
+        return trends
+
+    def stats(self):
+        snapshots = self.snapshots()
+        size = sum(os.path.getsize(self._path(s["file"])) for s in snapshots)
+        if snapshots:
+            size += snapshots[-1]["entries"] * 8
+        return {"snapshots": len(snapshots), "bytes": size,
+                "first": snapshots[0]["date"] if snapshots else None,
+                "last": snapshots[-1]["date"] if snapshots else None}
+
+
+def with_rank_trends(df, history):
+    # The results table plus the trend columns, when there is history to show
+    if history is None or df.empty or "Domain" not in df.columns or not history.snapshots():
+        return df
+    trends = history.rank_trends(df["Domain"].tolist())
+    trends.index = df.index
+    return pd.concat([df.drop(columns=[c for c in TREND_COLUMNS if c in df.columns]), trends], axis=1)
@@ -0,0 +1,205 @@
+import csv
+import hashlib
+import os
+import struct
+import tempfile
+from array import array
+
+import numpy as np
+
+from domain_names import registrable_domain, registrable_domains
+
+# --- CONFIGURATION ---
+TRANCO_INDEX_DIR = "/tmp"
+INDEX_MAGIC = b"TRIX"
+INDEX_VERSION = 1
+HEADER = struct.Struct("<4sIQ")  # magic, version, entry count
+
+# --- FILE LAYOUT ---
+# [header][uint64 domain hashes, sorted][uint32 ranks, same order]
+# The file is memory-mapped read-only, so every Streamlit process shares the
+# same page-cache copy and opening it costs a few syscalls, not a CSV parse.
+
+
+def domain_hash(domain):
+    return int.from_bytes(hashlib.blake2b(domain.strip().lower().encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def index_path_for(list_id, index_dir=TRANCO_INDEX_DIR):
+    safe_id = "".join(ch for ch in str(list_id or "local") if ch.isalnum()) or "local"
+    return os.path.join(index_dir, f"tranco_index_{safe_id}.bin")
+
+
+# --- BUILDING ---
+class TrancoIndexBuilder:
+    # Accepts (rank, domain) rows one at a time so it can be fed from a CSV
+    # reader or straight from a download stream.
+    def __init__(self):
+        self._hashes = array("Q")
+        self._ranks = array("I")
+
+    def add(self, rank, domain):
+        self._hashes.append(domain_hash(domain))
+        self._ranks.append(rank)
+
+    def add_csv_row(self, row):
+        # Returns False for rows that aren't "<rank>,<domain>"
+        if len(row) < 2:
+            return False
+        try:
+            rank = int(row[0])
+        except ValueError:
+            return False
+        domain = row[1].strip()
+        if rank <= 0 or not domain:
+            return False
+        self.add(rank, domain)
+        return True
+
+    def __len__(self):
+        return len(self._ranks)
+
+    def write(self, path):
+        hashes = np.frombuffer(self._hashes, dtype=np.uint64)
+        ranks = np.frombuffer(self._ranks, dtype=np.uint32)
+        # Sort by hash, best rank first, then drop duplicate domains
+        order = np.lexsort((ranks, hashes))
+        hashes = hashes[order]
+        ranks = ranks[order]
+        if len(hashes):
+            keep = np.empty(len(hashes), dtype=bool)
+            keep[0] = True
+            np.not_equal(hashes[1:], hashes[:-1], out=keep[1:])
+            hashes = hashes[keep]
+            ranks = ranks[keep]
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tranco_index_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(hashes)))
+                f.write(hashes.astype("<u8").tobytes())
+                f.write(ranks.astype("<u4").tobytes())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return len(hashes)
+
+
+def build_tranco_index(csv_path, index_path):
+    builder = TrancoIndexBuilder()
+    with open(csv_path, newline="", encoding="utf-8", errors="replace") as f:
+        for row in csv.reader(f):
+            builder.add_csv_row(row)
+    return builder.write(index_path)
+
+
+def ensure_tranco_index(csv_path, list_id=None, index_dir=TRANCO_INDEX_DIR):
+    # Builds the index for this list ID only when it is missing or older than the CSV
+    index_path = index_path_for(list_id, index_dir)
+    if not os.path.exists(index_path) or (
+        os.path.exists(csv_path) and os.path.getmtime(index_path) < os.path.getmtime(csv_path)
+    ):
+        build_tranco_index(csv_path, index_path)
+    return index_path
+
+
+# --- QUERYING ---
+class TrancoIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{path} is not a Tranco index (version {INDEX_VERSION})")
+        self.count = count
+        if count:
+            self.hashes = np.memmap(path, dtype="<u8", mode="r", offset=HEADER.size, shape=(count,))
+            self.ranks = np.memmap(path, dtype="<u4", mode="r", offset=HEADER.size + 8 * count, shape=(count,))
+        else:
+            self.hashes = np.empty(0, dtype="<u8")
+            self.ranks = np.empty(0, dtype="<u4")
+
+    def rank(self, domain):
+        if not self.count:
+            return None
+        h = np.uint64(domain_hash(domain))
+        i = int(np.searchsorted(self.hashes, h))
+        if i < self.count and self.hashes[i] == h:
+            return int(self.ranks[i])
+        return None
+
+    def lookup_hashes(self, hashes):
+        # Vectorized: ranks for an array of domain hashes, 0 where not listed
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not self.count or not len(hashes):
+            return np.zeros(len(hashes), dtype=np.uint32)
+        pos = np.searchsorted(self.hashes, hashes)
+        pos = np.minimum(pos, self.count - 1)
+        found = self.hashes[pos] == hashes
+        return np.where(found, self.ranks[pos], 0).astype(np.uint32)
+
+    def lookup_many(self, domains):
+        return self.lookup_hashes(np.fromiter((domain_hash(d) for d in domains), dtype=np.uint64))
+
+    def view(self, threshold=None):
+        return TrancoRankView(self, threshold)
+
+    def __len__(self):
+        return self.count
+
+
+class TrancoRankView:
+    # Dict-like window over the index: only ranks <= threshold are "in" it, so
+    # changing the threshold never requires rebuilding anything. A host that
+    # isn't listed itself takes the rank of its registrable domain (eTLD+1),
+    # so "news.example.co.uk" is ranked like "example.co.uk".
+    def __init__(self, index, threshold=None):
+        self.index = index
+        self.threshold = threshold
+        self._size = None
+
+    def get(self, domain, default=None):
+        rank = self.index.rank(domain)
+        if rank is None:
+            parent = registrable_domain(domain.strip().lower())
+            if parent and parent != domain:
+                rank = self.index.rank(parent)
+        if rank is None or (self.threshold is not None and rank > self.threshold):
+            return default
+        return rank
+
+    def get_many(self, domains):
+        # get() for a whole list of normalized hosts: exact hosts and their
+        # registrable domains are hashed and looked up in one pass
+        if not len(domains):
+            return []
+        parents = registrable_domains(domains)
+        hashes = np.fromiter((domain_hash(d) for d in domains), dtype=np.uint64, count=len(domains))
+        parent_hashes = np.fromiter((domain_hash(p) if p else 0 for p in parents), dtype=np.uint64,
+                                    count=len(domains))
+        ranks = self.index.lookup_hashes(np.concatenate((hashes, parent_hashes)))
+        fallback = np.where(parent_hashes > 0, ranks[len(domains):], 0)
+        ranks = np.where(ranks[:len(domains)] > 0, ranks[:len(domains)], fallback)
+        if self.threshold is not None:
+            ranks = np.where(ranks <= self.threshold, ranks, 0)
+        return [int(rank) if rank else None for rank in ranks]
+
+    def __contains__(self, domain):
+        return self.get(domain) is not None
+
+    def __getitem__(self, domain):
+        rank = self.get(domain)
+        if rank is None:
+            raise KeyError(domain)
+        return rank
+
+    def __len__(self):
+        if self._size is None:
+            if self.threshold is None:
+                self._size = self.index.count
+            else:
+                self._size = int(np.count_nonzero(self.index.ranks <= self.threshold))
+        return self._size